@@ -0,0 +1,456 @@
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+
+import pymysql
+
+import database
+import views
+
+try:
+    import resource
+except ImportError:
+    # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+
+# 性能测试使用的样例文件目录及公司代码
+FIXTURES_DIR = 'fixtures'
+BENCHMARK_COM_CODE = '300001'
+# 性能基准的保存位置
+BASELINE_FILE = os.path.join('benchmarks', 'baseline.json')
+# 每项测试至少运行的轮数及秒数（不含预热的一轮）
+DEFAULT_MIN_ROUNDS = 3
+DEFAULT_MIN_SECONDS = 1.0
+# 与基准相比，吞吐量下降或峰值内存增加超过此比例时视为性能退化
+DEFAULT_TOLERANCE = 0.15
+# 模拟数据库的连接参数
+LOCAL_DATABASE_CONFIG = {'host': 'localhost', 'user': 'benchmark', 'passwd': '', 'db': 'benchmark'}
+
+# 各项测试使用的样例文件，格式为：{报表类型编号: 文件名}
+STATEMENT_FIXTURES_163 = {'1': '163_zcfzb_300001.csv', '2': '163_lrb_300001.csv', '3': '163_xjllb_300001.csv'}
+STATEMENT_FIXTURES_SINA = {'1': 'SINA_BalanceSheet_300001.xls', '2': 'SINA_ProfitStatement_300001.xls', '3': 'SINA_CashFlow_300001.xls'}
+ENTERPRISE_FIXTURE_163 = '163_gszl_300001.html'
+CORPORATION_FIXTURE_SINA = 'SINA_CorpInfo_300001.html'
+ISSUE_FIXTURE_SINA = 'SINA_NewStock_300001.html'
+
+_LOAD_DATA_PATH = re.compile(r"LOAD DATA LOCAL INFILE '([^']+)'")
+
+
+class LocalConnection:
+    """ 模拟的数据库连接，接口与 pymysql.connect() 返回的连接相同
+
+    不连接数据库服务器，只在客户端完成写入语句的参数转义、导入文件的读取等工作，并统计写入的记录数，
+    用于在没有 MySQL 的环境中测试写入器本身的性能；subject_dictionary 表保存在内存中
+
+    参数
+    ----------
+    db: str
+        数据库名，用作项目字典缓存的键
+    """
+
+    def __init__(self, db='benchmark', **kwargs):
+        self.db = db
+        self.subject_ids = {}
+        self.written_rows = 0
+        self.written_bytes = 0
+        self.commits = 0
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalCursor:
+    """ LocalConnection 的游标 """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._result = []
+
+    def execute(self, sql, args=None):
+        """ 执行单条语句：读取项目字典、LOAD DATA LOCAL INFILE 导入或多行 INSERT 语句 """
+
+        if sql.startswith("SELECT 项目编号, 报表类型, 项目名称 FROM subject_dictionary"):
+            self._result = [(subject_id, statement_type, subject_name)
+                            for (statement_type, subject_name), subject_id in self.connection.subject_ids.items()]
+            return len(self._result)
+        if sql.startswith("SELECT"):
+            # 其他查询（如已保存的数据指纹）返回空结果，每轮都按新数据写入
+            self._result = []
+            return 0
+
+        load_data = _LOAD_DATA_PATH.match(sql)
+        if load_data:
+            # 与客户端相同，读取并发送整个文件
+            with open(load_data.group(1), 'rb') as data_file:
+                content = data_file.read()
+            rows = content.count(b'\n')
+        else:
+            content = (sql % tuple(pymysql.converters.escape_item(arg, 'utf8mb4') for arg in args)) if args else sql
+            content = content.encode('utf-8')
+            rows = 1 if args else sql.count('),(') + 1
+        self.connection.written_rows += rows
+        self.connection.written_bytes += len(content)
+
+        return rows
+
+    def executemany(self, sql, rows):
+        """ 执行写入语句：新增项目字典中的项目，或逐条转义写入的数据 """
+
+        if sql.startswith("INSERT IGNORE INTO subject_dictionary"):
+            for key in rows:
+                self.connection.subject_ids.setdefault(tuple(key), len(self.connection.subject_ids) + 1)
+            return len(rows)
+
+        for row in rows:
+            self.execute(sql, row)
+
+        return len(rows)
+
+    def fetchall(self):
+        return self._result
+
+
+def _read_fixture(file_name):
+    """ 读取样例文件的原始内容 """
+
+    with open(os.path.join(FIXTURES_DIR, file_name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+
+def _parse_SINA_statements():
+    """ 解析新浪财经的 3 张财务报表样例，作为写入测试的数据 """
+
+    return [views.get_financial_data_from_SINA(BENCHMARK_COM_CODE, code, _read_fixture(file_name))
+            for code, file_name in STATEMENT_FIXTURES_SINA.items()]
+
+
+def bench_163_statements():
+    """ views.get_financial_statement()：163 股票网站的 CSV 财务报表 """
+
+    pages = [(code, _read_fixture(file_name)) for code, file_name in STATEMENT_FIXTURES_163.items()]
+
+    def run():
+        rows = 0
+        for code, content in pages:
+            rows += sum(len(table[1]) for table in views.get_financial_statement(code, BENCHMARK_COM_CODE, content))
+        return len(pages), rows
+
+    return run
+
+
+def bench_SINA_statements():
+    """ views.get_financial_data_from_SINA()：新浪财经以制表符分隔的 xls 财务报表 """
+
+    pages = [(code, _read_fixture(file_name)) for code, file_name in STATEMENT_FIXTURES_SINA.items()]
+
+    def run():
+        rows = 0
+        for code, content in pages:
+            rows += len(views.get_financial_data_from_SINA(BENCHMARK_COM_CODE, code, content)[1])
+        return len(pages), rows
+
+    return run
+
+
+def bench_163_enterprise():
+    """ views.get_enterprise_information()：163 股票网站的公司资料网页 """
+
+    content = _read_fixture(ENTERPRISE_FIXTURE_163)
+
+    def run():
+        tables = views.get_enterprise_information('4', BENCHMARK_COM_CODE, content)
+        return 1, sum(len(table[1]) for table in tables)
+
+    return run
+
+
+def bench_SINA_corporation():
+    """ views.get_corporation_information_from_SINA()：新浪财经的公司资料网页 """
+
+    content = _read_fixture(CORPORATION_FIXTURE_SINA)
+
+    def run():
+        return 1, len(views.get_corporation_information_from_SINA(BENCHMARK_COM_CODE, '4', content)[1])
+
+    return run
+
+
+def bench_SINA_issue():
+    """ views.get_issue_information_from_SINA()：新浪财经的发行情况网页 """
+
+    content = _read_fixture(ISSUE_FIXTURE_SINA)
+
+    def run():
+        return 1, len(views.get_issue_information_from_SINA(BENCHMARK_COM_CODE, '5', content)[1])
+
+    return run
+
+
+def bench_database_writer():
+    """ views.sava_data_to_database()：长连接的数据库写入器，写入模拟的数据库 """
+
+    tables = _parse_SINA_statements()
+    writer = database.DatabaseWriter(LOCAL_DATABASE_CONFIG, connect=LocalConnection)
+
+    def run():
+        for table in tables:
+            views.sava_data_to_database(table, writer)
+        writer.flush()
+        return 0, sum(len(table[1]) for table in tables)
+
+    return run
+
+
+def bench_sqlite_writer():
+    """ views.sava_data_to_database()：SQLite 存储后端，写入临时目录中的数据库文件
+
+    预热的一轮写入全部数据，此后各轮的数据指纹未变化，测得的是比较指纹后跳过写入的速度（每日全量更新的常见情况）
+    """
+
+    # 延迟导入：只在运行本项测试的子进程中注册 sqlite3 的日期转换函数
+    import sqlite_storage
+
+    tables = _parse_SINA_statements()
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    writer = sqlite_storage.SQLiteStorage({'backend': 'sqlite', 'path': path, 'db': 'benchmark'})
+
+    def run():
+        for table in tables:
+            views.sava_data_to_database(table, writer)
+        writer.flush()
+        return 0, sum(len(table[1]) for table in tables)
+
+    return run
+
+
+def _bench_bulk_loader(use_local_infile):
+    """ database.BulkLoader：批量导入模拟的数据库 """
+
+    tables = _parse_SINA_statements()
+    loader = database.BulkLoader(LOCAL_DATABASE_CONFIG, use_local_infile=use_local_infile, connect=LocalConnection)
+
+    def run():
+        for table in tables:
+            loader.add(table)
+        loader.flush()
+        return 0, sum(len(table[1]) for table in tables)
+
+    return run
+
+
+def bench_bulk_loader_infile():
+    """ database.BulkLoader：LOAD DATA LOCAL INFILE 导入 """
+    return _bench_bulk_loader(True)
+
+
+def bench_bulk_loader_insert():
+    """ database.BulkLoader：多行 INSERT 语句导入 """
+    return _bench_bulk_loader(False)
+
+
+# 性能测试目录，格式为：{测试名称: 准备函数}，准备函数返回每轮运行的函数，该函数返回本轮处理的 (网页数, 记录数)
+BENCHMARKS = {
+    '163_statements': bench_163_statements,
+    'SINA_statements': bench_SINA_statements,
+    '163_enterprise': bench_163_enterprise,
+    'SINA_corporation': bench_SINA_corporation,
+    'SINA_issue': bench_SINA_issue,
+    'database_writer': bench_database_writer,
+    'sqlite_writer': bench_sqlite_writer,
+    'bulk_loader_infile': bench_bulk_loader_infile,
+    'bulk_loader_insert': bench_bulk_loader_insert,
+}
+
+
+def _peak_rss_mb():
+    """ 返回本进程的峰值内存（MB），不支持的系统返回 None """
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位为字节，Linux 为 KB
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _run_benchmark(name, min_rounds, min_seconds):
+    """ 在当前进程中运行单项测试，返回测试结果 """
+
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        run = BENCHMARKS[name]()
+        # 预热一轮，不计入结果
+        run()
+        rounds = pages = rows = 0
+        started_at = time.perf_counter()
+        while rounds < min_rounds or time.perf_counter() - started_at < min_seconds:
+            round_pages, round_rows = run()
+            pages += round_pages
+            rows += round_rows
+            rounds += 1
+        seconds = time.perf_counter() - started_at
+
+    return {
+        'rounds': rounds,
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(pages / seconds, 2) if pages else None,
+        'rows_per_second': round(rows / seconds, 1) if rows else None,
+        'peak_rss_mb': round(_peak_rss_mb(), 1) if resource is not None else None,
+    }
+
+
+def run_benchmarks(names=None, min_rounds=DEFAULT_MIN_ROUNDS, min_seconds=DEFAULT_MIN_SECONDS):
+    """ 运行性能测试，每项测试在单独的子进程中运行，峰值内存互不影响
+
+    参数
+    ----------
+    names: list
+        需要运行的测试名称，为 None 时运行 BENCHMARKS 中的全部测试
+    min_rounds: int
+        每项测试至少运行的轮数
+    min_seconds: float
+        每项测试至少运行的秒数
+
+    返回值
+    -------
+    results: dict
+        格式为：{测试名称: {'rounds', 'seconds', 'pages_per_second', 'rows_per_second', 'peak_rss_mb'}}，
+        运行出错的测试为 {'error': 错误信息}
+    """
+
+    results = {}
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise KeyError("不存在的性能测试：" + name)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                results[name] = executor.submit(_run_benchmark, name, min_rounds, min_seconds).result()
+            except Exception as error:
+                results[name] = {'error': repr(error)}
+
+    return results
+
+
+def save_baseline(results, path=BASELINE_FILE):
+    """ 将测试结果连同运行环境保存为性能基准 """
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    baseline = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(path + '.tmp', 'w', encoding='utf-8') as baseline_file:
+        json.dump(baseline, baseline_file, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def load_baseline(path=BASELINE_FILE):
+    """ 读取性能基准，不存在时返回 None """
+
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def compare_results(results, baseline_results, tolerance=DEFAULT_TOLERANCE):
+    """ 将测试结果与基准比较，找出性能退化的测试
+
+    参数
+    ----------
+    results: dict
+        run_benchmarks() 返回的测试结果
+    baseline_results: dict
+        性能基准中的测试结果
+    tolerance: float
+        允许的波动比例：吞吐量低于基准的 (1 - tolerance) 倍，或峰值内存高于基准的 (1 + tolerance) 倍时视为退化
+
+    返回值
+    -------
+    regressions: list
+        性能退化的说明，无退化时为空列表
+    """
+
+    regressions = []
+    for name, result in results.items():
+        baseline = baseline_results.get(name)
+        if baseline is None or 'error' in baseline:
+            continue
+        if 'error' in result:
+            regressions.append(f"{ name }：运行出错 { result['error'] }")
+            continue
+        for metric in ('rows_per_second', 'pages_per_second'):
+            if result[metric] is not None and baseline[metric] is not None and result[metric] < baseline[metric] * (1 - tolerance):
+                regressions.append(f"{ name }：{ metric } 由 { baseline[metric] } 降至 { result[metric] }（{result[metric] / baseline[metric] - 1:+.1%}）")
+        if result['peak_rss_mb'] is not None and baseline['peak_rss_mb'] is not None \
+                and result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{ name }：peak_rss_mb 由 { baseline['peak_rss_mb'] } 增至 { result['peak_rss_mb'] }")
+
+    return regressions
+
+
+def print_results(results, baseline_results=None):
+    """ 逐项打印测试结果，有基准时同时打印与基准相比的变化 """
+
+    def change(name, metric):
+        if not baseline_results or 'error' in baseline_results.get(name, {'error': None}):
+            return ''
+        old, new = baseline_results[name][metric], results[name][metric]
+        return f" ({new / old - 1:+.1%})" if old and new else ''
+
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"{ name:<20} 运行出错：{ result['error'] }")
+            continue
+        pages = f"{result['pages_per_second']:>10.1f} 页/秒{ change(name, 'pages_per_second') }" if result['pages_per_second'] else ''
+        rows = f"{result['rows_per_second']:>12.0f} 条/秒{ change(name, 'rows_per_second') }" if result['rows_per_second'] else ''
+        memory = f"峰值内存 {result['peak_rss_mb']:.1f} MB" if result['peak_rss_mb'] is not None else ''
+        print(f"{ name:<20} { rows } { pages } { memory }")
+
+
+def main(argv=None):
+    """ 运行性能测试并与基准比较，有性能退化时返回 1 """
+
+    parser = argparse.ArgumentParser(description="解析及写入的离线性能测试")
+    parser.add_argument('names', nargs='*', help="需要运行的测试名称，默认运行全部测试：" + ', '.join(BENCHMARKS))
+    parser.add_argument('--save', action='store_true', help="将本次结果保存为性能基准")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="性能基准文件")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="允许的波动比例")
+    parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS, help="每项测试至少运行的秒数")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names or None, min_seconds=args.min_seconds)
+    baseline = load_baseline(args.baseline)
+    baseline_results = baseline['results'] if baseline else None
+    print_results(results, baseline_results)
+
+    regressions = compare_results(results, baseline_results, args.tolerance) if baseline_results else []
+    for regression in regressions:
+        print("性能退化：" + regression)
+    if args.save:
+        # 只运行部分测试时，其余测试的基准保持不变
+        save_baseline({**(baseline_results or {}), **results}, args.baseline)
+        print("性能基准已保存至 " + args.baseline)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
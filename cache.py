@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urldefrag
+
+
+# 缓存目录：urls 目录保存 URL 与内容摘要的对应关系，objects 目录按内容摘要保存压缩后的原始内容
+CACHE_DIR = 'cache'
+# 缓存内容的有效期（秒），超过有效期的内容在在线下载时重新下载
+DEFAULT_TTL = 24 * 60 * 60
+# 缓存内容的总大小上限（字节），超过上限时按最近最少使用的顺序删除
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+
+_lock = threading.Lock()
+# 缓存内容的当前总大小，首次使用时统计
+_cache_bytes = None
+
+
+def _url_path(url):
+    """ 返回 URL 记录的保存路径，URL 中的 '#...' 部分不影响下载内容，因此不参与计算 """
+    key = hashlib.sha256(urldefrag(url)[0].encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, 'urls', key[:2], key + '.json')
+
+
+def _object_path(digest):
+    """ 返回内容摘要对应的压缩内容的保存路径 """
+    return os.path.join(CACHE_DIR, 'objects', digest[:2], digest + '.gz')
+
+
+def get(url, ttl=DEFAULT_TTL):
+    """ 读取 URL 的缓存内容
+
+    参数
+    ----------
+    url: str
+        下载地址
+    ttl: int
+        缓存内容的有效期（秒），为 None 时不检查有效期（离线重放）
+
+    返回值
+    -------
+    page_content: bytes
+        缓存的原始内容，无缓存或缓存已过期时返回 None
+    """
+
+    try:
+        with open(_url_path(url), 'r', encoding='utf-8') as record_file:
+            record = json.load(record_file)
+        if ttl is not None and time.time() - record['fetched_at'] > ttl:
+            return None
+        object_path = _object_path(record['digest'])
+        with gzip.open(object_path, 'rb') as object_file:
+            page_content = object_file.read()
+        # 更新访问时间，用于按最近最少使用的顺序删除缓存
+        os.utime(object_path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return page_content
+
+
+def put(url, page_content):
+    """ 保存 URL 的原始内容，相同的内容只保存一份
+
+    参数
+    ----------
+    url: str
+        下载地址
+    page_content: bytes
+        下载得到的原始内容
+    """
+
+    global _cache_bytes
+
+    digest = hashlib.sha256(page_content).hexdigest()
+    object_path = _object_path(digest)
+    added_bytes = 0
+    if not os.path.exists(object_path):
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # 先写入临时文件再改名，避免中断时留下不完整的文件
+        temp_path = object_path + '.' + str(threading.get_ident()) + '.tmp'
+        with gzip.open(temp_path, 'wb') as object_file:
+            object_file.write(page_content)
+        os.replace(temp_path, object_path)
+        added_bytes = os.path.getsize(object_path)
+
+    url_path = _url_path(url)
+    os.makedirs(os.path.dirname(url_path), exist_ok=True)
+    temp_path = url_path + '.' + str(threading.get_ident()) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as record_file:
+        json.dump({'url': url, 'digest': digest, 'fetched_at': time.time()}, record_file)
+    os.replace(temp_path, url_path)
+
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = _total_bytes()
+        else:
+            _cache_bytes += added_bytes
+        if _cache_bytes > MAX_CACHE_BYTES:
+            _cache_bytes = _evict(MAX_CACHE_BYTES)
+
+
+def _list_objects():
+    """ 返回全部缓存内容的 [访问时间, 大小, 路径] """
+    objects = []
+    for root, _, files in os.walk(os.path.join(CACHE_DIR, 'objects')):
+        for name in files:
+            if name.endswith('.gz'):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                objects.append([stat.st_mtime, stat.st_size, path])
+    return objects
+
+
+def _total_bytes():
+    """ 统计缓存内容的总大小 """
+    return sum(size for _, size, _ in _list_objects())
+
+
+def _evict(max_bytes):
+    """ 按最近最少使用的顺序删除缓存内容，直至总大小不超过 max_bytes 的 90%，返回删除后的总大小
+
+    URL 记录指向已删除的内容时，get() 视为无缓存
+    """
+
+    objects = sorted(_list_objects())
+    total_bytes = sum(size for _, size, _ in objects)
+    for _, size, path in objects:
+        if total_bytes <= max_bytes * 0.9:
+            break
+        os.remove(path)
+        total_bytes -= size
+
+    return total_bytes
+
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    """ 删除超出大小上限的缓存内容
+
+    参数
+    ----------
+    max_bytes: int
+        缓存内容的总大小上限（字节）
+    """
+
+    global _cache_bytes
+
+    with _lock:
+        _cache_bytes = _evict(max_bytes)
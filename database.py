@@ -0,0 +1,759 @@
+import atexit
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import pandas
+import pymysql
+import pymysql.cursors
+
+import fixed_point
+import metrics
+import storage
+import subjects
+
+
+# 数据库连接参数：pro - 正式数据库（新浪财经数据）；163 - 163 股票网站数据；local - 本地 SQLite 数据库（无需数据库服务器）
+# 'backend' 为 'sqlite' 时使用 sqlite_storage.SQLiteStorage 存储后端，'path' 为数据库文件路径，未指定时为 MySQL
+DATABASE_CONFIGS = {
+    'pro': {
+        'host': '127.0.0.1',
+        'port': 3306,
+        'user': 'root',
+        'passwd': '330715',
+        'db': 'FALC_pro',
+    },
+    '163': {
+        'host': '88.88.4.123',
+        'port': 3306,
+        'user': 'root',
+        'passwd': '330715',
+        'db': 'financial_analysis_for_listed_companies',
+    },
+    'local': {
+        'backend': 'sqlite',
+        'path': 'FALC_local.sqlite3',
+        'db': 'FALC_local',
+    },
+}
+# 新浪财经数据默认保存至的数据库
+DEFAULT_DATABASE = 'pro'
+# 每个连接累计执行多少条写入语句后提交一次事务
+DEFAULT_COMMIT_INTERVAL = 100
+# 距上次提交超过多少秒后，下一次写入时提交事务
+DEFAULT_COMMIT_SECONDS = 10.0
+# 连接断开时的重连次数及重连间隔（秒）
+MAX_RECONNECT_ATTEMPTS = 3
+RECONNECT_DELAY = 2.0
+# 表示连接已断开或无法连接的 MySQL 错误代码
+RECONNECT_ERRORS = (2003, 2006, 2013)
+# 批量导入 financial_data 时每批的记录数
+DEFAULT_BULK_BATCH_SIZE = 50000
+# 批量导入时单条多行 INSERT 语句的最大字节数（应小于服务器的 max_allowed_packet）
+DEFAULT_MAX_INSERT_BYTES = 4 * 1024 * 1024
+# 表示服务器或客户端不允许 LOAD DATA LOCAL INFILE 的 MySQL 错误代码
+LOCAL_INFILE_ERRORS = (1148, 2068, 3948)
+# 存入 financial_data 表的数据库表类型
+FINANCIAL_TABLE_TYPES = ('BS', 'PL', 'PS', 'CF')
+# financial_data 表的字段及主键，主键重复时更新值，使重复写入不产生重复记录
+FINANCIAL_DATA_FIELDS = ['公司代码', '报告日期', '项目编号', '值']
+FINANCIAL_DATA_KEY = ['公司代码', '报告日期', '项目编号']
+FINANCIAL_DATA_UPSERT = "ON DUPLICATE KEY UPDATE 值 = VALUES(值)"
+
+
+def _is_idempotent(sql):
+    """ 写入语句重复执行时结果是否不变：按主键更新的 INSERT ... ON DUPLICATE KEY UPDATE 及 DELETE """
+    return sql.startswith('DELETE ') or ' ON DUPLICATE KEY UPDATE ' in sql
+
+
+class _PooledConnection:
+    """ 连接池中的单个连接，记录本事务中尚未提交的写入语句，用于断线重连后重新执行 """
+
+    def __init__(self, config, connect=pymysql.connect):
+        self.config = config
+        self.connect_function = connect
+        self.connection = None
+        self.pending = []
+        self.last_commit = time.monotonic()
+
+    def connect(self):
+        """ 建立连接，并重新执行本事务中尚未提交的写入语句 """
+        self.connection = self.connect_function(charset='utf8mb4', **self.config)
+        cursor = self.connection.cursor()
+        for sql, rows in self.pending:
+            cursor.executemany(sql, rows)
+
+    def reset(self):
+        """ 丢弃已断开的连接 """
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+
+def _with_reconnect(pooled, operation):
+    """ 在 pooled 连接上执行 operation(connection)，连接断开时重连并重试 """
+
+    for attempt in range(MAX_RECONNECT_ATTEMPTS + 1):
+        try:
+            if pooled.connection is None:
+                pooled.connect()
+            return operation(pooled.connection)
+        except pymysql.err.OperationalError as error:
+            if error.args[0] not in RECONNECT_ERRORS or attempt == MAX_RECONNECT_ATTEMPTS:
+                raise
+            print("数据库连接已断开，正在重新连接...")
+            metrics.count('retries_total', stage='write', source=pooled.config['db'])
+            pooled.reset()
+            time.sleep(RECONNECT_DELAY)
+
+
+def _format_cents_columns(rows, positions):
+    """ 将记录中 positions 位置的以分为单位的定点数转为 decimal 字段的文字写法，'--' 等文字原样保留，原记录不变 """
+
+    columns = []
+    for position in positions:
+        column = [row[position] for row in rows]
+        if any(isinstance(value, str) for value in column):
+            columns.append([fixed_point.format_cents(value) for value in column])
+        else:
+            columns.append(fixed_point.format_cents_array(column))
+    formatted_rows = []
+    for index, row in enumerate(rows):
+        row = list(row)
+        for position, column in zip(positions, columns):
+            row[position] = column[index]
+        formatted_rows.append(row)
+
+    return formatted_rows
+
+
+class DatabaseWriter(storage.StorageBackend):
+    """ 长连接的数据库写入器（MySQL 存储后端）
+
+    保持 pool_size 个数据库连接供多个线程共用，每个连接上的写入语句合并在同一事务中，
+    每执行 commit_interval 条语句或距上次提交超过 commit_seconds 秒时提交一次，
+    连接断开时自动重连并重新执行本事务中尚未提交的语句（提交时断开的，只重新执行可重复执行的语句），close() 时提交全部未提交的数据。
+    读取数据的方法使用单独的连接，读不到未提交的数据，因此读取前先提交（没有未提交的数据时不执行语句）
+
+    参数
+    ----------
+    config: dict
+        pymysql.connect() 的连接参数
+    pool_size: int
+        连接池的连接数量
+    commit_interval: int
+        每个连接累计执行多少条写入语句后提交一次事务
+    commit_seconds: float
+        距上次提交超过多少秒后，下一次写入时提交事务
+    connect: function
+        建立数据库连接的函数，参数与 pymysql.connect() 相同，性能测试时可替换为本地的模拟连接
+    """
+
+    def __init__(self, config=DATABASE_CONFIGS['pro'], pool_size=1,
+                 commit_interval=DEFAULT_COMMIT_INTERVAL, commit_seconds=DEFAULT_COMMIT_SECONDS, connect=pymysql.connect):
+        self.config = config
+        self.commit_interval = commit_interval
+        self.commit_seconds = commit_seconds
+        self._connections = [_PooledConnection(config, connect) for _ in range(pool_size)]
+        self._idle = queue.Queue()
+        for pooled in self._connections:
+            self._idle.put(pooled)
+        # 项目字典使用单独的连接，新增项目即时提交，不影响写入事务的合并
+        self._dictionary = _PooledConnection(config, connect)
+        self._dictionary_lock = threading.Lock()
+        self._connect = connect
+        self._reader = None
+        self.closed = False
+
+    def _commit(self, pooled):
+        """ 提交 pooled 连接上的事务
+
+        发出 COMMIT 后连接断开时，无法确定事务是否已提交：本事务的语句均可重复执行时重连并重新执行、提交，
+        否则（如没有主键的 INSERT，重复执行会产生重复记录）不再重新执行，抛出原异常
+        """
+
+        if pooled.pending:
+            idempotent = all(_is_idempotent(sql) for sql, _ in pooled.pending)
+
+            def commit(connection):
+                try:
+                    connection.commit()
+                except pymysql.err.OperationalError as error:
+                    if idempotent or error.args[0] not in RECONNECT_ERRORS:
+                        raise
+                    pooled.reset()
+                    pooled.pending = []
+                    raise RuntimeError("提交事务时数据库连接断开，无法确定数据是否已保存") from error
+
+            _with_reconnect(pooled, commit)
+            pooled.pending = []
+        pooled.last_commit = time.monotonic()
+
+    def executemany(self, sql, rows):
+        """ 执行写入语句，按提交间隔合并提交
+
+        参数
+        ----------
+        sql: str
+            写入语句
+        rows: list
+            写入的数据
+        """
+        self._execute_statements([(sql, rows)])
+
+    def _execute_statements(self, statements):
+        """ 在同一连接上依次执行 [(写入语句, 数据), ...]，全部执行后才检查是否提交，因此同在一个事务中 """
+
+        if self.closed:
+            raise RuntimeError("数据库写入器已关闭")
+
+        def execute(connection):
+            cursor = connection.cursor()
+            for sql, rows in statements:
+                cursor.executemany(sql, rows)
+
+        statements = [(sql, rows) for sql, rows in statements if rows]
+        pooled = self._idle.get()
+        try:
+            with metrics.stage('write', self.config['db'], rows=sum(len(rows) for _, rows in statements)):
+                _with_reconnect(pooled, execute)
+            pooled.pending += statements
+            if len(pooled.pending) >= self.commit_interval or time.monotonic() - pooled.last_commit >= self.commit_seconds:
+                self._commit(pooled)
+        finally:
+            self._idle.put(pooled)
+
+    def write_batch(self, writes, deletes=()):
+        """ 在同一事务中删除、写入记录，参数与 storage.StorageBackend.write_batch() 相同
+
+        以分为单位的定点数转为 decimal 字段的文字写法，由数据库按原值精确保存；主键重复时以 ON DUPLICATE KEY UPDATE 更新其余字段
+        """
+
+        statements = []
+        for table_name, key_fields, keys in deletes:
+            statements.append((f"DELETE FROM `{ table_name }` WHERE " + ' AND '.join(f"`{ field }` = %s" for field in key_fields), keys))
+        for table_name, fields, rows, key_fields, cents_fields in writes:
+            positions = [fields.index(field) for field in cents_fields]
+            if positions:
+                rows = _format_cents_columns(rows, positions)
+            sql = (f"INSERT INTO `{ table_name }`({ ', '.join('`' + field + '`' for field in fields) }) "
+                   f"VALUES ({ ', '.join(['%s'] * len(fields)) })")
+            if key_fields is not None:
+                sql += " ON DUPLICATE KEY UPDATE " + ', '.join(
+                    f"`{ field }` = VALUES(`{ field }`)" for field in fields if field not in key_fields)
+            statements.append((sql, rows))
+        self._execute_statements(statements)
+
+    def replace_subject_names(self, date_table, normalized=False):
+        """ 将财务数据记录中的项目名称替换为项目编号，参数及返回值与 subjects.replace_subject_names() 相同 """
+
+        with self._dictionary_lock:
+            return _with_reconnect(self._dictionary,
+                                   lambda connection: subjects.replace_subject_names(connection.cursor(), date_table, normalized))
+
+    def _get_reader(self):
+        """ 返回本写入器使用的读取器（单独的连接），首次调用时创建 """
+        with self._dictionary_lock:
+            if self._reader is None:
+                self._reader = DatabaseReader(self.config, self._connect)
+        return self._reader
+
+    def load_statements(self, com_code, start_date=None, end_date=None):
+        """ 读取单个公司的财务数据，参数及返回值与 DatabaseReader.load_statements() 相同 """
+        self.flush()
+        return self._get_reader().load_statements(com_code, start_date, end_date)
+
+    def load_subject(self, subject, report_date):
+        """ 读取全部公司某一项目、某一报告期的数据，参数及返回值与 DatabaseReader.load_subject() 相同 """
+        self.flush()
+        return self._get_reader().load_subject(subject, report_date)
+
+    def load_fingerprints(self, com_code, statement_type):
+        """ 读取单个公司某一报表各报告期的数据指纹，参数及返回值与 DatabaseReader.load_fingerprints() 相同 """
+        self.flush()
+        return self._get_reader().load_fingerprints(com_code, statement_type)
+
+    def load_subject_dictionary(self):
+        """ 读取项目字典，返回值与 DatabaseReader.load_subject_dictionary() 相同 """
+        return self._get_reader().load_subject_dictionary()
+
+    def iter_financial_data(self, updated_since=None, chunk_size=100000):
+        """ 分批读取财务数据，参数及返回值与 DatabaseReader.iter_financial_data() 相同 """
+        self.flush()
+        return self._get_reader().iter_financial_data(updated_since, chunk_size)
+
+    def flush(self):
+        """ 提交全部连接上尚未提交的数据 """
+
+        for _ in self._connections:
+            pooled = self._idle.get()
+            try:
+                self._commit(pooled)
+            finally:
+                self._idle.put(pooled)
+
+    def close(self):
+        """ 提交尚未提交的数据，并关闭全部连接 """
+
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        for pooled in self._connections + [self._dictionary]:
+            if pooled.connection is not None:
+                pooled.connection.close()
+                pooled.connection = None
+        if self._reader is not None:
+            self._reader.close()
+
+
+class BulkLoader:
+    """ financial_data 表的批量导入器（只适用于 MySQL 数据库）
+
+    将财务数据记录暂存为本地 TSV 文件，每 batch_size 条记录用 LOAD DATA LOCAL INFILE 导入一次，
+    服务器不允许 LOAD DATA LOCAL INFILE 时，改用不超过 max_insert_bytes 字节的多行 INSERT 语句导入，
+    close() 时导入剩余数据，并报告导入速度（条/秒）
+
+    参数
+    ----------
+    config: dict
+        pymysql.connect() 的连接参数
+    batch_size: int
+        每批导入的记录数
+    use_local_infile: bool
+        是否使用 LOAD DATA LOCAL INFILE 导入
+    max_insert_bytes: int
+        多行 INSERT 语句的最大字节数
+    connect: function
+        建立数据库连接的函数，参数与 pymysql.connect() 相同，性能测试时可替换为本地的模拟连接
+    """
+
+    def __init__(self, config=DATABASE_CONFIGS['pro'], batch_size=DEFAULT_BULK_BATCH_SIZE,
+                 use_local_infile=True, max_insert_bytes=DEFAULT_MAX_INSERT_BYTES, connect=pymysql.connect):
+        self.batch_size = batch_size
+        self.use_local_infile = use_local_infile
+        self.max_insert_bytes = max_insert_bytes
+        self.database_name = config['db']
+        self.connection = connect(charset='utf8mb4', local_infile=use_local_infile, **config)
+        self.rows = []
+        self.loaded_rows = 0
+        self.load_seconds = 0.0
+
+    def add(self, date_table):
+        """ 暂存解析完毕的财务数据，累计达到 batch_size 条时导入
+
+        参数
+        ----------
+        date_table: list
+            [数据库表类型, [[公司代码, 报告日期, 项目名称, 值（分）], ...]]
+        """
+
+        if date_table[0] not in FINANCIAL_TABLE_TYPES:
+            raise ValueError("不支持批量导入的数据类型：" + date_table[0])
+        self.rows += subjects.replace_subject_names(self.connection.cursor(), date_table)[1]
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """ 导入已暂存的全部数据 """
+
+        if not self.rows:
+            return
+        started_at = time.perf_counter()
+        if self.use_local_infile:
+            try:
+                self._load_infile(self.rows)
+            except pymysql.err.MySQLError as error:
+                if error.args[0] not in LOCAL_INFILE_ERRORS:
+                    raise
+                print("服务器不允许 LOAD DATA LOCAL INFILE，改用多行 INSERT 语句导入")
+                self.connection.rollback()
+                self.use_local_infile = False
+        if not self.use_local_infile:
+            self._load_insert(self.rows)
+        self.connection.commit()
+        seconds = time.perf_counter() - started_at
+        metrics.record('write', self.database_name, seconds, rows=len(self.rows),
+                       method='load_data' if self.use_local_infile else 'insert')
+        self.load_seconds += seconds
+        self.loaded_rows += len(self.rows)
+        self.rows = []
+
+    def _load_infile(self, rows):
+        """ 将数据写入临时 TSV 文件，并用 LOAD DATA LOCAL INFILE 导入 """
+
+        staging_file = tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.tsv', newline='\n', delete=False)
+        try:
+            with staging_file:
+                for (com_code, report_date, subject_id, _), value in zip(rows, fixed_point.format_cents_array([row[3] for row in rows])):
+                    staging_file.write(f"{ com_code }\t{ report_date }\t{ subject_id }\t{ value }\n")
+            path = staging_file.name.replace('\\', '/')
+            # REPLACE：与已有记录的唯一键（公司代码, 报告日期, 项目编号）重复时以新记录代替
+            self.connection.cursor().execute(
+                f"LOAD DATA LOCAL INFILE '{ path }' REPLACE INTO TABLE financial_data CHARACTER SET utf8mb4 "
+                r"FIELDS TERMINATED BY '\t' LINES TERMINATED BY '\n' (公司代码, 报告日期, 项目编号, 值)")
+        finally:
+            os.remove(staging_file.name)
+
+    def _load_insert(self, rows):
+        """ 用不超过 max_insert_bytes 字节的多行 INSERT 语句导入数据 """
+
+        cursor = self.connection.cursor()
+        prefix = "INSERT INTO financial_data(公司代码, 报告日期, 项目编号, 值) VALUES "
+        suffix = " " + FINANCIAL_DATA_UPSERT
+        fixed_size = len(prefix.encode()) + len(suffix.encode())
+        values = []
+        size = fixed_size
+        for (com_code, report_date, subject_id, _), value in zip(rows, fixed_point.format_cents_array([row[3] for row in rows])):
+            row = f"('{ com_code }','{ report_date }',{ subject_id },{ value })"
+            if values and size + len(row) + 1 > self.max_insert_bytes:
+                cursor.execute(prefix + ','.join(values) + suffix)
+                values = []
+                size = fixed_size
+            values.append(row)
+            size += len(row) + 1
+        if values:
+            cursor.execute(prefix + ','.join(values) + suffix)
+
+    def close(self):
+        """ 导入剩余数据，报告导入速度，并关闭连接 """
+
+        self.flush()
+        self.connection.close()
+        if self.loaded_rows:
+            print(f"批量导入 { self.loaded_rows } 条记录，用时 {self.load_seconds:.2f} 秒，"
+                  f"平均 {self.loaded_rows / max(self.load_seconds, 1e-9):.0f} 条/秒")
+
+
+def load_watermarks(config=None):
+    """ 读取 financial_data 表中各公司各报表已保存的最新报告日期
+
+    参数
+    ----------
+    config: dict
+        DATABASE_CONFIGS 中的数据库配置，为 None 时使用 DEFAULT_DATABASE
+
+    返回值
+    -------
+    watermarks: dict
+        格式为：{(公司代码, 报表类型): 最新报告日期}，报表类型为 subjects.normalize_statement_type() 统一后的写法
+    """
+
+    if config is None:
+        config = DATABASE_CONFIGS[DEFAULT_DATABASE]
+    if config.get('backend') == 'sqlite':
+        backend = open_storage(config)
+        try:
+            return backend.load_watermarks()
+        finally:
+            backend.close()
+
+    connection = pymysql.connect(charset='utf8mb4', **config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT f.公司代码, s.报表类型, MAX(f.报告日期) FROM financial_data f "
+            "JOIN subject_dictionary s ON f.项目编号 = s.项目编号 GROUP BY f.公司代码, s.报表类型")
+        watermarks = {(com_code, statement_type): report_date for com_code, statement_type, report_date in cursor.fetchall()}
+    finally:
+        connection.close()
+
+    return watermarks
+
+
+def filter_new_records(date_table, watermarks):
+    """ 去除财务数据中早于已保存的最新报告日期的记录
+
+    最新报告日期当期的记录仍然保留，以补全上次未完整写入的数据，重复的记录在写入时按唯一键更新
+
+    参数
+    ----------
+    date_table: list
+        [数据库表类型, [[公司代码, 报告日期, 项目名称, 值], ...]]
+    watermarks: dict
+        load_watermarks() 返回的最新报告日期
+
+    返回值
+    -------
+    list
+        [数据库表类型, [[公司代码, 报告日期, 项目名称, 值], ...]]，只包含新增报告期的记录
+    """
+
+    statement_type = subjects.normalize_statement_type(date_table[0])
+    records = []
+    for record in date_table[1]:
+        watermark = watermarks.get((record[0], statement_type))
+        if watermark is None or record[1] >= watermark:
+            records.append(record)
+
+    return [date_table[0], records]
+
+
+class DatabaseReader:
+    """ financial_data 表的读取器
+
+    保持一个长连接，查询条件均为 financial_data 表主键或 项目_日期 索引的前缀，并包含报告日期，可按年份分区裁剪；
+    值在数据库中乘以 100 后以整数返回，即以分为单位的定点数（与 fixed_point 模块相同）
+
+    参数
+    ----------
+    config: dict
+        pymysql.connect() 的连接参数
+    connect: function
+        建立数据库连接的函数，参数与 pymysql.connect() 相同
+    """
+
+    def __init__(self, config=DATABASE_CONFIGS['pro'], connect=pymysql.connect):
+        self.config = config
+        self._connection = _PooledConnection(config, connect)
+        self._lock = threading.Lock()
+
+    def _query(self, sql, args):
+        """ 执行查询语句，返回全部结果 """
+
+        def query(connection):
+            cursor = connection.cursor()
+            cursor.execute(sql, args)
+            return cursor.fetchall()
+
+        with self._lock:
+            with metrics.stage('read', self.config['db']) as event:
+                rows = _with_reconnect(self._connection, query)
+                event['rows'] = len(rows)
+
+        return rows
+
+    def load_statements(self, com_code, start_date=None, end_date=None):
+        """ 读取单个公司的财务数据（主键范围扫描）
+
+        参数
+        ----------
+        com_code: str
+            公司代码
+        start_date: str 或 datetime.date
+            最早的报告日期（含），为 None 时不限
+        end_date: str 或 datetime.date
+            最晚的报告日期（含），为 None 时不限
+
+        返回值
+        -------
+        pandas.DataFrame
+            字段为：报告日期、报表类型、项目编号、项目名称、值（分），按报告日期、项目编号排列
+        """
+
+        sql = ("SELECT f.报告日期, s.报表类型, f.项目编号, s.项目名称, CAST(f.值 * 100 AS SIGNED) FROM financial_data f "
+               "JOIN subject_dictionary s ON s.项目编号 = f.项目编号 WHERE f.公司代码 = %s")
+        args = [com_code]
+        if start_date is not None:
+            sql += " AND f.报告日期 >= %s"
+            args.append(start_date)
+        if end_date is not None:
+            sql += " AND f.报告日期 <= %s"
+            args.append(end_date)
+        rows = self._query(sql + " ORDER BY f.报告日期, f.项目编号", args)
+
+        return pandas.DataFrame(list(rows), columns=['报告日期', '报表类型', '项目编号', '项目名称', '值'])
+
+    def load_subject(self, subject, report_date):
+        """ 读取全部公司某一项目、某一报告期的数据（只读 项目_日期 索引）
+
+        参数
+        ----------
+        subject: int、str 或 tuple
+            项目编号、项目名称（各报表中同名的项目均读取）或 (报表类型, 项目名称)
+        report_date: str 或 datetime.date
+            报告日期
+
+        返回值
+        -------
+        pandas.DataFrame
+            字段为：公司代码、项目编号、值（分），按公司代码排列
+        """
+
+        if isinstance(subject, int):
+            subject_ids = [subject]
+        else:
+            if isinstance(subject, str):
+                condition, args = "项目名称 = %s", [subjects.normalize_subject_name(subject)]
+            else:
+                condition = "报表类型 = %s AND 项目名称 = %s"
+                args = [subjects.normalize_statement_type(subject[0]), subjects.normalize_subject_name(subject[1])]
+            subject_ids = [row[0] for row in self._query("SELECT 项目编号 FROM subject_dictionary WHERE " + condition, args)]
+        if not subject_ids:
+            return pandas.DataFrame([], columns=['公司代码', '项目编号', '值'])
+
+        rows = self._query(
+            "SELECT 公司代码, 项目编号, CAST(值 * 100 AS SIGNED) FROM financial_data "
+            f"WHERE 项目编号 IN ({ ', '.join(['%s'] * len(subject_ids)) }) AND 报告日期 = %s ORDER BY 公司代码",
+            subject_ids + [report_date])
+
+        return pandas.DataFrame(list(rows), columns=['公司代码', '项目编号', '值'])
+
+    def load_fingerprints(self, com_code, statement_type):
+        """ 读取单个公司某一报表各报告期的数据指纹（statement_fingerprints 表，见 fingerprints 模块）
+
+        参数
+        ----------
+        com_code: str
+            公司代码
+        statement_type: str
+            报表类型，为 subjects.normalize_statement_type() 统一后的写法
+
+        返回值
+        -------
+        dict
+            格式为：{报告日期: 指纹}
+        """
+
+        rows = self._query("SELECT 报告日期, 指纹 FROM statement_fingerprints WHERE 公司代码 = %s AND 报表类型 = %s",
+                           [com_code, statement_type])
+        return dict(rows)
+
+    def load_subject_dictionary(self):
+        """ 读取项目字典
+
+        返回值
+        -------
+        dict
+            格式为：{项目编号: [报表类型, 项目名称]}
+        """
+
+        rows = self._query("SELECT 项目编号, 报表类型, 项目名称 FROM subject_dictionary", [])
+        return {subject_id: [statement_type, subject_name] for subject_id, statement_type, subject_name in rows}
+
+    def iter_financial_data(self, updated_since=None, chunk_size=100000):
+        """ 分批读取 financial_data 表的全部记录，或更新时间不早于 updated_since 的记录
+
+        在单独的连接上流式读取，不一次读入全部记录，也不占用本读取器的连接
+
+        参数
+        ----------
+        updated_since: str
+            最早的更新时间（含），格式为 'YYYY-MM-DD HH:MM:SS'，为 None 时读取全部记录
+        chunk_size: int
+            每批的记录数
+
+        返回值
+        -------
+        generator
+            每次返回一批记录，列表格式为：[[公司代码, 报告日期, 项目编号, 值（分）, 更新时间], ...]
+        """
+
+        connection = self._connection.connect_function(charset='utf8mb4', **self.config)
+        try:
+            cursor = connection.cursor(pymysql.cursors.SSCursor)
+            sql = "SELECT 公司代码, 报告日期, 项目编号, CAST(值 * 100 AS SIGNED), 更新时间 FROM financial_data"
+            if updated_since is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(sql + " WHERE 更新时间 >= %s", (updated_since,))
+            while True:
+                with metrics.stage('read', self.config['db']) as event:
+                    rows = cursor.fetchmany(chunk_size)
+                    event['rows'] = len(rows)
+                if not rows:
+                    break
+                yield [list(row) for row in rows]
+            cursor.close()
+        finally:
+            connection.close()
+
+    def close(self):
+        """ 关闭连接 """
+
+        with self._lock:
+            if self._connection.connection is not None:
+                self._connection.reset()
+
+
+def open_storage(config):
+    """ 按数据库配置的 'backend' 创建存储后端
+
+    参数
+    ----------
+    config: dict
+        DATABASE_CONFIGS 中的数据库配置
+
+    返回值
+    -------
+    storage.StorageBackend
+        'backend' 为 'sqlite' 时为 sqlite_storage.SQLiteStorage，否则为 DatabaseWriter
+    """
+
+    if config.get('backend') == 'sqlite':
+        # 延迟导入：sqlite_storage 模块导入本模块
+        import sqlite_storage
+        return sqlite_storage.SQLiteStorage(config)
+    return DatabaseWriter(config)
+
+
+# 各数据库共用的读取器，格式为：{数据库名称: DatabaseReader 或 SQLiteStorage}
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader(database_name=None):
+    """ 返回 database_name 数据库共用的读取器，首次调用时创建，database_name 为 None 时使用 DEFAULT_DATABASE """
+
+    database_name = database_name or DEFAULT_DATABASE
+    with _readers_lock:
+        if database_name not in _readers:
+            config = DATABASE_CONFIGS[database_name]
+            _readers[database_name] = open_storage(config) if config.get('backend') == 'sqlite' else DatabaseReader(config)
+
+    return _readers[database_name]
+
+
+def load_statements(com_code, start_date=None, end_date=None, database_name=None):
+    """ 读取单个公司的财务数据，参数及返回值与 DatabaseReader.load_statements() 相同 """
+    return get_reader(database_name).load_statements(com_code, start_date, end_date)
+
+
+def load_subject(subject, report_date, database_name=None):
+    """ 读取全部公司某一项目、某一报告期的数据，参数及返回值与 DatabaseReader.load_subject() 相同 """
+    return get_reader(database_name).load_subject(subject, report_date)
+
+
+# 各数据库共用的写入器，格式为：{数据库名称: 存储后端}
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(database_name=None):
+    """ 返回 database_name 数据库共用的写入器，首次调用时创建，程序退出时自动提交并关闭
+
+    参数
+    ----------
+    database_name: str
+        DATABASE_CONFIGS 中的数据库名称，为 None 时使用 DEFAULT_DATABASE
+
+    返回值
+    -------
+    storage.StorageBackend
+        共用的写入器，由 open_storage() 按数据库配置创建
+    """
+
+    database_name = database_name or DEFAULT_DATABASE
+    with _writers_lock:
+        writer = _writers.get(database_name)
+        if writer is None or writer.closed:
+            writer = open_storage(DATABASE_CONFIGS[database_name])
+            _writers[database_name] = writer
+
+    return writer
+
+
+def close_writers():
+    """ 提交并关闭全部共用的写入器 """
+
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+atexit.register(close_writers)
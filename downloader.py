@@ -0,0 +1,374 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+import cache
+import metrics
+
+
+# 同时进行的下载任务数量上限
+DEFAULT_CONCURRENCY = 8
+# 解析进程数量（保留一个 CPU 给下载及写入），为 0 时在线程中解析（单个 CPU 时不启动解析进程）
+DEFAULT_PARSE_WORKERS = (os.cpu_count() or 1) - 1
+# 流水线各阶段之间队列的容量（待解析的原始内容、待写入的解析结果）
+DEFAULT_QUEUE_SIZE = 32
+# 各站点的请求速率限制：(每秒补充的令牌数, 令牌桶容量)
+HOST_RATE_LIMITS = {
+    'money.finance.sina.com.cn': (2.0, 4),
+    'vip.stock.finance.sina.com.cn': (2.0, 4),
+    'hq.sinajs.cn': (2.0, 4),
+}
+# 各站点需要附加的请求头
+HOST_HEADERS = {
+    'hq.sinajs.cn': {'Referer': 'https://finance.sina.com.cn'},
+}
+# 内容实时变化、不保存至缓存的站点
+UNCACHED_HOSTS = ('hq.sinajs.cn',)
+# 未在 HOST_RATE_LIMITS 中配置的站点使用的速率限制
+DEFAULT_RATE_LIMIT = (1.0, 1)
+# 单次请求的超时时间（秒）：(建立连接, 读取数据)，连接超时较短，尽快重试不可达的服务器
+REQUEST_TIMEOUT = (5, 30)
+# 全部请求附加的请求头：接受 gzip 压缩的内容，长连接复用
+SESSION_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+# 连接池缓存的站点数量及每个站点保持的长连接数量（不少于同时进行的下载任务数量）
+POOL_HOSTS = 16
+POOL_CONNECTIONS_PER_HOST = DEFAULT_CONCURRENCY
+# 单个地址的最多请求次数（含第一次）
+MAX_FETCH_ATTEMPTS = 4
+# 重试的等待时间：第 n 次重试在 [0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** n)] 秒中随机选取（full jitter），避免并发任务同时重试
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 30.0
+# 可以重试的 HTTP 状态码（限流及服务器临时故障），其他 4xx、5xx 状态码直接失败
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# 可以重试的网络异常（连接失败、超时、传输中断）
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+class TokenBucket:
+    """ 令牌桶限速器
+
+    令牌以 rate 个/秒的速度补充，最多累积 capacity 个，每次请求消耗 1 个令牌，
+    令牌不足时等待，从而将对同一站点的请求速率控制在 rate 次/秒以内，同时允许 capacity 次的突发请求
+
+    参数
+    ----------
+    rate: float
+        每秒补充的令牌数
+    capacity: int
+        令牌桶的容量
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """ 取得 1 个令牌，令牌不足时等待 """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# 全部下载共用的 HTTP 会话，首次下载时创建
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """ 返回全部下载共用的 HTTP 会话
+
+    会话按站点保持长连接池，多个下载线程共用，同一站点的请求复用已建立的 TCP/TLS 连接；
+    重试由 download_page() 处理，连接池本身不重试
+    """
+
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(SESSION_HEADERS)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+
+    return _session
+
+
+def _retry_delay(attempt, response=None):
+    """ 返回第 attempt 次重试前等待的秒数，服务器返回 Retry-After（秒）时以其为准 """
+
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return min(float(retry_after), RETRY_BACKOFF_MAX)
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+
+
+def download_page(url):
+    """ 下载网页或数据文件，并保存至缓存，返回未解码的原始内容
+
+    通过共用的 HTTP 会话（get_session()）下载；连接失败、超时、传输中断及 RETRYABLE_STATUS_CODES 状态码时，
+    按指数退避加随机抖动重试，最多请求 MAX_FETCH_ATTEMPTS 次，其他错误（如 404）直接抛出
+
+    参数
+    ----------
+    url: str
+        待下载的地址
+
+    返回值
+    -------
+    page_content: bytes
+        下载得到的原始内容（已按 Content-Encoding 解压）
+    """
+
+    host = urlsplit(url).hostname
+    session = get_session()
+    for attempt in range(MAX_FETCH_ATTEMPTS):
+        response = None
+        try:
+            response = session.get(url, headers=HOST_HEADERS.get(host), timeout=REQUEST_TIMEOUT)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                break
+            # 重试次数用尽时抛出 HTTPError
+            if attempt == MAX_FETCH_ATTEMPTS - 1:
+                response.raise_for_status()
+        except RETRYABLE_EXCEPTIONS:
+            if attempt == MAX_FETCH_ATTEMPTS - 1:
+                raise
+        metrics.count('retries_total', stage='fetch', source=host)
+        time.sleep(_retry_delay(attempt, response))
+
+    if host not in UNCACHED_HOSTS:
+        cache.put(url, response.content)
+
+    return response.content
+
+
+def get_page(url, ttl=cache.DEFAULT_TTL):
+    """ 返回网页或数据文件的原始内容，缓存在有效期内时直接使用缓存，否则下载
+
+    参数
+    ----------
+    url: str
+        待下载的地址
+    ttl: int
+        缓存内容的有效期（秒）
+
+    返回值
+    -------
+    page_content: bytes
+        原始内容
+    """
+
+    host = metrics.source_of(url)
+    page_content = cache.get(url, ttl)
+    if page_content is not None:
+        metrics.count('cache_hits_total', source=host)
+        return page_content
+    with metrics.stage('fetch', host, url=url) as event:
+        page_content = download_page(url)
+        event['size'] = len(page_content)
+
+    return page_content
+
+
+def _parse_in_process(parser, com_code, statement_type_code, page_content):
+    """ 在解析进程中调用解析函数，返回值与 metrics.collect() 相同，解析函数内记录的指标由主进程合并 """
+    return metrics.collect(parser, com_code, statement_type_code, page_content)
+
+
+async def _fetch_worker(tasks, parse_queue, buckets, executor, report, offline):
+    """ 下载阶段：从共用的任务迭代器中逐个取出任务，按站点的速率限制下载（或读取缓存），将原始内容放入解析队列
+
+    解析队列已满时等待，下载失败的任务直接交给写入阶段记录
+    """
+
+    loop = asyncio.get_running_loop()
+    for task in tasks:
+        com_code, statement_type_code, url, parser = task
+        host = urlsplit(url).hostname
+        try:
+            if offline:
+                # 离线重放时读取缓存的原始内容（不检查有效期），不访问网站
+                page_content = await loop.run_in_executor(executor, cache.get, url, None)
+                if page_content is None:
+                    raise LookupError("无缓存：" + url)
+            else:
+                # 缓存在有效期内时不再下载，也不占用站点的请求速率
+                page_content = None
+                if host not in UNCACHED_HOSTS:
+                    page_content = await loop.run_in_executor(executor, cache.get, url)
+                if page_content is None:
+                    if host not in buckets:
+                        buckets[host] = TokenBucket(*HOST_RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT))
+                    await buckets[host].acquire()
+                    with metrics.stage('fetch', host, com_code=com_code, statement_type_code=statement_type_code) as event:
+                        page_content = await loop.run_in_executor(executor, download_page, url)
+                        event['size'] = len(page_content)
+                else:
+                    metrics.count('cache_hits_total', source=host)
+        except Exception as error:
+            await report([task, None, error])
+            continue
+        await parse_queue.put([task, page_content])
+
+
+async def _parse_worker(parse_queue, parse_executor, in_process, report):
+    """ 解析阶段：从解析队列中取出原始内容，在解析进程（或线程）中解析，将结果交给写入阶段，取得 None 时结束 """
+
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await parse_queue.get()
+        if item is None:
+            return
+        task, page_content = item
+        com_code, statement_type_code, url, parser = task
+        try:
+            with metrics.stage('parse', urlsplit(url).hostname, com_code=com_code, statement_type_code=statement_type_code) as event:
+                if in_process:
+                    result, counters, histograms, events = await loop.run_in_executor(
+                        parse_executor, _parse_in_process, parser, com_code, statement_type_code, page_content)
+                    metrics.merge(counters, histograms, events)
+                else:
+                    result = await loop.run_in_executor(parse_executor, parser, com_code, statement_type_code, page_content)
+                event['rows'] = metrics.count_records(result)
+        except Exception as error:
+            await report([task, None, error])
+            continue
+        await report([task, result, None])
+
+
+def _write_stage(write_queue, handle_result, handle_error, problem_list, failures):
+    """ 写入阶段（单个线程）：依次处理解析结果及失败的任务，取得 None 时结束
+
+    handle_result、handle_error 只在本线程中调用，无需考虑并发；handle_error 抛出的异常记入 failures，
+    本线程继续处理队列，避免上一阶段因队列已满而一直等待
+    """
+
+    while True:
+        item = write_queue.get()
+        if item is None:
+            return
+        task, result, error = item
+        com_code, statement_type_code = task[0], task[1]
+        if error is None:
+            try:
+                handle_result(com_code, statement_type_code, result)
+                continue
+            except Exception as handle_result_error:
+                error = handle_result_error
+        problem_list.append(com_code + ' ' + statement_type_code)
+        if handle_error is not None:
+            try:
+                handle_error(com_code, statement_type_code, error)
+            except Exception as handle_error_error:
+                failures.append(handle_error_error)
+
+
+async def download_tasks(task_list, handle_result, concurrency=DEFAULT_CONCURRENCY, handle_error=None,
+                         parse_workers=DEFAULT_PARSE_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, offline=False):
+    """ 以流水线方式并发下载、解析并处理 task_list 中的全部任务
+
+    流水线分为三个阶段，各阶段同时进行：
+    下载 - concurrency 个协程在线程池中下载，按站点的速率限制请求；
+    解析 - parse_workers 个解析进程（为 0 时在 concurrency 个线程中）解析原始内容；
+    写入 - 单个线程依次调用 handle_result（如写入数据库），数据库写入器按提交间隔合并提交。
+    阶段之间为容量为 queue_size 的队列，队列已满时上一阶段等待，内存占用不随任务数量增长，总用时接近最慢阶段的用时
+
+    参数
+    ----------
+    task_list: list
+        待下载的任务列表，列表格式为：[[公司代码, 报表类型, URL, 解析函数], [...]]，
+        解析函数的调用方式为：parser(公司代码, 报表类型, 原始内容)，使用解析进程时应为模块级函数
+    handle_result: function
+        处理解析结果的函数，调用方式为：handle_result(公司代码, 报表类型, 解析结果)
+    concurrency: int
+        同时进行的下载任务数量上限
+    handle_error: function
+        处理失败任务的函数，调用方式为：handle_error(公司代码, 报表类型, 异常)，为 None 时不处理
+    parse_workers: int
+        解析进程数量，为 0 时在线程中解析（适用于解析很快的任务）
+    queue_size: int
+        阶段之间队列的容量
+    offline: bool
+        是否离线重放：只使用缓存的原始内容（不检查有效期），不访问网站
+
+    返回值
+    -------
+    problem_list: list
+        下载、解析或处理失败的任务，列表格式为：["公司代码 报表类型", ...]
+    """
+
+    problem_list = []
+    failures = []
+    loop = asyncio.get_running_loop()
+    tasks = iter(task_list)
+    buckets = {}
+    parse_queue = asyncio.Queue(queue_size)
+    write_queue = queue.Queue(queue_size)
+    writer = threading.Thread(target=_write_stage, args=(write_queue, handle_result, handle_error, problem_list, failures), daemon=True)
+    writer.start()
+
+    # 解析进程以 spawn 方式启动，不复制主进程中的线程及锁，各平台行为一致
+    if parse_workers:
+        parse_executor = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        parse_executor = ThreadPoolExecutor(max_workers=concurrency)
+    # 写入队列已满时，放入结果的线程等待，不阻塞事件循环
+    executor = ThreadPoolExecutor(max_workers=concurrency * 2)
+
+    async def report(item):
+        await loop.run_in_executor(executor, write_queue.put, item)
+
+    try:
+        parsers = [asyncio.ensure_future(_parse_worker(parse_queue, parse_executor, bool(parse_workers), report))
+                   for _ in range(parse_workers or concurrency)]
+        await asyncio.gather(*[_fetch_worker(tasks, parse_queue, buckets, executor, report, offline) for _ in range(concurrency)])
+        for _ in parsers:
+            await parse_queue.put(None)
+        await asyncio.gather(*parsers)
+        await report(None)
+        await loop.run_in_executor(executor, writer.join)
+    finally:
+        executor.shutdown()
+        parse_executor.shutdown()
+    if failures:
+        raise failures[0]
+
+    return problem_list
+
+
+def run_download(task_list, handle_result, concurrency=DEFAULT_CONCURRENCY, handle_error=None,
+                 parse_workers=DEFAULT_PARSE_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+    """ 以同步方式调用 download_tasks()，参数及返回值与 download_tasks() 相同 """
+
+    return asyncio.run(download_tasks(task_list, handle_result, concurrency, handle_error, parse_workers, queue_size))
+
+
+def replay_tasks(task_list, handle_result, handle_error=None, parse_workers=DEFAULT_PARSE_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+    """ 离线重放：只使用缓存的原始内容（不检查有效期）解析 task_list 中的全部任务，不访问网站
+
+    与 download_tasks() 使用相同的流水线，参数及返回值与 download_tasks() 相同，无缓存的任务记入返回的 problem_list
+    """
+
+    return asyncio.run(download_tasks(task_list, handle_result, DEFAULT_CONCURRENCY, handle_error, parse_workers, queue_size, offline=True))
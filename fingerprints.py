@@ -0,0 +1,146 @@
+import collections
+import hashlib
+
+import database
+import metrics
+import subjects
+
+
+# 各报告期数据指纹的表名、字段及主键
+FINGERPRINT_TABLE = 'statement_fingerprints'
+FINGERPRINT_FIELDS = ['公司代码', '报表类型', '报告日期', '指纹', '项目数']
+FINGERPRINT_KEY = ['公司代码', '报表类型', '报告日期']
+# 追溯调整记录的表名、字段及主键（同一报告期变为同一新数据时只记录一次）
+RESTATEMENT_TABLE = 'restatement_log'
+RESTATEMENT_FIELDS = ['公司代码', '报表类型', '报告日期', '新指纹', '原指纹', '变动项目数']
+RESTATEMENT_KEY = ['公司代码', '报表类型', '报告日期', '新指纹']
+
+# 数据指纹发生变化的报告期
+# records 为该报告期的记录 [[公司代码, 报告日期, 项目名称（统一后的写法）, 值（分）], ...]，previous 为已保存的指纹，新增的报告期为 None
+ChangedBlock = collections.namedtuple('ChangedBlock', ['com_code', 'report_date', 'records', 'fingerprint', 'previous'])
+
+
+def fingerprint(records):
+    """ 计算一个报告期数据的指纹
+
+    按项目名称排序后，对每个（项目名称, 值）计算 BLAKE2b 摘要，与记录的顺序无关，不同版本的 Python 及不同主机上结果相同
+
+    参数
+    ----------
+    records: list
+        同一公司、同一报表、同一报告期的记录，格式为：[[公司代码, 报告日期, 项目名称, 值（分）], ...]，
+        项目名称应已由 subjects.normalize_subject_names() 统一写法（与项目编号的对应关系一致）
+
+    返回值
+    -------
+    str
+        32 位十六进制的指纹
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+    for name, value in sorted((record[2], str(record[3])) for record in records):
+        digest.update(f"{ name }\t{ value }\n".encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def find_changed_blocks(backend, date_table):
+    """ 按（公司代码, 报告日期）将财务数据分块，与已保存的指纹比较，返回新增或数据发生变化的报告期
+
+    参数
+    ----------
+    backend: storage.StorageBackend
+        存储后端，从中读取已保存的指纹
+    date_table: list
+        [数据库表类型, [[公司代码, 报告日期, 项目名称, 值（分）], ...]]
+
+    返回值
+    -------
+    list
+        ChangedBlock 的列表，数据未变化的报告期不包含在内
+    """
+
+    statement_type = subjects.normalize_statement_type(date_table[0])
+    # 各报告期的记录中为统一后的项目名称
+    names = subjects.normalize_subject_names([record[2] for record in date_table[1]])
+    blocks = collections.defaultdict(list)
+    for record, name in zip(date_table[1], names):
+        blocks[(record[0], record[1])].append([record[0], record[1], name, record[3]])
+
+    stored = {}
+    for com_code in sorted(set(com_code for com_code, _ in blocks)):
+        for report_date, stored_fingerprint in backend.load_fingerprints(com_code, statement_type).items():
+            stored[(com_code, report_date)] = stored_fingerprint
+
+    changed_blocks = []
+    for (com_code, report_date), records in blocks.items():
+        block_fingerprint = fingerprint(records)
+        previous = stored.get((com_code, report_date))
+        if block_fingerprint != previous:
+            changed_blocks.append(ChangedBlock(com_code, report_date, records, block_fingerprint, previous))
+
+    source = backend.config['db']
+    metrics.count('blocks_total', len(blocks) - len(changed_blocks), result='unchanged', source=source)
+    metrics.count('blocks_total', sum(block.previous is None for block in changed_blocks), result='new', source=source)
+    metrics.count('blocks_total', sum(block.previous is not None for block in changed_blocks), result='restated', source=source)
+
+    return changed_blocks
+
+
+def write_changed_blocks(backend, database_table_type, changed_blocks):
+    """ 保存新增或数据发生变化的报告期，并更新指纹
+
+    每次调用的全部报告期在同一事务中替换：删除已保存但新数据中已不存在的项目，更新其余项目的值，
+    同时更新指纹；数据发生变化的报告期（追溯调整、更正）记入 restatement_log 表
+
+    参数
+    ----------
+    backend: storage.StorageBackend
+        存储后端
+    database_table_type: str
+        数据库表类型，如 'BS'、'PS'、'CF'
+    changed_blocks: list
+        find_changed_blocks() 返回的 ChangedBlock 列表
+    """
+
+    if not changed_blocks:
+        return
+
+    statement_type = subjects.normalize_statement_type(database_table_type)
+    # 各报告期的记录中已为统一后的项目名称（与计算指纹时相同），不再重复统一
+    records = backend.replace_subject_names([database_table_type, [record for block in changed_blocks for record in block.records]],
+                                            normalized=True)[1]
+
+    ''' 已保存的报告期：读取原数据（每个公司读取一次），找出新数据中已不存在的项目及变动的项目数 '''
+    restated_dates = collections.defaultdict(list)
+    for block in changed_blocks:
+        if block.previous is not None:
+            restated_dates[block.com_code].append(block.report_date)
+    saved_blocks = collections.defaultdict(dict)
+    for com_code, report_dates in restated_dates.items():
+        saved = backend.load_statements(com_code, min(report_dates), max(report_dates))
+        saved = saved[saved['报表类型'] == statement_type]
+        for report_date, subject_id, value in zip(saved['报告日期'].tolist(), saved['项目编号'].tolist(), saved['值'].tolist()):
+            saved_blocks[(com_code, report_date)][subject_id] = value
+
+    stale_keys = []
+    restatements = []
+    position = 0
+    for block in changed_blocks:
+        block_records = records[position:position + len(block.records)]
+        position += len(block.records)
+        if block.previous is None:
+            continue
+        saved_values = saved_blocks[(block.com_code, block.report_date)]
+        new_values = {record[2]: record[3] for record in block_records}
+        stale_keys += [(block.com_code, block.report_date, subject_id) for subject_id in saved_values if subject_id not in new_values]
+        changed_subjects = sum(saved_values.get(subject_id) != value for subject_id, value in new_values.items())
+        changed_subjects += sum(subject_id not in new_values for subject_id in saved_values)
+        restatements.append([block.com_code, statement_type, block.report_date, block.fingerprint, block.previous, changed_subjects])
+
+    fingerprint_rows = [[block.com_code, statement_type, block.report_date, block.fingerprint, len(block.records)] for block in changed_blocks]
+    backend.write_batch(
+        [('financial_data', database.FINANCIAL_DATA_FIELDS, records, database.FINANCIAL_DATA_KEY, ['值']),
+         (FINGERPRINT_TABLE, FINGERPRINT_FIELDS, fingerprint_rows, FINGERPRINT_KEY, ()),
+         (RESTATEMENT_TABLE, RESTATEMENT_FIELDS, restatements, RESTATEMENT_KEY, ())],
+        [('financial_data', database.FINANCIAL_DATA_KEY, stale_keys)])
@@ -0,0 +1,111 @@
+import decimal
+
+import numpy
+
+
+# 定点数以“分”为单位保存为 int64，即数据库中 decimal(x,2) 字段的值乘以 100
+CENTS_PER_UNIT = 100
+# int64 能表示的金额上限（分），约 9.2 × 10^16 元，超出时抛出 OverflowError
+MAX_CENTS = int(numpy.iinfo(numpy.int64).max)
+# 可直接按整数部分、小数部分拆分转换的数值写法：可选的负号、不超过 16 位的整数及不超过 2 位的小数
+MAX_PLAIN_INTEGER_DIGITS = 16
+# 其他写法（如 3 位以上小数、科学计数法）的转换使用独立的上下文，不影响其他模块的 decimal 设置
+_DECIMAL_CONTEXT = decimal.Context(prec=40, rounding=decimal.ROUND_HALF_EVEN)
+
+
+def _text_to_cents(text):
+    """ 将单个文字数值转为分，小数第 3 位起按银行家舍入法舍入（与 Decimal.quantize(Decimal('0.00')) 相同） """
+
+    cents = int(_DECIMAL_CONTEXT.multiply(decimal.Decimal(text), CENTS_PER_UNIT).to_integral_value(context=_DECIMAL_CONTEXT))
+    if abs(cents) > MAX_CENTS:
+        raise OverflowError("数值超出 int64 定点数的范围：" + text)
+
+    return cents
+
+
+def parse_cents(texts):
+    """ 将文字数值批量转为以分为单位的 int64 数组
+
+    常见写法（如 '-1234.5'）将全部文字排成定长的字符矩阵，逐列累加各位数字，不逐个创建 Decimal，
+    其他写法逐个用 Decimal 转换，结果与 Decimal.quantize(Decimal('0.00')) 完全一致
+
+    参数
+    ----------
+    texts: list 或 numpy.ndarray
+        文字数值
+
+    返回值
+    -------
+    cents: numpy.ndarray
+        以分为单位的 int64 数组；无法识别的文字抛出 decimal.InvalidOperation
+    """
+
+    texts = numpy.asarray(texts).astype(str)
+    if len(texts) == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    ''' 字符矩阵：每行一个数值，不足的位置补 0 '''
+    width = texts.dtype.itemsize // 4
+    chars = texts.view(numpy.uint32).reshape(len(texts), width)
+    lengths = numpy.count_nonzero(chars, axis=1)
+    negative = chars[:, 0] == ord('-')
+    # 无符号数相减，非数字字符（含补位的 0）的结果均大于 9
+    digits = chars - numpy.uint32(ord('0'))
+    is_dot = chars == ord('.')
+    dot_count = numpy.count_nonzero(is_dot, axis=1)
+    has_dot = dot_count > 0
+    # 整数部分结束的位置：小数点的位置，无小数点时为文字长度
+    integer_end = numpy.where(has_dot, is_dot.argmax(axis=1), lengths)
+    integer_start = negative.astype(numpy.int64)
+
+    ''' 判断是否为常见写法：除开头的负号、1 个小数点外均为数字，整数不超过 16 位，小数不超过 2 位 '''
+    integer_digits = integer_end - integer_start
+    fraction_digits = numpy.where(has_dot, lengths - integer_end - 1, 0)
+    # 数字个数等于文字长度减去负号及小数点时，其余字符均为数字
+    plain = ((numpy.count_nonzero(digits <= 9, axis=1) == lengths - integer_start - dot_count) & (dot_count <= 1)
+             & (integer_digits >= 1) & (integer_digits <= MAX_PLAIN_INTEGER_DIGITS) & (fraction_digits <= 2))
+
+    ''' 常见写法：逐列累加整数部分的各位数字，再加上小数部分（补足 2 位） '''
+    # 转置为逐列连续存放，按列读取时不跨行
+    digit_columns = numpy.ascontiguousarray(digits[:, :min(width, MAX_PLAIN_INTEGER_DIGITS + 1)].T).astype(numpy.int64)
+    cents = numpy.zeros(len(texts), dtype=numpy.int64)
+    for column in range(min(width, MAX_PLAIN_INTEGER_DIGITS + 1, int(integer_end[plain].max(initial=0)))):
+        in_integer = (column >= integer_start) & (column < integer_end)
+        cents = numpy.where(in_integer, cents * 10 + digit_columns[column], cents)
+    rows = numpy.arange(len(texts))
+    first = numpy.where(fraction_digits >= 1, digits[rows, numpy.minimum(integer_end + 1, width - 1)].astype(numpy.int64), 0)
+    second = numpy.where(fraction_digits >= 2, digits[rows, numpy.minimum(integer_end + 2, width - 1)].astype(numpy.int64), 0)
+    cents = cents * CENTS_PER_UNIT + first * 10 + second
+    cents = numpy.where(negative, -cents, cents)
+
+    ''' 其他写法逐个转换 '''
+    for position in numpy.flatnonzero(~plain):
+        cents[position] = _text_to_cents(texts[position])
+
+    return cents
+
+
+def to_cents(text):
+    """ 将单个文字数值转为分，参数为空值 '--' 时原样返回 """
+
+    if text == '--':
+        return text
+    return int(parse_cents([text])[0])
+
+
+def format_cents(cents):
+    """ 将分转为数据库 decimal(x,2) 字段的文字写法，如 -123456 转为 '-1234.56'，参数为 '--' 时原样返回 """
+
+    if isinstance(cents, str):
+        return cents
+    cents = int(cents)
+
+    return ('-' if cents < 0 else '') + '%d.%02d' % divmod(abs(cents), CENTS_PER_UNIT)
+
+
+def format_cents_array(cents):
+    """ 批量将分转为 decimal(x,2) 字段的文字写法，参数为列表或数组，返回列表 """
+
+    return [('-' if value < 0 else '') + '%d.%02d' % divmod(abs(value), CENTS_PER_UNIT)
+            for value in numpy.asarray(cents, dtype=numpy.int64).tolist()]
+
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+
+# 下载进度日志文件
+JOURNAL_FILE = 'download_journal.jsonl'
+# 续传时失败任务的最大尝试次数，达到上限的任务不再重试
+MAX_ATTEMPTS = 3
+
+# 任务状态：完成、失败、跳过
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Journal:
+    """ 只追加的下载进度日志
+
+    每个任务的结果写为一行 JSON，写入后立即 fsync，程序中断时已记录的进度不会丢失
+
+    参数
+    ----------
+    path: str
+        日志文件路径
+    resume: bool
+        是否续传：True 时在原日志后追加；False 时将原日志改名为 path + '.old'，重新记录
+    """
+
+    def __init__(self, path=JOURNAL_FILE, resume=False):
+        if not resume and os.path.exists(path):
+            os.replace(path, path + '.old')
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, com_code, statement_type_code, status, reason=''):
+        """ 记录任务的结果
+
+        参数
+        ----------
+        com_code: str
+            公司代码
+        statement_type_code: str
+            报表类型
+        status: str
+            任务状态：DONE、FAILED、SKIPPED
+        reason: str
+            失败或跳过的原因
+        """
+
+        line = json.dumps({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'com_code': com_code,
+            'statement_type_code': statement_type_code,
+            'status': status,
+            'reason': reason,
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        """ 关闭日志文件 """
+        self._file.close()
+
+
+def load_journal(path=JOURNAL_FILE):
+    """ 读取下载进度日志，返回各任务的最新状态
+
+    程序中断时最后一行可能不完整，无法解析的行将被忽略
+
+    参数
+    ----------
+    path: str
+        日志文件路径
+
+    返回值
+    -------
+    task_states: dict
+        格式为：{(公司代码, 报表类型): {'status': 最新状态, 'attempts': 失败次数, 'reason': 最近一次的原因}}
+    """
+
+    task_states = {}
+    if not os.path.exists(path):
+        return task_states
+
+    with open(path, 'r', encoding='utf-8') as journal_file:
+        for line in journal_file:
+            try:
+                entry = json.loads(line)
+                key = (entry['com_code'], entry['statement_type_code'])
+            except (ValueError, KeyError):
+                continue
+            state = task_states.setdefault(key, {'status': None, 'attempts': 0, 'reason': ''})
+            state['status'] = entry['status']
+            state['reason'] = entry.get('reason', '')
+            if entry['status'] == FAILED:
+                state['attempts'] += 1
+
+    return task_states
+
+
+def filter_resume_tasks(download_list, task_states, max_attempts=MAX_ATTEMPTS):
+    """ 续传时去除已完成的任务，以及失败次数已达上限的任务
+
+    参数
+    ----------
+    download_list: list
+        待下载数据的列表，列表格式为：[["公司代码", "报表类型"], [...]]
+    task_states: dict
+        load_journal() 返回的任务状态
+    max_attempts: int
+        失败任务的最大尝试次数
+
+    返回值
+    -------
+    list
+        [待下载数据的列表, 失败次数已达上限的任务列表]，任务列表格式为：["公司代码 报表类型", ...]
+    """
+
+    pending_list = []
+    exhausted_list = []
+    for com_code, statement_type_code in download_list:
+        state = task_states.get((com_code, statement_type_code))
+        if state is None:
+            pending_list.append([com_code, statement_type_code])
+        elif state['status'] == DONE:
+            continue
+        elif state['attempts'] >= max_attempts:
+            exhausted_list.append(com_code + ' ' + statement_type_code)
+        else:
+            pending_list.append([com_code, statement_type_code])
+
+    return [pending_list, exhausted_list]
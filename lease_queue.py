@@ -0,0 +1,248 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import pymysql
+
+import database
+import journal
+
+
+# 任务表名
+TASK_TABLE = 'crawl_tasks'
+# 任务状态：待领取、已领取（租约有效期内由领取的工作节点处理）；完成、失败与下载进度日志相同
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = journal.DONE
+FAILED = journal.FAILED
+SKIPPED = journal.SKIPPED
+# 租约的有效期（秒），工作节点每隔 HEARTBEAT_SECONDS 秒续约一次，超过有效期未续约的任务可被其他工作节点重新领取
+LEASE_SECONDS = 120.0
+HEARTBEAT_SECONDS = 30.0
+# 每次领取的任务数量
+DEFAULT_CLAIM_SIZE = 20
+# 其他工作节点的任务尚未完成时，再次尝试领取的间隔（秒）
+IDLE_SECONDS = 10.0
+
+# 任务表的结构：主键为（公司代码, 报表类型），重复初始化不产生重复任务；租约到期为工作节点的 Unix 时间（秒），各主机的时钟应已同步
+TASK_TABLE_DEFINITIONS = {
+    'mysql': f"""CREATE TABLE IF NOT EXISTS { TASK_TABLE }(
+  公司代码  char(6)  NOT NULL,
+  报表类型  char(1)  NOT NULL,
+  状态  char(7)  NOT NULL DEFAULT '{ PENDING }',
+  工作节点  varchar(100)  NOT NULL DEFAULT '',
+  租约到期  double  NOT NULL DEFAULT 0,
+  尝试次数  smallint unsigned  NOT NULL DEFAULT 0,
+  原因  text  NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型),
+  KEY 状态_租约 (状态, 租约到期)
+)ENGINE=InnoDB""",
+    'sqlite': f"""CREATE TABLE IF NOT EXISTS { TASK_TABLE }(
+  公司代码  TEXT  NOT NULL,
+  报表类型  TEXT  NOT NULL,
+  状态  TEXT  NOT NULL DEFAULT '{ PENDING }',
+  工作节点  TEXT  NOT NULL DEFAULT '',
+  租约到期  REAL  NOT NULL DEFAULT 0,
+  尝试次数  INTEGER  NOT NULL DEFAULT 0,
+  原因  TEXT  NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS 状态_租约 ON crawl_tasks(状态, 租约到期)""",
+}
+
+
+def default_worker_id():
+    """ 返回本进程的工作节点名称：主机名:进程号 """
+    return f"{ socket.gethostname() }:{ os.getpid() }"
+
+
+class LeaseQueue:
+    """ 数据库中的下载任务队列，供多个主机上的多个工作进程共同下载
+
+    任务表的每一行为一个（公司代码, 报表类型）任务。工作节点以带条件的 UPDATE 逐行领取任务（只有条件仍然成立的一方更新成功），
+    领取后在租约有效期内独占该任务，并由心跳线程定期续约；工作节点中断后租约过期，任务可被其他工作节点重新领取。
+    任务的结果及失败原因记录在任务表中，由 summary()、failed_tasks() 汇总全部工作节点的结果。
+    连接为自动提交模式，每条语句即为一个事务
+
+    参数
+    ----------
+    config: dict
+        database.DATABASE_CONFIGS 中的数据库配置，'backend' 为 'sqlite' 时使用 SQLite 数据库文件，为 None 时使用 database.DEFAULT_DATABASE
+    worker_id: str
+        工作节点名称，为 None 时为 主机名:进程号
+    lease_seconds: float
+        租约的有效期（秒）
+    """
+
+    def __init__(self, config=None, worker_id=None, lease_seconds=LEASE_SECONDS):
+        if config is None:
+            config = database.DATABASE_CONFIGS[database.DEFAULT_DATABASE]
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.dialect = 'sqlite' if config.get('backend') == 'sqlite' else 'mysql'
+        if self.dialect == 'sqlite':
+            self.connection = sqlite3.connect(config['path'], timeout=30.0, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            self.connection.executescript(TASK_TABLE_DEFINITIONS['sqlite'])
+        else:
+            self.connection = pymysql.connect(charset='utf8mb4', autocommit=True, **config)
+            self.connection.cursor().execute(TASK_TABLE_DEFINITIONS['mysql'])
+        # 心跳线程与主线程共用连接
+        self._lock = threading.Lock()
+        self._heartbeat = None
+        self._stopped = threading.Event()
+
+    def _execute(self, sql, args=(), many=False):
+        """ 执行语句，SQL 中的参数占位符统一写为 %s，返回 (受影响的行数, 查询结果) """
+
+        if self.dialect == 'sqlite':
+            sql = sql.replace('%s', '?')
+        with self._lock:
+            cursor = self.connection.cursor()
+            if many:
+                cursor.executemany(sql, args)
+            else:
+                cursor.execute(sql, args)
+            rows = cursor.fetchall() if cursor.description else []
+            return cursor.rowcount, rows
+
+    def seed(self, download_list):
+        """ 将待下载数据的列表写入任务表，已有的任务（含已完成的任务）不变
+
+        参数
+        ----------
+        download_list: list
+            待下载数据的列表，列表格式为：[["公司代码", "报表类型"], [...]]
+
+        返回值
+        -------
+        int
+            新增的任务数量
+        """
+
+        ignore = 'OR IGNORE' if self.dialect == 'sqlite' else 'IGNORE'
+        before = self.count()
+        self._execute(f"INSERT { ignore } INTO { TASK_TABLE }(公司代码, 报表类型) VALUES (%s, %s)",
+                      [tuple(item) for item in download_list], many=True)
+
+        return self.count() - before
+
+    def count(self):
+        """ 返回任务总数 """
+        return self._execute(f"SELECT COUNT(*) FROM { TASK_TABLE }")[1][0][0]
+
+    def claim(self, size=DEFAULT_CLAIM_SIZE):
+        """ 领取至多 size 个待领取或租约已过期的任务
+
+        先读取候选任务，再逐个以带条件的 UPDATE 领取，多个工作节点同时领取同一任务时只有一个成功
+
+        返回值
+        -------
+        list
+            领取的任务，列表格式为：[["公司代码", "报表类型"], [...]]
+        """
+
+        now = time.time()
+        _, candidates = self._execute(
+            f"SELECT 公司代码, 报表类型 FROM { TASK_TABLE } WHERE 状态 = %s OR (状态 = %s AND 租约到期 < %s) "
+            "ORDER BY 公司代码, 报表类型 LIMIT %s", (PENDING, LEASED, now, size * 2))
+        claimed = []
+        for com_code, statement_type_code in candidates:
+            updated, _ = self._execute(
+                f"UPDATE { TASK_TABLE } SET 状态 = %s, 工作节点 = %s, 租约到期 = %s, 尝试次数 = 尝试次数 + 1 "
+                "WHERE 公司代码 = %s AND 报表类型 = %s AND (状态 = %s OR (状态 = %s AND 租约到期 < %s))",
+                (LEASED, self.worker_id, now + self.lease_seconds, com_code, statement_type_code, PENDING, LEASED, now))
+            if updated == 1:
+                claimed.append([com_code, statement_type_code])
+                if len(claimed) == size:
+                    break
+
+        return claimed
+
+    def renew(self):
+        """ 延长本工作节点全部已领取任务的租约，返回续约的任务数量 """
+
+        updated, _ = self._execute(f"UPDATE { TASK_TABLE } SET 租约到期 = %s WHERE 工作节点 = %s AND 状态 = %s",
+                                   (time.time() + self.lease_seconds, self.worker_id, LEASED))
+        return updated
+
+    def complete(self, com_code, statement_type_code, status=DONE, reason='', max_attempts=journal.MAX_ATTEMPTS):
+        """ 记录任务的结果
+
+        任务失败且尝试次数未达 max_attempts 时重新设为待领取；租约已被其他工作节点重新领取的任务不更新（以后者的结果为准）
+
+        参数
+        ----------
+        status: str
+            任务状态：DONE、FAILED、SKIPPED
+        reason: str
+            失败或跳过的原因
+
+        返回值
+        -------
+        bool
+            是否更新
+        """
+
+        updated, _ = self._execute(
+            f"UPDATE { TASK_TABLE } SET 状态 = CASE WHEN %s = %s AND 尝试次数 < %s THEN %s ELSE %s END, 原因 = %s, 租约到期 = 0 "
+            "WHERE 公司代码 = %s AND 报表类型 = %s AND 工作节点 = %s AND 状态 = %s",
+            (status, FAILED, max_attempts, PENDING, status, reason, com_code, statement_type_code, self.worker_id, LEASED))
+
+        return updated == 1
+
+    def release(self):
+        """ 将本工作节点尚未完成的任务重新设为待领取（工作节点正常退出时调用），不计入尝试次数 """
+
+        self._execute(f"UPDATE { TASK_TABLE } SET 状态 = %s, 租约到期 = 0, 尝试次数 = 尝试次数 - 1 WHERE 工作节点 = %s AND 状态 = %s",
+                      (PENDING, self.worker_id, LEASED))
+
+    def start_heartbeat(self, interval=HEARTBEAT_SECONDS):
+        """ 启动心跳线程，每隔 interval 秒续约一次 """
+
+        def beat():
+            while not self._stopped.wait(interval):
+                # 数据库暂时不可用（如 SQLite 数据库被其他进程锁定）时跳过本次续约，租约有效期为心跳间隔的数倍
+                try:
+                    self.renew()
+                except (pymysql.err.MySQLError, sqlite3.Error):
+                    pass
+
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=beat, daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        """ 停止心跳线程 """
+
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def has_unfinished(self):
+        """ 是否还有待领取或已领取（可能由其他工作节点处理中）的任务 """
+        return self._execute(f"SELECT COUNT(*) FROM { TASK_TABLE } WHERE 状态 IN (%s, %s)", (PENDING, LEASED))[1][0][0] > 0
+
+    def summary(self):
+        """ 返回各工作节点各状态的任务数量，格式为：{(工作节点, 状态): 任务数量} """
+
+        _, rows = self._execute(f"SELECT 工作节点, 状态, COUNT(*) FROM { TASK_TABLE } GROUP BY 工作节点, 状态")
+        return {(worker_id, status): count for worker_id, status, count in rows}
+
+    def failed_tasks(self):
+        """ 返回全部失败的任务，列表格式为：[["公司代码 报表类型", 原因], ...] """
+
+        _, rows = self._execute(f"SELECT 公司代码, 报表类型, 原因 FROM { TASK_TABLE } WHERE 状态 = %s ORDER BY 公司代码, 报表类型", (FAILED,))
+        return [[com_code + ' ' + statement_type_code, reason] for com_code, statement_type_code, reason in rows]
+
+    def close(self):
+        """ 停止心跳线程，并关闭连接 """
+
+        self.stop_heartbeat()
+        with self._lock:
+            self.connection.close()
@@ -1,5 +1,284 @@
-from views import *
+import argparse
+import collections
+import json
+import os
+import re
+import sys
+import traceback
+
+
+# 退出码，供 cron 等调度程序判断运行结果
+# 全部任务完成
+EXIT_OK = 0
+# 运行完毕，但有下载或保存失败的任务（见 problem_list.txt 或 status 命令）
+EXIT_TASKS_FAILED = 1
+# 命令行参数错误（与 argparse 相同）
+EXIT_USAGE = 2
+# 运行出错而中止，如数据库无法连接
+EXIT_ERROR = 3
+# 被 Ctrl+C 或 SIGINT 中断
+EXIT_INTERRUPTED = 130
+
+# 报表类型：1 - 资产负债表，2 - 利润表，3 - 现金流量表，4 - 公司资料，5 - 发行情况
+STATEMENT_TYPE_CODES = ['1', '2', '3', '4', '5']
+_COM_CODE = re.compile(r'^\d{6}$')
+
+# pandas、requests、pymysql、lxml 等依赖只在执行相应命令时导入（import views 约需 0.5 秒），
+# --help、status 等命令无需等待导入
+
+
+def _download_options(args, **options):
+    """ 由命令行参数生成 views.download_listed_companies_data() 的参数，未指定的参数使用函数的默认值 """
+
+    for name in ('concurrency', 'parse_workers'):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+    for name in ('bulk_load', 'incremental', 'resume', 'update_panel', 'distributed'):
+        if getattr(args, name, False):
+            options[name] = True
+
+    return options
+
+
+def _finish(problem_list):
+    """ 输出失败的任务数量，返回退出码 """
+
+    if problem_list:
+        print(f"{ len(problem_list) } 个任务下载或保存失败，见 problem_list.txt", file=sys.stderr)
+        return EXIT_TASKS_FAILED
+    return EXIT_OK
+
+
+def _check_board(board):
+    """ 检查全局下载的范围，不受支持时输出错误信息并返回 False """
+
+    import registry
+
+    if board not in registry.BOARDS:
+        print(f"暂不支持的数据范围：{ board }，可选：" + '，'.join(code + ' - ' + name for code, (name, _) in registry.BOARDS.items()),
+              file=sys.stderr)
+        return False
+    return True
+
+
+def _check_list_file(path):
+    """ 检查清单文件是否存在，不存在时输出错误信息并返回 False """
+
+    if not os.path.exists(path):
+        print(f"清单文件不存在：{ path }", file=sys.stderr)
+        return False
+    return True
+
+
+def command_sweep(args):
+    """ 全局下载：下载某一板块全部上市公司的全部报表 """
+
+    if not _check_board(args.board):
+        return EXIT_USAGE
+    import views
+
+    return _finish(views.download_listed_companies_data(download_type='1', download_range=args.board, **_download_options(args)))
+
+
+def command_list(args):
+    """ 清单下载：下载清单文件中的公司及报表 """
+
+    import views
+
+    path = args.file or views.DOWNLOAD_LIST_FILE
+    if not _check_list_file(path):
+        return EXIT_USAGE
+
+    return _finish(views.download_listed_companies_data(download_type='2', download_list=views.read_download_list(path), **_download_options(args)))
+
+
+def command_company(args):
+    """ 下载单个公司的报表 """
+
+    if not _COM_CODE.match(args.com_code):
+        print(f"公司代码应为 6 位数字：{ args.com_code }", file=sys.stderr)
+        return EXIT_USAGE
+    import views
+
+    download_list = [[args.com_code, statement_type_code] for statement_type_code in args.types]
+    return _finish(views.download_listed_companies_data(download_type='2', download_list=download_list, **_download_options(args)))
+
+
+def command_replay(args):
+    """ 离线重放：只使用缓存的原始内容重新解析并保存数据，不访问网站 """
+
+    if args.board is not None:
+        if not _check_board(args.board):
+            return EXIT_USAGE
+        import views
+        return _finish(views.download_listed_companies_data(download_type='1', download_range=args.board, offline=True, **_download_options(args)))
+
+    import views
+
+    path = args.file or views.DOWNLOAD_LIST_FILE
+    if not _check_list_file(path):
+        return EXIT_USAGE
+
+    return _finish(views.download_listed_companies_data(download_type='2', download_list=views.read_download_list(path), offline=True,
+                                                        **_download_options(args)))
+
+
+def command_worker(args):
+    """ 作为分布式下载的工作节点，下载数据库任务表中的任务 """
+
+    import database
+
+    database_name = args.database or database.DEFAULT_DATABASE
+    if database_name not in database.DATABASE_CONFIGS:
+        print(f"未配置的数据库：{ database_name }，可选：" + '，'.join(database.DATABASE_CONFIGS), file=sys.stderr)
+        return EXIT_USAGE
+    import views
+
+    options = {'database_name': database_name}
+    for name in ('concurrency', 'parse_workers', 'claim_size'):
+        if getattr(args, name) is not None:
+            options[name] = getattr(args, name)
+
+    return _finish(views.run_crawl_worker(**options))
+
+
+def command_interactive(args):
+    """ 交互式下载：按提示选择下载方式及范围（原 main.py 的行为） """
+
+    import views
+
+    return _finish(views.download_listed_companies_data(**_download_options(args)))
+
+
+def command_status(args):
+    """ 输出下载进度日志（及分布式下载任务表）中各状态的任务数量及失败的任务，有失败的任务时返回 EXIT_TASKS_FAILED """
+
+    import journal
+
+    path = args.journal or journal.JOURNAL_FILE
+    task_states = journal.load_journal(path)
+    counts = collections.Counter(state['status'] for state in task_states.values())
+    failed = sorted([com_code, statement_type_code, state['attempts'], state['reason']]
+                    for (com_code, statement_type_code), state in task_states.items() if state['status'] == journal.FAILED)
+    status = {
+        'journal': path,
+        'tasks': {key: counts[key] for key in (journal.DONE, journal.FAILED, journal.SKIPPED)},
+        'failed': [{'com_code': com_code, 'statement_type_code': statement_type_code, 'attempts': attempts, 'reason': reason}
+                   for com_code, statement_type_code, attempts, reason in failed],
+    }
+
+    ''' 分布式下载的任务表（需要连接数据库） '''
+    if args.tasks is not None:
+        import database
+        import lease_queue
+
+        if args.tasks not in database.DATABASE_CONFIGS:
+            print(f"未配置的数据库：{ args.tasks }，可选：" + '，'.join(database.DATABASE_CONFIGS), file=sys.stderr)
+            return EXIT_USAGE
+        task_queue = lease_queue.LeaseQueue(database.DATABASE_CONFIGS[args.tasks])
+        try:
+            summary = task_queue.summary()
+            failed_tasks = task_queue.failed_tasks()
+        finally:
+            task_queue.close()
+        status['crawl_tasks'] = {
+            'database': args.tasks,
+            'workers': [{'worker_id': worker_id, 'status': task_status, 'count': count} for (worker_id, task_status), count in sorted(summary.items())],
+            'failed': [{'task': task, 'reason': reason} for task, reason in failed_tasks],
+        }
+
+    if args.json:
+        print(json.dumps(status, ensure_ascii=False, indent=2))
+    else:
+        print(f"下载进度日志：{ path }" + ('' if task_states else "（无记录）"))
+        for key, count in status['tasks'].items():
+            print(f"  { key:<8} { count }")
+        for com_code, statement_type_code, attempts, reason in failed:
+            exhausted = "，已达重试上限" if attempts >= journal.MAX_ATTEMPTS else ''
+            print(f"  失败：{ com_code } { statement_type_code }（{ attempts } 次{ exhausted }）{ reason }")
+        if 'crawl_tasks' in status:
+            print(f"任务表：{ args.tasks }.{ lease_queue.TASK_TABLE }")
+            for worker in status['crawl_tasks']['workers']:
+                print(f"  { worker['worker_id'] or '-':<30} { worker['status']:<8} { worker['count'] }")
+            for task in status['crawl_tasks']['failed']:
+                print(f"  失败：{ task['task'] } { task['reason'] }")
+
+    has_failed = bool(failed) or bool(status.get('crawl_tasks', {}).get('failed'))
+    return EXIT_TASKS_FAILED if has_failed else EXIT_OK
+
+
+def build_parser():
+    """ 生成命令行参数解析器 """
+
+    parser = argparse.ArgumentParser(
+        description="下载上市公司财务报表数据",
+        epilog=f"退出码：{ EXIT_OK } - 完成，{ EXIT_TASKS_FAILED } - 有失败的任务，{ EXIT_USAGE } - 参数错误，"
+               f"{ EXIT_ERROR } - 运行出错，{ EXIT_INTERRUPTED } - 被中断")
+    subparsers = parser.add_subparsers(dest='command', metavar='命令', required=True)
+
+    ''' 各下载命令共用的参数，未指定时使用 views.download_listed_companies_data() 的默认值 '''
+    download_options = argparse.ArgumentParser(add_help=False)
+    download_options.add_argument('--concurrency', type=int, help="同时进行的下载任务数量上限")
+    download_options.add_argument('--parse-workers', type=int, help="解析进程数量，为 0 时在下载线程中解析")
+    download_options.add_argument('--bulk-load', action='store_true', help="用批量导入器导入财务报表数据（首次导入全部历史数据）")
+    download_options.add_argument('--incremental', action='store_true', help="财务报表只保存不早于已保存的最新报告日期的记录")
+    download_options.add_argument('--resume', action='store_true', help="跳过下载进度日志中已完成的任务，重试失败次数未达上限的任务")
+    download_options.add_argument('--update-panel', action='store_true', help="保存完毕后更新财务数据立方体、派生数据、财务比率及筛选索引")
+    distributed_option = argparse.ArgumentParser(add_help=False)
+    distributed_option.add_argument('--distributed', action='store_true', help="任务写入数据库中的任务表，与其他工作节点（worker 命令）共同下载")
+
+    sweep = subparsers.add_parser('sweep', parents=[download_options, distributed_option], help="全局下载某一板块的全部上市公司")
+    sweep.add_argument('board', help="板块代码：1 - 创业板，2 - 科创板，3 - 深市主板，4 - 中小板，5 - 沪市主板")
+    sweep.set_defaults(handler=command_sweep)
+
+    list_parser = subparsers.add_parser('list', parents=[download_options, distributed_option], help="下载清单文件中的公司及报表")
+    list_parser.add_argument('--file', help="清单文件，每行为“公司代码 报表类型”，默认为 download_list.txt")
+    list_parser.set_defaults(handler=command_list)
+
+    company = subparsers.add_parser('company', parents=[download_options, distributed_option], help="下载单个公司的报表")
+    company.add_argument('com_code', help="6 位公司代码")
+    company.add_argument('--types', nargs='+', choices=STATEMENT_TYPE_CODES, default=STATEMENT_TYPE_CODES,
+                         help="报表类型：1 - 资产负债表，2 - 利润表，3 - 现金流量表，4 - 公司资料，5 - 发行情况，默认为全部")
+    company.set_defaults(handler=command_company)
+
+    replay = subparsers.add_parser('replay', parents=[download_options], help="只使用缓存的原始内容重新解析并保存数据，不访问网站")
+    replay_source = replay.add_mutually_exclusive_group()
+    replay_source.add_argument('--board', help="重放某一板块的全部上市公司（板块代码同 sweep 命令）")
+    replay_source.add_argument('--file', help="重放清单文件中的公司及报表，默认为 download_list.txt")
+    replay.set_defaults(handler=command_replay)
+
+    worker = subparsers.add_parser('worker', help="作为分布式下载的工作节点，下载数据库任务表中的任务")
+    worker.add_argument('--database', help="任务表及数据所在的数据库（database.DATABASE_CONFIGS 中的名称），默认为 database.DEFAULT_DATABASE")
+    worker.add_argument('--concurrency', type=int, help="同时进行的下载任务数量上限")
+    worker.add_argument('--parse-workers', type=int, help="解析进程数量，为 0 时在下载线程中解析")
+    worker.add_argument('--claim-size', type=int, help="每次领取的任务数量")
+    worker.set_defaults(handler=command_worker)
+
+    status = subparsers.add_parser('status', help="查看下载进度及失败的任务，有失败的任务时退出码为 1")
+    status.add_argument('--journal', help="下载进度日志，默认为 download_journal.jsonl")
+    status.add_argument('--tasks', metavar='DATABASE', help="同时查看该数据库中分布式下载的任务表")
+    status.add_argument('--json', action='store_true', help="以 JSON 格式输出")
+    status.set_defaults(handler=command_status)
+
+    interactive = subparsers.add_parser('interactive', parents=[download_options, distributed_option], help="按提示选择下载方式及范围")
+    interactive.set_defaults(handler=command_interactive)
+
+    return parser
+
+
+def main(argv=None):
+    """ 命令行入口，返回退出码 """
+
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except KeyboardInterrupt:
+        print("已中断", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except Exception:
+        traceback.print_exc()
+        return EXIT_ERROR
 
 
 if __name__ == '__main__':
-    download_listed_companies_data()
+    sys.exit(main())
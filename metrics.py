@@ -0,0 +1,308 @@
+import bisect
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+# 各阶段的事件日志（每个事件一行 JSON）及 Prometheus 文本格式的指标文件
+METRICS_EVENTS_FILE = 'metrics.jsonl'
+METRICS_PROMETHEUS_FILE = 'metrics.prom'
+# Prometheus 指标名称的前缀
+METRIC_PREFIX = 'falc_'
+# 处理阶段：下载、解析、清洗、写入数据库、读取数据库
+STAGES = ('fetch', 'parse', 'clean', 'write', 'read')
+# 耗时直方图的分桶上限（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """ 耗时直方图，各分桶记录不超过其上限的观测次数，与 Prometheus 的 histogram 类型相同
+
+    参数
+    ----------
+    buckets: tuple
+        分桶上限（从小到大排列），另有一个无上限的分桶
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """ 记录一次观测值 """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """ 返回观测值的近似分位数（所在分桶的上限），无观测值时返回 None """
+
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+
+class Registry:
+    """ 进程内的指标登记簿
+
+    计数器及直方图按 (指标名称, 标签) 累计，标签只包含处理阶段、数据来源等取值有限的维度；
+    每个公司、每个任务的明细写入事件日志，不作为 Prometheus 的标签，避免指标数量随公司数量增长。
+    下载引擎在多个线程中解析数据，全部操作加锁
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._events = None
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        """ 计数器 name 增加 value """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ 在直方图 name 中记录一次观测值 """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def record(self, stage, source, seconds, rows=0, size=0, error=None, **fields):
+        """ 记录一次处理阶段的耗时、产生的记录数及字节数，并写入事件日志
+
+        参数
+        ----------
+        stage: str
+            处理阶段，见 STAGES
+        source: str
+            数据来源，如站点名称、数据库名称
+        seconds: float
+            耗时（秒）
+        rows: int
+            产生或写入的记录数
+        size: int
+            下载或写入的字节数
+        error: str
+            失败时的错误信息
+        fields: dict
+            写入事件日志的其他字段，如公司代码（com_code）、报表类型（statement_type_code）
+        """
+
+        self.observe('stage_seconds', seconds, stage=stage, source=source)
+        self.count('stage_total', stage=stage, source=source)
+        if rows:
+            self.count('rows_total', rows, stage=stage, source=source)
+        if size:
+            self.count('bytes_total', size, stage=stage, source=source)
+        if error is not None:
+            self.count('errors_total', stage=stage, source=source)
+        if self._events is not None:
+            event = {'time': round(time.time(), 3), 'stage': stage, 'source': source, 'seconds': round(seconds, 6),
+                     'rows': rows, 'bytes': size, **fields}
+            if error is not None:
+                event['error'] = error
+            line = json.dumps(event, ensure_ascii=False, default=str)
+            with self._lock:
+                if self._events is not None:
+                    self._events.write(line + '\n')
+
+    @contextlib.contextmanager
+    def stage(self, stage, source, **fields):
+        """ 对 with 语句块计时，并按 record() 记录
+
+        with 语句返回一个 dict，语句块中可设置 'rows'、'size' 及其他事件字段；语句块抛出异常时记为失败，异常继续抛出
+        """
+
+        event = {'rows': 0, 'size': 0, **fields}
+        started_at = time.perf_counter()
+        try:
+            yield event
+        except Exception as error:
+            self.record(stage, source, time.perf_counter() - started_at, error=repr(error), **event)
+            raise
+        self.record(stage, source, time.perf_counter() - started_at, **event)
+
+    def merge(self, counters, histograms, events=''):
+        """ 合并其他登记簿（如解析子进程中的登记簿）的计数器、直方图及事件日志，参数为 collect() 返回的对应部分 """
+
+        with self._lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, histogram in histograms.items():
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(histogram.buckets)
+                merged = self.histograms[key]
+                merged.counts = [count + other for count, other in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+            if events and self._events is not None:
+                self._events.write(events)
+
+    def open_events(self, path=METRICS_EVENTS_FILE):
+        """ 开始将事件追加写入事件日志 """
+
+        with self._lock:
+            if self._events is None:
+                self._events = open(path, 'a', encoding='utf-8')
+
+    def close_events(self):
+        """ 停止写入事件日志，并关闭文件 """
+
+        with self._lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+
+    def to_prometheus(self):
+        """ 返回 Prometheus 文本格式的全部指标 """
+
+        def format_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{ key }="{ str(value) }"' for key, value in pairs) + '}'
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE { METRIC_PREFIX }{ name } counter")
+            lines.append(f"{ METRIC_PREFIX }{ name }{ format_labels(labels) } { value }")
+        for (name, labels), histogram in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE { METRIC_PREFIX }{ name } histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{ METRIC_PREFIX }{ name }_bucket{ format_labels(labels, [('le', le)]) } { cumulative }")
+            lines.append(f"{ METRIC_PREFIX }{ name }_sum{ format_labels(labels) } { histogram.sum }")
+            lines.append(f"{ METRIC_PREFIX }{ name }_count{ format_labels(labels) } { histogram.count }")
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=METRICS_PROMETHEUS_FILE):
+        """ 将全部指标写为 Prometheus 文本文件（先写临时文件再替换，供 node_exporter 的 textfile 采集器读取） """
+
+        with open(path + '.tmp', 'w', encoding='utf-8') as prometheus_file:
+            prometheus_file.write(self.to_prometheus())
+        os.replace(path + '.tmp', path)
+
+    def summary(self):
+        """ 返回各处理阶段、各数据来源的汇总文字，每行一项，按总耗时从多到少排列 """
+
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = [(dict(labels), histogram) for (name, labels), histogram in self.histograms.items() if name == 'stage_seconds']
+        lines = []
+        for labels, histogram in sorted(histograms, key=lambda item: -item[1].sum):
+            key = tuple(sorted(labels.items()))
+            rows = counters.get(('rows_total', key), 0)
+            size = counters.get(('bytes_total', key), 0)
+            errors = counters.get(('errors_total', key), 0)
+            lines.append(f"{ labels['stage']:<6} { labels['source']:<32} { histogram.count:>7} 次 "
+                         f"共 {histogram.sum:>9.2f} 秒 平均 {histogram.sum / histogram.count * 1000:>8.1f} 毫秒 "
+                         f"P90 ≤ { histogram.quantile(0.9) } 秒 { rows } 条 { size } 字节 { errors } 次失败")
+        retries = sum(value for (name, _), value in counters.items() if name == 'retries_total')
+        if retries:
+            lines.append(f"重试 { retries } 次")
+
+        return lines
+
+
+# 进程内共用的指标登记簿
+REGISTRY = Registry()
+
+
+def count(name, value=1, **labels):
+    """ 计数器 name 增加 value，参数与 Registry.count() 相同 """
+    REGISTRY.count(name, value, **labels)
+
+
+def record(stage, source, seconds, rows=0, size=0, error=None, **fields):
+    """ 记录一次处理阶段，参数与 Registry.record() 相同 """
+    REGISTRY.record(stage, source, seconds, rows, size, error, **fields)
+
+
+def stage(stage, source, **fields):
+    """ 对 with 语句块计时，参数与 Registry.stage() 相同 """
+    return REGISTRY.stage(stage, source, **fields)
+
+
+def collect(function, *args):
+    """ 以新的登记簿调用 function(*args)，用于在子进程中运行，由父进程用 merge() 合并指标
+
+    返回值
+    -------
+    tuple
+        (function 的返回值, 计数器, 直方图, 事件日志文字)
+    """
+
+    global REGISTRY
+    registry = Registry()
+    registry._events = io.StringIO()
+    previous, REGISTRY = REGISTRY, registry
+    try:
+        result = function(*args)
+    finally:
+        REGISTRY = previous
+
+    return result, registry.counters, registry.histograms, registry._events.getvalue()
+
+
+def merge(counters, histograms, events=''):
+    """ 合并 collect() 返回的指标，参数与 Registry.merge() 相同 """
+    REGISTRY.merge(counters, histograms, events)
+
+
+def source_of(url):
+    """ 返回 URL 对应的数据来源（站点名称） """
+    return urlsplit(url).hostname
+
+
+def count_records(result):
+    """ 返回解析函数结果中的记录数，结果为 [数据库表类型, [记录, ...]]、由其组成的列表或 dict（每项为一条记录） """
+
+    if not result:
+        return 0
+    if isinstance(result, dict):
+        return len(result)
+    if isinstance(result[0], str):
+        return len(result[1])
+    return sum(len(table[1]) for table in result)
+
+
+def start_run(path=METRICS_EVENTS_FILE):
+    """ 开始一次下载：开始写入事件日志 """
+    REGISTRY.open_events(path)
+
+
+def finish_run(prometheus_path=METRICS_PROMETHEUS_FILE):
+    """ 结束一次下载：关闭事件日志，写出 Prometheus 指标文件，并打印各阶段的汇总 """
+
+    REGISTRY.close_events()
+    REGISTRY.write_prometheus(prometheus_path)
+    for line in REGISTRY.summary():
+        print(line)
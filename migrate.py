@@ -0,0 +1,258 @@
+import collections
+import datetime
+import sys
+
+import pymysql
+
+import database
+import subjects
+
+
+# 每次复制的记录数（按原表的自增 ID 分段）
+DEFAULT_CHUNK_SIZE = 200000
+# 迁移时新建的表及迁移后保留的原表
+NEW_TABLE = 'financial_data_new'
+OLD_TABLE = 'financial_data_old'
+# 按年份分区时，早于此年份的数据合并在第一个分区中
+FIRST_PARTITION_YEAR = 2000
+
+# financial_data 表的目标结构：
+# 主键为自然键（公司代码, 报告日期, 项目编号），InnoDB 按主键聚簇存放，单个公司的数据连续存放，按公司读取为主键范围扫描；
+# 项目_日期 索引包含值，按项目、报告日期读取全部公司的数据时只读索引；
+# 分区键必须包含在每个唯一键（含主键）中，因此不再使用自增 ID
+FINANCIAL_DATA_DEFINITION = """(
+  公司代码  char(6)  NOT NULL,
+  报告日期  date  NOT NULL,
+  项目编号  smallint unsigned  NOT NULL,
+  值  decimal(22,2)  NOT NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报告日期, 项目编号),
+  KEY 项目_日期 (项目编号, 报告日期, 值),
+  KEY 更新时间 (更新时间)
+)ENGINE=InnoDB"""
+TARGET_PRIMARY_KEY = ['公司代码', '报告日期', '项目编号']
+# 项目字典表（与 mysql.sql 相同），163 数据库迁移时用于将科目名称转为项目编号
+SUBJECT_DICTIONARY_DEFINITION = """(
+  项目编号  smallint unsigned  NOT NULL AUTO_INCREMENT,
+  报表类型  char(2)  NOT NULL,
+  项目名称  char(100)  NOT NULL,
+  PRIMARY KEY (项目编号),
+  UNIQUE KEY (报表类型, 项目名称)
+)ENGINE=InnoDB"""
+# 整数类型的项目编号（已使用项目字典）
+INTEGER_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint')
+
+
+def partition_clause(first_year, last_year):
+    """ 生成按报告年份划分的分区定义
+
+    参数
+    ----------
+    first_year: int
+        第一个单独分区的年份，更早的数据合并在第一个分区中
+    last_year: int
+        最后一个单独分区的年份，更晚的数据存放在 pmax 分区中，可用 add_year_partitions() 拆分
+
+    返回值
+    -------
+    str
+        PARTITION BY RANGE 子句
+    """
+
+    partitions = [f"PARTITION p{ first_year - 1 } VALUES LESS THAN ({ first_year })"]
+    partitions += [f"PARTITION p{ year } VALUES LESS THAN ({ year + 1 })" for year in range(first_year, last_year + 1)]
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+
+    return "PARTITION BY RANGE (YEAR(报告日期)) (\n  " + ",\n  ".join(partitions) + "\n)"
+
+
+def get_table_state(cursor, table_name='financial_data'):
+    """ 读取表的当前结构
+
+    返回值
+    -------
+    dict
+        {'columns': {字段名: 类型}, 'primary_key': [主键字段], 'partitions': [(分区名, 分区上限), ...]}，表不存在时返回 None
+    """
+
+    cursor.execute("SELECT COLUMN_NAME, COLUMN_TYPE FROM information_schema.COLUMNS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table_name,))
+    columns = dict(cursor.fetchall())
+    if not columns:
+        return None
+    cursor.execute("SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY' "
+                   "ORDER BY ORDINAL_POSITION", (table_name,))
+    primary_key = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+                   "ORDER BY PARTITION_ORDINAL_POSITION", (table_name,))
+    partitions = list(cursor.fetchall())
+
+    return {'columns': columns, 'primary_key': primary_key, 'partitions': partitions}
+
+
+def is_migrated(state):
+    """ 判断表是否已是目标结构：自然键主键、按年份分区、报告日期及值为 date 及 decimal 类型 """
+
+    return (state['primary_key'] == TARGET_PRIMARY_KEY and bool(state['partitions'])
+            and state['columns'].get('报告日期') == 'date' and state['columns'].get('值', '').startswith('decimal'))
+
+
+def add_year_partitions(cursor, last_year, table_name='financial_data'):
+    """ 将 pmax 分区拆分出截至 last_year 的各年份分区，已有的年份分区不变
+
+    参数
+    ----------
+    cursor: pymysql.cursors.Cursor
+        数据库游标
+    last_year: int
+        需要单独分区的最后一个年份
+    table_name: str
+        表名
+
+    返回值
+    -------
+    list
+        新增分区的年份
+    """
+
+    state = get_table_state(cursor, table_name)
+    years = [int(name[1:]) for name, _ in state['partitions'] if name != 'pmax']
+    new_years = list(range(max(years) + 1, last_year + 1))
+    if new_years:
+        partitions = [f"PARTITION p{ year } VALUES LESS THAN ({ year + 1 })" for year in new_years]
+        partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        cursor.execute(f"ALTER TABLE { table_name } REORGANIZE PARTITION pmax INTO ({ ', '.join(partitions) })")
+
+    return new_years
+
+
+def _copy_chunks(cursor, connection, state, start_id, chunk_size):
+    """ 按自增 ID 从小到大将原表（项目编号已为项目字典的整数编号）的数据分段复制至新表，返回已复制的最大 ID
+
+    同一自然键的重复记录中，ID 较大（较晚写入）的记录覆盖较早的记录；报告日期、值为文字时，复制时转为 date 及 decimal
+    """
+
+    has_update_time = '更新时间' in state['columns']
+    columns = "公司代码, 报告日期, 项目编号, 值" + (", 更新时间" if has_update_time else "")
+    select = ("公司代码, CAST(报告日期 AS DATE), 项目编号, CAST(值 AS DECIMAL(22,2))"
+              + (", 更新时间" if has_update_time else ""))
+    upsert = "值 = VALUES(值)" + (", 更新时间 = VALUES(更新时间)" if has_update_time else "")
+
+    cursor.execute("SELECT MAX(ID) FROM financial_data")
+    max_id = cursor.fetchone()[0] or 0
+    copied_id = start_id
+    while copied_id < max_id:
+        end_id = min(copied_id + chunk_size, max_id)
+        cursor.execute(
+            f"INSERT INTO { NEW_TABLE }({ columns }) SELECT { select } FROM financial_data "
+            f"WHERE ID > %s AND ID <= %s ORDER BY ID ON DUPLICATE KEY UPDATE { upsert }", (copied_id, end_id))
+        connection.commit()
+        copied_id = end_id
+        print(f"...已复制至 ID { copied_id } / { max_id }")
+
+    return copied_id
+
+
+def _copy_named_chunks(cursor, connection, start_id, chunk_size):
+    """ 按自增 ID 从小到大将 163 数据库原表的数据分段复制至新表，返回已复制的最大 ID
+
+    原表以 'BS-货币资金' 等科目名称代替项目编号：按公司、报表类型分组后用 subjects.get_subject_ids() 转为项目字典的项目编号
+    （字典中没有的项目自动新增）；同一自然键的重复记录中，ID 较大的记录覆盖较早的记录
+    """
+
+    cursor.execute("SELECT MAX(ID) FROM financial_data")
+    max_id = cursor.fetchone()[0] or 0
+    copied_id = start_id
+    while copied_id < max_id:
+        end_id = min(copied_id + chunk_size, max_id)
+        cursor.execute("SELECT 公司代码, CAST(报告日期 AS DATE), 科目名称, CAST(值 AS DECIMAL(22,2)) FROM financial_data "
+                       "WHERE ID > %s AND ID <= %s ORDER BY ID", (copied_id, end_id))
+        groups = collections.defaultdict(list)
+        for row in cursor.fetchall():
+            database_table_type = row[2].split('-', 1)[0]
+            if database_table_type not in database.FINANCIAL_TABLE_TYPES:
+                raise ValueError("无法识别报表类型的科目名称：" + row[2])
+            groups[(row[0], database_table_type)].append(row)
+        rows = []
+        for (_, database_table_type), group in groups.items():
+            subject_ids = subjects.get_subject_ids(cursor, database_table_type, [row[2] for row in group])
+            rows += [(row[0], row[1], subject_id, row[3]) for row, subject_id in zip(group, subject_ids)]
+        cursor.executemany(f"INSERT INTO { NEW_TABLE }(公司代码, 报告日期, 项目编号, 值) VALUES (%s, %s, %s, %s) "
+                           "ON DUPLICATE KEY UPDATE 值 = VALUES(值)", rows)
+        connection.commit()
+        copied_id = end_id
+        print(f"...已复制至 ID { copied_id } / { max_id }")
+
+    return copied_id
+
+
+def migrate_financial_data(config=database.DATABASE_CONFIGS['pro'], chunk_size=DEFAULT_CHUNK_SIZE, keep_old=True):
+    """ 将 financial_data 表迁移至目标结构（FINANCIAL_DATA_DEFINITION），并按报告年份分区
+
+    新建目标结构的表，按自增 ID 分段复制原表数据（重复记录以较晚写入的为准，文字的日期、值转为 date 及 decimal），
+    复制完毕后补复制期间新增的记录，再用一条 RENAME TABLE 语句同时替换两个表。
+    迁移期间修改已有记录的写入不会复制至新表，应在没有下载任务运行时迁移。
+    已是目标结构的表只拆分出截至下一年度的分区
+
+    163 数据库的科目名称转为项目字典的项目编号；原正式数据库以 'BS-17' 等报表行号为项目编号，
+    行号与项目名称的对应关系随公司及报表格式而不同，无法转为项目字典的项目编号，不迁移（抛出 ValueError），应删除原表后重新下载
+
+    参数
+    ----------
+    config: dict
+        pymysql.connect() 的连接参数
+    chunk_size: int
+        每次复制的记录数
+    keep_old: bool
+        是否保留原表（改名为 financial_data_old）
+    """
+
+    connection = pymysql.connect(charset='utf8mb4', **config)
+    try:
+        cursor = connection.cursor()
+        state = get_table_state(cursor)
+        next_year = datetime.date.today().year + 1
+        if state is None:
+            raise LookupError("数据库中没有 financial_data 表")
+        if is_migrated(state):
+            new_years = add_year_partitions(cursor, next_year)
+            print("financial_data 表已是目标结构" + (f"，新增 { new_years } 年度的分区" if new_years else ""))
+            return
+        has_subject_names = '科目名称' in state['columns']
+        if not has_subject_names and not state['columns'].get('项目编号', '').startswith(INTEGER_TYPES):
+            raise ValueError("financial_data 表的项目编号为报表行号（" + state['columns'].get('项目编号', '') + "），"
+                             "无法转为项目字典的项目编号，请删除原表后重新下载数据")
+        if has_subject_names:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS subject_dictionary{ SUBJECT_DICTIONARY_DEFINITION }")
+
+        ''' 按已有数据的年份新建目标结构的表 '''
+        cursor.execute("SELECT MIN(报告日期) FROM financial_data")
+        first_date = cursor.fetchone()[0]
+        first_year = max(FIRST_PARTITION_YEAR, int(str(first_date)[:4])) if first_date else FIRST_PARTITION_YEAR
+        cursor.execute(f"DROP TABLE IF EXISTS { NEW_TABLE }")
+        cursor.execute(f"CREATE TABLE { NEW_TABLE }{ FINANCIAL_DATA_DEFINITION }\n{ partition_clause(first_year, next_year) }")
+
+        ''' 分段复制，再补复制期间新增的记录 '''
+        print("开始复制 financial_data 表的数据...")
+        if has_subject_names:
+            copied_id = _copy_named_chunks(cursor, connection, 0, chunk_size)
+            _copy_named_chunks(cursor, connection, copied_id, chunk_size)
+        else:
+            copied_id = _copy_chunks(cursor, connection, state, 0, chunk_size)
+            _copy_chunks(cursor, connection, state, copied_id, chunk_size)
+
+        ''' 同时替换两个表 '''
+        cursor.execute(f"DROP TABLE IF EXISTS { OLD_TABLE }")
+        cursor.execute(f"RENAME TABLE financial_data TO { OLD_TABLE }, { NEW_TABLE } TO financial_data")
+        if not keep_old:
+            cursor.execute(f"DROP TABLE { OLD_TABLE }")
+        print("financial_data 表迁移完毕")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    # 用法：python migrate.py [数据库名称]，数据库名称为 database.DATABASE_CONFIGS 中的 pro（默认）或 163
+    migrate_financial_data(database.DATABASE_CONFIGS[sys.argv[1] if len(sys.argv) > 1 else 'pro'])
@@ -2,14 +2,87 @@
 CREATE DATABASE FALC_pro;
 
 
+-- Create subject_dictionary table
+CREATE TABLE subject_dictionary(
+  项目编号  smallint unsigned  NOT NULL AUTO_INCREMENT,
+  报表类型  char(2)  NOT NULL,
+  项目名称  char(100)  NOT NULL,
+  PRIMARY KEY (项目编号),
+  UNIQUE KEY (报表类型, 项目名称)
+)ENGINE=InnoDB;
+
+
 -- Create financial_data table
+-- 主键为自然键，按报告年份分区；已有数据库用 migrate.py 迁移
 CREATE TABLE financial_data(
-  ID  int  NOT NULL AUTO_INCREMENT,
   公司代码  char(6)  NOT NULL,
   报告日期  date  NOT NULL,
-  项目编号  char(6)  NOT NULL,
+  项目编号  smallint unsigned  NOT NULL,
   值  decimal(22,2)  NOT NULL,
-  PRIMARY KEY (ID)
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报告日期, 项目编号),
+  KEY 项目_日期 (项目编号, 报告日期, 值),
+  KEY 更新时间 (更新时间)
+)ENGINE=InnoDB
+PARTITION BY RANGE (YEAR(报告日期)) (
+  PARTITION p1999 VALUES LESS THAN (2000),
+  PARTITION p2000 VALUES LESS THAN (2001),
+  PARTITION p2001 VALUES LESS THAN (2002),
+  PARTITION p2002 VALUES LESS THAN (2003),
+  PARTITION p2003 VALUES LESS THAN (2004),
+  PARTITION p2004 VALUES LESS THAN (2005),
+  PARTITION p2005 VALUES LESS THAN (2006),
+  PARTITION p2006 VALUES LESS THAN (2007),
+  PARTITION p2007 VALUES LESS THAN (2008),
+  PARTITION p2008 VALUES LESS THAN (2009),
+  PARTITION p2009 VALUES LESS THAN (2010),
+  PARTITION p2010 VALUES LESS THAN (2011),
+  PARTITION p2011 VALUES LESS THAN (2012),
+  PARTITION p2012 VALUES LESS THAN (2013),
+  PARTITION p2013 VALUES LESS THAN (2014),
+  PARTITION p2014 VALUES LESS THAN (2015),
+  PARTITION p2015 VALUES LESS THAN (2016),
+  PARTITION p2016 VALUES LESS THAN (2017),
+  PARTITION p2017 VALUES LESS THAN (2018),
+  PARTITION p2018 VALUES LESS THAN (2019),
+  PARTITION p2019 VALUES LESS THAN (2020),
+  PARTITION p2020 VALUES LESS THAN (2021),
+  PARTITION p2021 VALUES LESS THAN (2022),
+  PARTITION p2022 VALUES LESS THAN (2023),
+  PARTITION p2023 VALUES LESS THAN (2024),
+  PARTITION p2024 VALUES LESS THAN (2025),
+  PARTITION p2025 VALUES LESS THAN (2026),
+  PARTITION p2026 VALUES LESS THAN (2027),
+  PARTITION p2027 VALUES LESS THAN (2028),
+  PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+
+-- Create statement_fingerprints table
+-- 每个公司、每张报表、每个报告期的数据指纹，数据未变化时不再写入（见 fingerprints 模块）
+CREATE TABLE statement_fingerprints(
+  公司代码  char(6)  NOT NULL,
+  报表类型  char(2)  NOT NULL,
+  报告日期  date  NOT NULL,
+  指纹  char(32)  NOT NULL,
+  项目数  smallint unsigned  NOT NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型, 报告日期)
+)ENGINE=InnoDB;
+
+
+-- Create restatement_log table
+-- 已保存的报告期数据发生变化（追溯调整、更正）的记录
+CREATE TABLE restatement_log(
+  公司代码  char(6)  NOT NULL,
+  报表类型  char(2)  NOT NULL,
+  报告日期  date  NOT NULL,
+  新指纹  char(32)  NOT NULL,
+  原指纹  char(32)  NOT NULL,
+  变动项目数  smallint unsigned  NOT NULL,
+  记录时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型, 报告日期, 新指纹),
+  KEY 记录时间 (记录时间)
 )ENGINE=InnoDB;
 
 
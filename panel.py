@@ -0,0 +1,370 @@
+import datetime
+import json
+import os
+import time
+
+import numpy
+import pandas
+
+import database
+
+
+# 财务数据立方体的保存目录
+PANEL_DIR = 'panel'
+# 立方体元数据文件：各轴的长度、容量、数据文件名、已读取的最新更新时间，以及各报告期最近一次写入时的版本号
+META_FILE = 'meta.json'
+# 各轴的索引文件：公司代码、项目编号、报告日期
+COM_CODES_FILE = 'com_codes.npy'
+SUBJECT_IDS_FILE = 'subject_ids.npy'
+REPORT_DATES_FILE = 'report_dates.npy'
+# 项目字典文件，格式为：{项目编号: [报表类型, 项目名称]}
+SUBJECTS_FILE = 'subjects.json'
+# 从数据库读取 financial_data 时每次读取的记录数
+FETCH_SIZE = 500000
+# 增量读取时，起点早于已读取的最新更新时间的秒数：提交晚于更新时间的记录（合并提交、多个工作节点）不会遗漏
+UPDATE_OVERLAP_SECONDS = 600
+# 扩大容量时各轴预留的余量比例，避免每次新增公司、项目、报告期都重写数据文件
+GROWTH_FACTOR = 1.25
+# 各轴的最小容量
+MIN_CAPACITY = (64, 64, 16)
+
+
+class Panel:
+    """ 按公司 × 项目 × 报告日期排列的财务数据立方体
+
+    数据以 float64 保存在内存映射文件中，无数据的位置为 NaN，打开时不读取数据，切片时不复制数据；
+    公司代码、项目编号按加入的先后顺序排列，报告日期按从早到晚的顺序排列
+
+    参数
+    ----------
+    path: str
+        立方体的保存目录
+    writable: bool
+        是否以可写方式打开数据文件，只有 apply_records() 需要以可写方式打开
+
+    属性
+    ----------
+    values: numpy.memmap
+        形状为 (公司数, 项目数, 报告期数) 的数据
+    com_codes: numpy.ndarray
+        公司代码轴
+    subject_ids: numpy.ndarray
+        项目编号轴
+    report_dates: numpy.ndarray
+        报告日期轴（datetime64[D]）
+    subjects: dict
+        项目字典，格式为：{项目编号: [报表类型, 项目名称]}
+    """
+
+    def __init__(self, path=PANEL_DIR, writable=False):
+        self.path = path
+        # 读取期间立方体被其他进程更新时（元数据前后不一致），重新读取
+        while True:
+            self.meta = _load_meta(path)
+            com_codes = numpy.load(os.path.join(path, COM_CODES_FILE))
+            subject_ids = numpy.load(os.path.join(path, SUBJECT_IDS_FILE))
+            report_dates = numpy.load(os.path.join(path, REPORT_DATES_FILE))
+            with open(os.path.join(path, SUBJECTS_FILE), 'r', encoding='utf-8') as subjects_file:
+                subjects = json.load(subjects_file)
+            if _load_meta(path) == self.meta:
+                break
+        shape = tuple(self.meta['shape'])
+        capacity = tuple(self.meta['capacity'])
+
+        # 数据文件按容量分配，只映射已使用的部分
+        self._storage = numpy.memmap(os.path.join(path, self.meta['values_file']), dtype=numpy.float64,
+                                     mode='r+' if writable else 'r', shape=capacity)
+        self.values = self._storage[:shape[0], :shape[1], :shape[2]]
+        self.com_codes = com_codes[:shape[0]]
+        self.subject_ids = subject_ids[:shape[1]]
+        self.report_dates = report_dates[:shape[2]]
+        self.subjects = {int(subject_id): subject for subject_id, subject in subjects.items()}
+
+        self.com_code_index = pandas.Index(self.com_codes)
+        self.subject_id_index = pandas.Index(self.subject_ids)
+        self.report_date_index = pandas.Index(self.report_dates)
+
+    def find_subject(self, statement_type, subject_name):
+        """ 按报表类型及项目名称查找项目编号，不存在时返回 None """
+
+        for subject_id, subject in self.subjects.items():
+            if subject[0] == statement_type and subject[1] == subject_name:
+                return subject_id
+
+        return None
+
+    def get(self, com_code=None, subject_id=None, report_date=None):
+        """ 按公司代码、项目编号、报告日期取数据，参数为 None 时取该轴的全部数据
+
+        参数
+        ----------
+        com_code: str
+            公司代码
+        subject_id: int
+            项目编号
+        report_date: str 或 datetime.date
+            报告日期
+
+        返回值
+        -------
+        numpy.ndarray
+            数据的视图（不复制数据），已指定的轴不再保留；指定的公司、项目或报告期不存在时抛出 KeyError
+        """
+
+        selector = (
+            slice(None) if com_code is None else self.com_code_index.get_loc(com_code),
+            slice(None) if subject_id is None else self.subject_id_index.get_loc(subject_id),
+            slice(None) if report_date is None else self.report_date_index.get_loc(numpy.datetime64(report_date, 'D')),
+        )
+
+        return self.values[selector]
+
+    def to_frame(self, subject_id):
+        """ 返回单个项目的 公司 × 报告日期 DataFrame（复制数据） """
+
+        return pandas.DataFrame(self.get(subject_id=subject_id), index=self.com_codes, columns=self.report_dates)
+
+    def close(self):
+        """ 将修改写入数据文件，并释放内存映射 """
+
+        if self._storage is not None and self._storage.mode == 'r+':
+            self._storage.flush()
+        self.values = None
+        self._storage = None
+
+
+def _load_meta(path):
+    """ 读取立方体的元数据 """
+
+    with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+
+def open_panel(path=PANEL_DIR):
+    """ 以只读方式打开财务数据立方体
+
+    参数
+    ----------
+    path: str
+        立方体的保存目录
+
+    返回值
+    -------
+    Panel
+        打开的立方体，立方体不存在时抛出 FileNotFoundError
+    """
+
+    return Panel(path)
+
+
+def save_array(path, array):
+    """ 保存索引文件，先写入临时文件再改名，避免读取时读到不完整的文件 """
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as array_file:
+        numpy.save(array_file, array)
+    os.replace(temp_path, path)
+
+
+def save_json(path, data):
+    """ 保存 JSON 文件，先写入临时文件再改名 """
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as json_file:
+        json.dump(data, json_file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def create_values_file(path, capacity):
+    """ 按容量创建数据文件，全部位置填充 NaN """
+
+    values = numpy.memmap(path, dtype=numpy.float64, mode='w+', shape=capacity)
+    # 按公司逐块填充，避免一次占用与数据文件同样大小的内存
+    for i in range(capacity[0]):
+        values[i] = numpy.nan
+
+    return values
+
+
+def grow_capacity(size, capacity, minimum):
+    """ 返回容纳 size 个元素所需的容量 """
+
+    if size <= capacity:
+        return capacity
+    return max(int(size * GROWTH_FACTOR), minimum)
+
+
+def _remove_stale_files(path, values_file):
+    """ 删除旧的数据文件；Windows 下仍被其他进程映射的文件无法删除，留待下次更新时删除 """
+
+    for name in os.listdir(path):
+        if name.startswith('values.') and name != values_file:
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+
+
+def apply_records(rows, subjects=None, path=PANEL_DIR, updated_at=None):
+    """ 将财务数据记录写入立方体，立方体不存在时新建
+
+    新的公司、项目追加在轴的末尾，晚于已有报告期的报告日期追加在日期轴的末尾，均在预留的容量内直接写入；
+    超出容量或插入早于最新报告期的报告日期时，按新的轴重写数据文件，重写完成后再替换元数据，
+    已打开立方体的其他进程继续使用旧的数据文件，重新打开后读取新的数据
+
+    参数
+    ----------
+    rows: list
+        财务数据记录，列表格式为：[[公司代码, 报告日期, 项目编号, 值], ...]，重复的记录以后出现的为准
+    subjects: dict
+        需要更新的项目字典，格式为：{项目编号: [报表类型, 项目名称]}
+    path: str
+        立方体的保存目录
+    updated_at: str
+        本批记录在数据库中的最新更新时间，保存在元数据中，供 refresh_panel() 增量读取
+
+    返回值
+    -------
+    int
+        写入的记录数
+    """
+
+    os.makedirs(path, exist_ok=True)
+    if os.path.exists(os.path.join(path, META_FILE)):
+        panel = Panel(path, writable=True)
+        meta = panel.meta
+        com_codes, subject_ids, report_dates = panel.com_codes, panel.subject_ids, panel.report_dates
+        panel_subjects = panel.subjects
+    else:
+        panel = None
+        # 重新生成时，数据文件的编号接续已有的旧数据文件，避免覆盖仍被其他进程映射的文件
+        generation = max([int(name.split('.')[1]) for name in os.listdir(path) if name.startswith('values.')] or [0])
+        meta = {'shape': [0, 0, 0], 'capacity': [0, 0, 0], 'values_file': None, 'generation': generation, 'updated_at': None,
+                'version': 0, 'date_versions': {}}
+        com_codes = numpy.array([], dtype='<U6')
+        subject_ids = numpy.array([], dtype=numpy.uint16)
+        report_dates = numpy.array([], dtype='datetime64[D]')
+        panel_subjects = {}
+    if subjects:
+        panel_subjects.update(subjects)
+
+    ''' 整理各轴新增的公司代码、项目编号、报告日期 '''
+    records = pandas.DataFrame(rows, columns=['公司代码', '报告日期', '项目编号', '值'])
+    # 各轴的取值很少，先对各列编码，只转换不重复的取值
+    code_labels, record_codes = pandas.factorize(records['公司代码'])
+    subject_labels, record_subjects = pandas.factorize(records['项目编号'])
+    date_labels, record_dates = pandas.factorize(records['报告日期'])
+    record_codes = numpy.array(list(record_codes), dtype='<U6')
+    record_subjects = numpy.array(list(record_subjects), dtype=numpy.uint16)
+    record_dates = numpy.array(list(record_dates), dtype='datetime64[D]')
+    record_values = records['值'].to_numpy(dtype=numpy.float64)
+
+    new_codes = pandas.unique(record_codes[~numpy.isin(record_codes, com_codes)])
+    new_subjects = pandas.unique(record_subjects[~numpy.isin(record_subjects, subject_ids)])
+    all_codes = numpy.concatenate([com_codes, new_codes]).astype('<U6')
+    all_subjects = numpy.concatenate([subject_ids, new_subjects]).astype(numpy.uint16)
+    all_dates = numpy.union1d(report_dates, record_dates)
+
+    ''' 超出容量或报告日期不能追加在末尾时，重写数据文件 '''
+    shape = [len(all_codes), len(all_subjects), len(all_dates)]
+    old_shape = meta['shape']
+    capacity = [grow_capacity(shape[axis], meta['capacity'][axis], MIN_CAPACITY[axis]) for axis in range(3)]
+    dates_appended = bool(numpy.array_equal(all_dates[:old_shape[2]], report_dates))
+    if panel is None or capacity != meta['capacity'] or not dates_appended:
+        meta['generation'] += 1
+        values_file = 'values.' + str(meta['generation']) + '.f8'
+        storage = create_values_file(os.path.join(path, values_file), tuple(capacity))
+        if panel is not None:
+            # 旧数据各轴在新轴中的位置：公司、项目的位置不变，报告日期按排序后的位置
+            date_positions = numpy.searchsorted(all_dates, report_dates)
+            old_values = panel.values
+            for i in range(old_shape[0]):
+                storage[i][:old_shape[1], date_positions] = old_values[i]
+            panel.close()
+        meta['values_file'] = values_file
+    else:
+        storage = panel._storage
+
+    ''' 写入数据 '''
+    code_positions = pandas.Index(all_codes).get_indexer(record_codes)[code_labels]
+    subject_positions = pandas.Index(all_subjects).get_indexer(record_subjects)[subject_labels]
+    date_positions = numpy.searchsorted(all_dates, record_dates)[date_labels]
+    # 同一位置有多条记录时以后出现的为准
+    flat_positions = numpy.ravel_multi_index((code_positions, subject_positions, date_positions), capacity)
+    last_index = len(flat_positions) - 1 - numpy.unique(flat_positions[::-1], return_index=True)[1]
+    storage[code_positions[last_index], subject_positions[last_index], date_positions[last_index]] = record_values[last_index]
+    storage.flush()
+    del storage
+    if panel is not None:
+        panel.close()
+
+    ''' 先保存数据及索引文件，最后保存元数据，其他进程不会读到不一致的立方体 '''
+    save_array(os.path.join(path, COM_CODES_FILE), all_codes)
+    save_array(os.path.join(path, SUBJECT_IDS_FILE), all_subjects)
+    save_array(os.path.join(path, REPORT_DATES_FILE), all_dates)
+    save_json(os.path.join(path, SUBJECTS_FILE), {str(subject_id): subject for subject_id, subject in panel_subjects.items()})
+    meta['shape'] = shape
+    meta['capacity'] = capacity
+    # 每次写入的版本号递增，记录本次写入的报告期，供派生数据只重算受影响的报告期
+    if len(last_index):
+        meta['version'] = meta.get('version', 0) + 1
+        date_versions = meta.setdefault('date_versions', {})
+        for report_date in record_dates.astype(str):
+            date_versions[report_date] = meta['version']
+    if updated_at is not None:
+        meta['updated_at'] = max(updated_at, meta['updated_at'] or updated_at)
+    save_json(os.path.join(path, META_FILE), meta)
+    _remove_stale_files(path, meta['values_file'])
+
+    return len(last_index)
+
+
+def refresh_panel(database_name=None, path=PANEL_DIR, rebuild=False, overlap_seconds=UPDATE_OVERLAP_SECONDS):
+    """ 从 financial_data 表读取新增或更新的记录，写入立方体
+
+    以元数据中保存的最新更新时间减去 overlap_seconds 秒为起点增量读取（重复写入不影响结果）：
+    合并提交的事务及多个工作节点写入的记录，提交的时间可能晚于更新时间，较晚提交、但更新时间较早的记录在下次更新时仍被读取；
+    立方体不存在或 rebuild 为 True 时读取全部记录重新生成；数据库中已删除的记录不会从立方体中删除，需要重新生成
+
+    参数
+    ----------
+    database_name: str
+        database.DATABASE_CONFIGS 中的数据库名称，通过 database.get_reader() 读取（MySQL 或 SQLite），为 None 时使用 database.DEFAULT_DATABASE
+    path: str
+        立方体的保存目录
+    rebuild: bool
+        是否删除已有的立方体，重新生成
+    overlap_seconds: float
+        增量读取时，起点早于已读取的最新更新时间的秒数
+
+    返回值
+    -------
+    int
+        写入的记录数
+    """
+
+    meta_path = os.path.join(path, META_FILE)
+    if rebuild and os.path.exists(meta_path):
+        os.remove(meta_path)
+    updated_since = None
+    if os.path.exists(meta_path) and _load_meta(path)['updated_at'] is not None:
+        updated_at = datetime.datetime.strptime(_load_meta(path)['updated_at'], '%Y-%m-%d %H:%M:%S')
+        updated_since = (updated_at - datetime.timedelta(seconds=overlap_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+    started_at = time.perf_counter()
+    applied_rows = 0
+    reader = database.get_reader(database_name or database.DEFAULT_DATABASE)
+    subjects = reader.load_subject_dictionary()
+    # 流式读取，避免一次读入全部记录；值以分为单位读出，立方体中以元为单位保存
+    for rows in reader.iter_financial_data(updated_since, FETCH_SIZE):
+        updated_at = max(row[4] for row in rows).strftime('%Y-%m-%d %H:%M:%S')
+        applied_rows += apply_records([[row[0], row[1], row[2], row[3] / 100] for row in rows], subjects, path, updated_at)
+        subjects = None
+
+    # 没有新增记录时也更新项目字典
+    if subjects is not None and os.path.exists(meta_path):
+        apply_records([], subjects, path)
+
+    print(f"财务数据立方体更新完毕，写入 { applied_rows } 条记录，用时 {time.perf_counter() - started_at:.2f} 秒")
+
+    return applied_rows
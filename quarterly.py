@@ -0,0 +1,268 @@
+import json
+import os
+import time
+
+import numpy
+
+import panel
+
+
+# 派生数据的保存目录
+QUARTERLY_DIR = 'quarterly'
+# 派生数据元数据文件：数据形状、容量及已处理的立方体版本号
+QUARTERLY_META_FILE = 'meta.json'
+# 需要派生的报表类型：利润表、现金流量表均为年初至报告期末的累计数
+DERIVED_STATEMENT_TYPES = ('PS', 'CF')
+# 派生数据的名称及数据文件
+SERIES_FILES = {
+    '单季': 'single_quarter.f8',
+    'TTM': 'ttm.f8',
+    '同比': 'yoy.f8',
+    '环比': 'qoq.f8',
+}
+# 每次处理的公司数量，控制读取立方体时占用的内存
+CHUNK_SIZE = 256
+
+
+class _QuarterCalendar:
+    """ 报告日期轴上各季度之间的对应关系
+
+    报告日期按 年 × 4 + 季度序号 编号，非季度末的报告日期不参与派生；
+    各对应关系为报告期在日期轴中的位置，不存在时为 len(报告日期轴)，指向读取数据时追加的 NaN 列，
+    各数组末尾也追加了对应 NaN 列的一项
+    """
+
+    def __init__(self, report_dates):
+        months = report_dates.astype('datetime64[M]')
+        month_numbers = months.astype(numpy.int64) % 12 + 1
+        month_ends = (months + 1).astype('datetime64[D]') - 1 == report_dates
+        self.missing = len(report_dates)
+        self.valid = numpy.append(month_ends & (month_numbers % 3 == 0), False)
+        self.quarters = numpy.append(month_numbers // 3, 0)
+        # NaN 列的编号远离任何报告期，前后推移后仍不存在
+        self.keys = numpy.append((months.astype(numpy.int64) // 12 + 1970) * 4 + month_numbers // 3 - 1, -10 ** 6)
+        self._positions = {int(key): j for j, key in enumerate(self.keys) if self.valid[j]}
+
+    def positions(self, keys):
+        """ 返回季度编号对应的报告期位置 """
+        return numpy.array([self._positions.get(int(key), self.missing) for key in keys], dtype=numpy.int64)
+
+    def shift(self, columns, quarters):
+        """ 返回 columns 前后 quarters 个季度的报告期位置 """
+        return self.positions(self.keys[numpy.asarray(columns, dtype=numpy.int64)] + quarters)
+
+    def affected(self, changed_columns):
+        """ 返回各派生数据因 changed_columns 的原始数据变化而需要重算的报告期位置
+
+        单季：本季度及同年的下一季度；TTM：本季度、下一年同季度，第四季度变化时下一年的全部季度；
+        同比：单季受影响的季度及其下一年同季度；环比：单季受影响的季度及其下一季度
+        """
+
+        changed_columns = numpy.asarray(sorted(changed_columns), dtype=numpy.int64)
+
+        def existing(*column_lists):
+            columns = numpy.unique(numpy.concatenate([changed_columns[:0]] + list(column_lists)))
+            return columns[columns < self.missing]
+
+        next_quarters = self.shift(changed_columns, 1)
+        next_in_year = next_quarters[self.quarters[changed_columns] < 4]
+        single_quarter = existing(changed_columns, next_in_year)
+        fourth_quarters = changed_columns[self.quarters[changed_columns] == 4]
+        next_years = [self.shift(fourth_quarters, quarters) for quarters in (1, 2, 3, 4)]
+        ttm = existing(changed_columns, self.shift(changed_columns, 4), *next_years)
+
+        return {
+            '单季': single_quarter,
+            'TTM': ttm,
+            '同比': existing(single_quarter, self.shift(single_quarter, 4)),
+            '环比': existing(single_quarter, self.shift(single_quarter, 1)),
+        }
+
+
+def _single_quarter(ytd, calendar, columns):
+    """ 由累计数计算单季数：第一季度为累计数，其余季度为本季度累计数减上一季度累计数 """
+
+    first_quarters = calendar.quarters[columns] == 1
+    values = ytd[:, :, columns] - numpy.where(first_quarters, 0.0, ytd[:, :, calendar.shift(columns, -1)])
+    # 非季度末的报告期及 NaN 列
+    values[:, :, ~calendar.valid[columns]] = numpy.nan
+
+    return values
+
+
+def _ttm(ytd, calendar, columns):
+    """ 计算滚动 12 个月数：本期累计数 + 上年年度数 - 上年同期累计数，第四季度为年度数 """
+
+    annual = calendar.positions(calendar.keys[columns] - calendar.quarters[columns])
+    values = ytd[:, :, columns] + ytd[:, :, annual] - ytd[:, :, calendar.shift(columns, -4)]
+    fourth_quarters = calendar.quarters[columns] == 4
+    values[:, :, fourth_quarters] = ytd[:, :, columns[fourth_quarters]]
+    values[:, :, ~calendar.valid[columns]] = numpy.nan
+
+    return values
+
+
+def _growth(current, previous):
+    """ 计算增长率：(本期 - 比较期) / |比较期|，比较期为 0 或无数据时为 NaN """
+
+    base = numpy.abs(previous)
+    return (current - previous) / numpy.where(base == 0, numpy.nan, base)
+
+
+def _derive(ytd, calendar, affected):
+    """ 计算一批公司各派生数据受影响报告期的值
+
+    参数
+    ----------
+    ytd: numpy.ndarray
+        形状为 (公司数, 项目数, 报告期数 + 1) 的累计数，最后一列为 NaN 列
+    calendar: _QuarterCalendar
+        报告日期轴的季度对应关系
+    affected: dict
+        _QuarterCalendar.affected() 返回的各派生数据需要重算的报告期位置
+
+    返回值
+    -------
+    dict
+        格式为：{派生数据名称: 形状为 (公司数, 项目数, 受影响的报告期数) 的数据}
+    """
+
+    results = {}
+    results['单季'] = _single_quarter(ytd, calendar, affected['单季'])
+    results['TTM'] = _ttm(ytd, calendar, affected['TTM'])
+    columns = affected['同比']
+    results['同比'] = _growth(_single_quarter(ytd, calendar, columns), _single_quarter(ytd, calendar, calendar.shift(columns, -4)))
+    columns = affected['环比']
+    results['环比'] = _growth(_single_quarter(ytd, calendar, columns), _single_quarter(ytd, calendar, calendar.shift(columns, -1)))
+
+    return results
+
+
+def _load_meta(path):
+    """ 读取派生数据的元数据 """
+
+    with open(os.path.join(path, QUARTERLY_META_FILE), 'r', encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+
+def refresh_quarterly(panel_path=panel.PANEL_DIR, path=QUARTERLY_DIR):
+    """ 由财务数据立方体计算利润表、现金流量表项目的单季、TTM、同比、环比数据
+
+    只重算上次计算之后立方体中有新写入数据的报告期及受其影响的报告期；
+    新的公司、项目、报告期在预留的容量内追加，已有的轴有变化或超出容量时全部重新计算
+
+    参数
+    ----------
+    panel_path: str
+        财务数据立方体的保存目录
+    path: str
+        派生数据的保存目录
+
+    返回值
+    -------
+    int
+        重算的报告期数量（各派生数据合计）
+    """
+
+    started_at = time.perf_counter()
+    financial_panel = panel.open_panel(panel_path)
+    try:
+        ''' 选出利润表、现金流量表项目 '''
+        subject_positions = [j for j, subject_id in enumerate(financial_panel.subject_ids)
+                             if financial_panel.subjects.get(int(subject_id), [''])[0] in DERIVED_STATEMENT_TYPES]
+        subject_ids = financial_panel.subject_ids[subject_positions]
+        com_codes = financial_panel.com_codes
+        report_dates = financial_panel.report_dates
+        shape = [len(com_codes), len(subject_ids), len(report_dates)]
+        calendar = _QuarterCalendar(report_dates)
+        if 0 in shape:
+            print("财务数据立方体中没有利润表、现金流量表数据")
+            return 0
+
+        ''' 已有各轴为新轴的前段且未超出容量时，只重算有新数据的报告期，否则全部重新计算 '''
+        os.makedirs(path, exist_ok=True)
+        meta = _load_meta(path) if os.path.exists(os.path.join(path, QUARTERLY_META_FILE)) else None
+        incremental = meta is not None and all(shape[axis] <= meta['capacity'][axis] for axis in range(3))
+        if incremental:
+            old_shape = meta['shape']
+            incremental = (
+                numpy.array_equal(numpy.load(os.path.join(path, panel.COM_CODES_FILE)), com_codes[:old_shape[0]])
+                and numpy.array_equal(numpy.load(os.path.join(path, panel.SUBJECT_IDS_FILE)), subject_ids[:old_shape[1]])
+                and numpy.array_equal(numpy.load(os.path.join(path, panel.REPORT_DATES_FILE)), report_dates[:old_shape[2]]))
+        if incremental:
+            # 新增的公司、项目、报告期写入时均会记录版本号，因此同样包含在内
+            capacity = meta['capacity']
+            date_versions = financial_panel.meta.get('date_versions', {})
+            changed_columns = [j for j, report_date in enumerate(report_dates.astype(str))
+                               if j >= old_shape[2] or date_versions.get(report_date, 0) > meta['panel_version']]
+            storages = {name: numpy.memmap(os.path.join(path, file_name), dtype=numpy.float64, mode='r+', shape=tuple(capacity))
+                        for name, file_name in SERIES_FILES.items()}
+        else:
+            capacity = [panel.grow_capacity(shape[axis], 0, panel.MIN_CAPACITY[axis]) for axis in range(3)]
+            changed_columns = list(range(shape[2]))
+            # 先写入临时文件，全部计算完毕后再替换
+            storages = {name: panel.create_values_file(os.path.join(path, file_name + '.tmp'), tuple(capacity))
+                        for name, file_name in SERIES_FILES.items()}
+        outputs = {name: storage[:shape[0], :shape[1], :shape[2]] for name, storage in storages.items()}
+        affected = calendar.affected(changed_columns)
+
+        ''' 按公司分批读取累计数，计算并写入受影响的报告期 '''
+        if changed_columns and shape[1]:
+            for start in range(0, shape[0], CHUNK_SIZE):
+                chunk = financial_panel.values[start:start + CHUNK_SIZE][:, subject_positions, :]
+                ytd = numpy.concatenate([chunk, numpy.full(chunk.shape[:2] + (1,), numpy.nan)], axis=2)
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    results = _derive(ytd, calendar, affected)
+                for name, values in results.items():
+                    outputs[name][start:start + CHUNK_SIZE][:, :, affected[name]] = values
+        for name in SERIES_FILES:
+            storages[name].flush()
+        # 释放内存映射后才能替换数据文件
+        storages = outputs = None
+
+        ''' 保存数据、索引文件，最后保存元数据 '''
+        if not incremental:
+            for file_name in SERIES_FILES.values():
+                os.replace(os.path.join(path, file_name + '.tmp'), os.path.join(path, file_name))
+        panel.save_array(os.path.join(path, panel.COM_CODES_FILE), com_codes)
+        panel.save_array(os.path.join(path, panel.SUBJECT_IDS_FILE), subject_ids)
+        panel.save_array(os.path.join(path, panel.REPORT_DATES_FILE), report_dates)
+        panel.save_json(os.path.join(path, QUARTERLY_META_FILE), {
+            'shape': shape,
+            'capacity': capacity,
+            'panel_version': financial_panel.meta.get('version', 0),
+            'computed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+    finally:
+        financial_panel.close()
+
+    recomputed_columns = sum(len(columns) for columns in affected.values())
+    print(f"单季、TTM、同比、环比数据计算完毕，重算 { recomputed_columns } 个报告期，用时 {time.perf_counter() - started_at:.2f} 秒")
+
+    return recomputed_columns
+
+
+def load_quarterly(path=QUARTERLY_DIR):
+    """ 以内存映射方式读取派生数据
+
+    参数
+    ----------
+    path: str
+        派生数据的保存目录
+
+    返回值
+    -------
+    list
+        [{派生数据名称: 形状为 (公司数, 项目数, 报告期数) 的 numpy.memmap}, 公司代码轴, 项目编号轴, 报告日期轴]
+    """
+
+    meta = _load_meta(path)
+    shape = meta['shape']
+    # 数据文件按容量分配，只映射已使用的部分
+    series = {name: numpy.memmap(os.path.join(path, file_name), dtype=numpy.float64, mode='r', shape=tuple(meta['capacity']))[:shape[0], :shape[1], :shape[2]]
+              for name, file_name in SERIES_FILES.items()}
+    com_codes = numpy.load(os.path.join(path, panel.COM_CODES_FILE))[:shape[0]]
+    subject_ids = numpy.load(os.path.join(path, panel.SUBJECT_IDS_FILE))[:shape[1]]
+    report_dates = numpy.load(os.path.join(path, panel.REPORT_DATES_FILE))[:shape[2]]
+
+    return [series, com_codes, subject_ids, report_dates]
@@ -0,0 +1,234 @@
+import json
+import os
+import time
+
+import numpy
+
+import panel
+import subjects
+
+
+# 财务比率的保存目录
+RATIOS_DIR = 'ratios'
+# 财务比率元数据文件：比率名称、公司代码及报告日期轴
+RATIOS_META_FILE = 'meta.json'
+
+# 计算财务比率所需的项目，格式为：{项目简称: [(报表类型, 项目名称), ...]}，
+# 各数据来源、各类企业的报表中项目名称不同，按顺序取第一个有数据的项目
+RATIO_SUBJECTS = {
+    '营业收入': [('PS', '营业收入'), ('PS', '营业总收入')],
+    # 营业总成本含期间费用等，不能代替营业成本计算毛利率，没有营业成本的报表（如金融企业）毛利率为 NaN
+    '营业成本': [('PS', '营业成本')],
+    '净利润': [('PS', '净利润')],
+    '资产总计': [('BS', '资产总计'), ('BS', '资产合计')],
+    '负债合计': [('BS', '负债合计')],
+    '股东权益': [('BS', '所有者权益(或股东权益)合计'), ('BS', '股东权益合计'), ('BS', '所有者权益合计')],
+    '流动资产': [('BS', '流动资产合计')],
+    '流动负债': [('BS', '流动负债合计')],
+    '经营现金流量净额': [('CF', '经营活动产生的现金流量净额')],
+}
+
+# 财务比率目录，格式为：{比率名称: (运算符, 运算数, 运算数)} 或 {比率名称: ('同比', 运算数)}，
+# 运算数为 RATIO_SUBJECTS 中的项目简称、其他比率的名称或嵌套的运算
+# 利润表、现金流量表为年初至报告期末的累计数，比率未年化；资产负债表项目取期末数
+RATIOS = {
+    'ROE': ('/', '净利润', '股东权益'),
+    'ROA': ('/', '净利润', '资产总计'),
+    '毛利率': ('/', ('-', '营业收入', '营业成本'), '营业收入'),
+    '净利率': ('/', '净利润', '营业收入'),
+    '流动比率': ('/', '流动资产', '流动负债'),
+    '资产负债率': ('/', '负债合计', '资产总计'),
+    '现金转换率': ('/', '经营现金流量净额', '净利润'),
+    # 杜邦分析：ROE = 净利率 × 总资产周转率 × 权益乘数
+    '总资产周转率': ('/', '营业收入', '资产总计'),
+    '权益乘数': ('/', '资产总计', '股东权益'),
+    '杜邦ROE': ('*', ('*', '净利率', '总资产周转率'), '权益乘数'),
+    # 与上年同期相比的增长率
+    '营业收入增长率': ('同比', '营业收入'),
+    '净利润增长率': ('同比', '净利润'),
+}
+
+# 运算符对应的函数，除数为 0 时结果为 NaN
+_OPERATORS = {
+    '+': numpy.add,
+    '-': numpy.subtract,
+    '*': numpy.multiply,
+    '/': lambda a, b: numpy.divide(a, numpy.where(b == 0, numpy.nan, b)),
+}
+
+
+def year_over_year(values, report_dates):
+    """ 计算与上年同期相比的增长率：(本期 - 上年同期) / |上年同期|
+
+    参数
+    ----------
+    values: numpy.ndarray
+        形状为 (公司数, 报告期数) 的数据
+    report_dates: numpy.ndarray
+        报告日期轴（datetime64[D]，从早到晚排列）
+
+    返回值
+    -------
+    growth: numpy.ndarray
+        形状与 values 相同，无上年同期数据或上年同期为 0 时为 NaN
+    """
+
+    # 上年同期的报告日期及其在日期轴中的位置
+    months = report_dates.astype('datetime64[M]')
+    previous_dates = (months - 12).astype('datetime64[D]') + (report_dates - months.astype('datetime64[D]'))
+    positions = numpy.searchsorted(report_dates, previous_dates)
+    found = positions < len(report_dates)
+    found[found] = report_dates[positions[found]] == previous_dates[found]
+
+    growth = numpy.full(values.shape, numpy.nan)
+    previous = numpy.abs(values[:, positions[found]])
+    growth[:, found] = (values[:, found] - values[:, positions[found]]) / numpy.where(previous == 0, numpy.nan, previous)
+
+    return growth
+
+
+def get_subject_values(financial_panel, subject_key):
+    """ 从财务数据立方体中取出项目的 公司 × 报告日期 数据
+
+    参数
+    ----------
+    financial_panel: panel.Panel
+        财务数据立方体
+    subject_key: str
+        RATIO_SUBJECTS 中的项目简称
+
+    返回值
+    -------
+    values: numpy.ndarray
+        形状为 (公司数, 报告期数) 的数据，按 RATIO_SUBJECTS 中的顺序取第一个有数据的项目，均无数据时为 NaN
+    """
+
+    values = numpy.full((len(financial_panel.com_codes), len(financial_panel.report_dates)), numpy.nan)
+    for statement_type, subject_name in RATIO_SUBJECTS[subject_key]:
+        subject_id = financial_panel.find_subject(statement_type, subjects.normalize_subject_name(subject_name))
+        if subject_id is None or subject_id not in financial_panel.subject_id_index:
+            continue
+        candidate = financial_panel.get(subject_id=subject_id)
+        values = numpy.where(numpy.isnan(values), candidate, values)
+
+    return values
+
+
+def compute_ratios(financial_panel, ratio_names=None):
+    """ 对全部公司、全部报告期一次性计算财务比率
+
+    参数
+    ----------
+    financial_panel: panel.Panel
+        财务数据立方体
+    ratio_names: list
+        需要计算的比率名称，为 None 时计算 RATIOS 中的全部比率
+
+    返回值
+    -------
+    results: dict
+        格式为：{比率名称: 形状为 (公司数, 报告期数) 的 numpy.ndarray}，无法计算的位置为 NaN
+    """
+
+    # 已取出的项目及已计算的比率，被多个比率引用时只计算一次
+    operands = {}
+
+    def evaluate(expression):
+        """ 计算运算数或运算 """
+        if isinstance(expression, tuple) and expression[0] == '同比':
+            return year_over_year(evaluate(expression[1]), financial_panel.report_dates)
+        if isinstance(expression, tuple):
+            operator, left, right = expression
+            return _OPERATORS[operator](evaluate(left), evaluate(right))
+        if expression not in operands:
+            if expression in RATIOS:
+                operands[expression] = evaluate(RATIOS[expression])
+            else:
+                operands[expression] = get_subject_values(financial_panel, expression)
+        return operands[expression]
+
+    results = {}
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        for ratio_name in ratio_names or RATIOS:
+            results[ratio_name] = evaluate(ratio_name)
+
+    return results
+
+
+def save_ratios(results, financial_panel, path=RATIOS_DIR):
+    """ 保存财务比率，每个比率保存为一个 .npy 文件，元数据最后保存
+
+    参数
+    ----------
+    results: dict
+        compute_ratios() 返回的财务比率
+    financial_panel: panel.Panel
+        计算比率所用的财务数据立方体，提供公司代码及报告日期轴
+    path: str
+        财务比率的保存目录
+    """
+
+    os.makedirs(path, exist_ok=True)
+    files = {}
+    for index, (ratio_name, values) in enumerate(results.items()):
+        # 比率名称含中文，文件名使用序号
+        files[ratio_name] = 'ratio_' + str(index) + '.npy'
+        panel.save_array(os.path.join(path, files[ratio_name]), values)
+    panel.save_array(os.path.join(path, panel.COM_CODES_FILE), financial_panel.com_codes)
+    panel.save_array(os.path.join(path, panel.REPORT_DATES_FILE), financial_panel.report_dates)
+    panel.save_json(os.path.join(path, RATIOS_META_FILE), {
+        'files': files,
+        'computed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'panel_updated_at': financial_panel.meta['updated_at'],
+    })
+
+
+def load_ratios(path=RATIOS_DIR):
+    """ 以内存映射方式读取已保存的财务比率
+
+    参数
+    ----------
+    path: str
+        财务比率的保存目录
+
+    返回值
+    -------
+    list
+        [{比率名称: 形状为 (公司数, 报告期数) 的 numpy.ndarray}, 公司代码轴, 报告日期轴]
+    """
+
+    with open(os.path.join(path, RATIOS_META_FILE), 'r', encoding='utf-8') as meta_file:
+        meta = json.load(meta_file)
+    results = {ratio_name: numpy.load(os.path.join(path, file_name), mmap_mode='r') for ratio_name, file_name in meta['files'].items()}
+    com_codes = numpy.load(os.path.join(path, panel.COM_CODES_FILE))
+    report_dates = numpy.load(os.path.join(path, panel.REPORT_DATES_FILE))
+
+    return [results, com_codes, report_dates]
+
+
+def refresh_ratios(panel_path=panel.PANEL_DIR, path=RATIOS_DIR):
+    """ 由财务数据立方体重新计算并保存全部财务比率
+
+    参数
+    ----------
+    panel_path: str
+        财务数据立方体的保存目录
+    path: str
+        财务比率的保存目录
+
+    返回值
+    -------
+    results: dict
+        compute_ratios() 返回的财务比率
+    """
+
+    started_at = time.perf_counter()
+    financial_panel = panel.open_panel(panel_path)
+    try:
+        results = compute_ratios(financial_panel)
+        save_ratios(results, financial_panel, path)
+    finally:
+        financial_panel.close()
+    print(f"财务比率计算完毕，共 { len(results) } 个比率，用时 {time.perf_counter() - started_at:.2f} 秒")
+
+    return results
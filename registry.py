@@ -0,0 +1,183 @@
+import json
+import os
+import re
+import time
+
+import downloader
+
+
+# 公司代码登记簿文件，格式为：{公司代码: {'status': 状态, 'checked_at': 检查时间}}
+REGISTRY_FILE = 'company_registry.json'
+# 旧版手工维护的不存在的公司代码清单，首次使用登记簿时导入
+NOT_EXIST_LIST_FILE = 'not_exist_list.txt'
+
+# 公司代码状态：存在、不存在
+VALID = 'valid'
+MISSING = 'missing'
+# 各状态的有效期（秒），超过有效期的公司代码在刷新时重新检查
+STATUS_TTL = {
+    VALID: 90 * 24 * 60 * 60,
+    MISSING: 7 * 24 * 60 * 60,
+}
+
+# 各板块的公司代码范围，格式为：{板块编号: [板块名称, [(起始代码, 结束代码), ...]]}
+BOARDS = {
+    '1': ['创业板', [(300001, 301999)]],
+    '2': ['科创板', [(688001, 689999)]],
+    '3': ['深市主板', [(1, 1999)]],
+    '4': ['中小板', [(2001, 2999)]],
+    '5': ['沪市主板', [(600000, 601999), (603000, 603999), (605000, 605999)]],
+}
+
+# 检查公司代码是否存在时使用的新浪财经行情接口，每次请求查询的公司代码数量
+PROBE_URL = 'http://hq.sinajs.cn/list='
+PROBE_BATCH_SIZE = 100
+# 行情接口返回的单个公司的数据，不存在的公司代码返回空字符串
+_PROBE_PATTERN = re.compile(rb'hq_str_(?:sh|sz)(\d{6})="([^"]*)"')
+
+
+def load_registry(path=REGISTRY_FILE):
+    """ 读取公司代码登记簿，登记簿不存在时导入 not_exist_list.txt 中的公司代码
+
+    参数
+    ----------
+    path: str
+        登记簿文件路径
+
+    返回值
+    -------
+    registry: dict
+        格式为：{公司代码: {'status': 状态, 'checked_at': 检查时间}}
+    """
+
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as registry_file:
+            return json.load(registry_file)
+
+    registry = {}
+    if os.path.exists(NOT_EXIST_LIST_FILE):
+        now = time.time()
+        with open(NOT_EXIST_LIST_FILE, 'r') as filetxt:
+            for line in filetxt.readlines():
+                com_code = line.strip()
+                if com_code:
+                    registry[com_code] = {'status': MISSING, 'checked_at': now}
+
+    return registry
+
+
+def save_registry(registry, path=REGISTRY_FILE):
+    """ 保存公司代码登记簿，先写入临时文件再改名，避免中断时损坏登记簿 """
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as registry_file:
+        json.dump(registry, registry_file, ensure_ascii=False, indent=0, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def get_board_codes(board_code):
+    """ 返回板块的全部候选公司代码
+
+    参数
+    ----------
+    board_code: str
+        BOARDS 中的板块编号
+
+    返回值
+    -------
+    list
+        6 位公司代码的列表
+    """
+
+    return ['%06d' % com_code for start, end in BOARDS[board_code][1] for com_code in range(start, end + 1)]
+
+
+def get_status(registry, com_code, now=None):
+    """ 返回公司代码在有效期内的状态，未登记或已过期时返回 None """
+
+    entry = registry.get(com_code)
+    if entry is None:
+        return None
+    if (now or time.time()) - entry['checked_at'] > STATUS_TTL[entry['status']]:
+        return None
+
+    return entry['status']
+
+
+def is_missing(registry, com_code):
+    """ 判断公司代码是否确认不存在（有效期内） """
+
+    return get_status(registry, com_code) == MISSING
+
+
+def _parse_probe(com_code, statement_type_code, page_content):
+    """ 解析行情接口的返回内容，返回 {公司代码: 是否存在} """
+
+    return {code.decode(): bool(data) for code, data in _PROBE_PATTERN.findall(page_content)}
+
+
+def refresh_registry(registry, com_codes, concurrency=downloader.DEFAULT_CONCURRENCY):
+    """ 检查未登记或状态已过期的公司代码是否存在，并更新、保存登记簿
+
+    通过新浪财经行情接口批量查询，每次请求查询 PROBE_BATCH_SIZE 个公司代码，请求速率由 downloader.HOST_RATE_LIMITS 控制
+
+    参数
+    ----------
+    registry: dict
+        load_registry() 返回的登记簿
+    com_codes: list
+        待检查的公司代码
+    concurrency: int
+        同时进行的请求数量上限
+
+    返回值
+    -------
+    problem_list: list
+        查询失败的批次，列表格式为：["批次首个公司代码 probe", ...]
+    """
+
+    now = time.time()
+    stale_codes = [com_code for com_code in com_codes if get_status(registry, com_code, now) is None]
+    if not stale_codes:
+        return []
+    print("开始检查" + str(len(stale_codes)) + "个公司代码...")
+
+    ''' 生成查询任务，沪市公司代码以 sh 开头，深市公司代码以 sz 开头 '''
+    task_list = []
+    for i in range(0, len(stale_codes), PROBE_BATCH_SIZE):
+        batch = stale_codes[i:i + PROBE_BATCH_SIZE]
+        symbols = [('sh' if com_code[0] == '6' else 'sz') + com_code for com_code in batch]
+        task_list.append([batch[0], 'probe', PROBE_URL + ','.join(symbols), _parse_probe])
+
+    def handle_result(com_code, statement_type_code, result):
+        """ 更新登记簿 """
+        checked_at = time.time()
+        for code, listed in result.items():
+            registry[code] = {'status': VALID if listed else MISSING, 'checked_at': checked_at}
+
+    # 查询结果的解析很快，在下载线程中解析，不启动解析进程
+    problem_list = downloader.run_download(task_list, handle_result, concurrency, parse_workers=0)
+    save_registry(registry)
+    print("公司代码检查完毕！")
+
+    return problem_list
+
+
+def get_listed_codes(registry, com_codes):
+    """ 去除 com_codes 中确认不存在的公司代码
+
+    参数
+    ----------
+    registry: dict
+        load_registry() 返回的登记簿
+    com_codes: list
+        候选的公司代码
+
+    返回值
+    -------
+    list
+        未确认不存在的公司代码
+    """
+
+    now = time.time()
+    return [com_code for com_code in com_codes if get_status(registry, com_code, now) != MISSING]
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy
+
+import panel
+import ratios
+import registry
+
+
+# 筛选索引的保存目录
+SCREENING_DIR = 'screening'
+# 筛选索引元数据文件：各指标的文件名及各报告期数据的摘要
+SCREENING_META_FILE = 'meta.json'
+
+# 筛选条件支持的比较方式
+OPERATORS = ('>', '>=', '<', '<=', '==', 'between')
+
+
+def _column_digest(column):
+    """ 返回单个报告期数据的摘要，用于判断该报告期的索引是否需要重建 """
+    return hashlib.sha1(numpy.ascontiguousarray(column).tobytes()).hexdigest()
+
+
+def _load_meta(path):
+    """ 读取筛选索引的元数据 """
+
+    with open(os.path.join(path, SCREENING_META_FILE), 'r', encoding='utf-8') as meta_file:
+        return json.load(meta_file)
+
+
+def build_indexes(results, com_codes, report_dates, path=SCREENING_DIR):
+    """ 为每个指标的每个报告期建立按值排序的索引，只重建数据有变化的报告期
+
+    索引保存为两个 .npy 文件：排序后的值（NaN 排在末尾）及对应的公司位置，每列为一个报告期；
+    公司代码轴或报告日期轴与已有索引不同时，该指标的全部报告期重建
+
+    参数
+    ----------
+    results: dict
+        ratios.compute_ratios() 或 ratios.load_ratios() 返回的指标数据，格式为：{指标名称: 形状为 (公司数, 报告期数) 的数据}
+    com_codes: numpy.ndarray
+        公司代码轴
+    report_dates: numpy.ndarray
+        报告日期轴
+    path: str
+        筛选索引的保存目录
+
+    返回值
+    -------
+    int
+        重建索引的报告期数量（各指标合计）
+    """
+
+    os.makedirs(path, exist_ok=True)
+    meta_path = os.path.join(path, SCREENING_META_FILE)
+    meta = _load_meta(path) if os.path.exists(meta_path) else {'metrics': {}}
+    # 轴不同时已有索引的列与数据的列不对应，不能沿用
+    same_axes = (os.path.exists(os.path.join(path, panel.COM_CODES_FILE))
+                 and numpy.array_equal(numpy.load(os.path.join(path, panel.COM_CODES_FILE)), com_codes)
+                 and numpy.array_equal(numpy.load(os.path.join(path, panel.REPORT_DATES_FILE)), report_dates))
+
+    rebuilt_columns = 0
+    metrics = {}
+    for metric_name, values in results.items():
+        # 指标名称含中文，文件名使用名称的摘要，指标增减时各指标的文件名不变
+        file_key = 'metric_' + hashlib.sha1(metric_name.encode('utf-8')).hexdigest()[:12]
+        files = {'values': file_key + '_values.npy', 'order': file_key + '_order.npy'}
+        digests = [_column_digest(values[:, j]) for j in range(values.shape[1])]
+        old = meta['metrics'].get(metric_name)
+        if same_axes and old is not None:
+            sorted_values = numpy.load(os.path.join(path, old['files']['values']))
+            order = numpy.load(os.path.join(path, old['files']['order']))
+            changed = [j for j in range(len(digests)) if digests[j] != old['digests'][j]]
+        else:
+            sorted_values = numpy.empty(values.shape, dtype=numpy.float64)
+            order = numpy.empty(values.shape, dtype=numpy.int32)
+            changed = list(range(len(digests)))
+
+        ''' 只对数据有变化的报告期排序 '''
+        if changed:
+            column_order = numpy.argsort(values[:, changed], axis=0, kind='stable')
+            order[:, changed] = column_order
+            sorted_values[:, changed] = numpy.take_along_axis(values[:, changed], column_order, axis=0)
+            panel.save_array(os.path.join(path, files['values']), sorted_values)
+            panel.save_array(os.path.join(path, files['order']), order)
+        rebuilt_columns += len(changed)
+        metrics[metric_name] = {
+            'files': files,
+            'digests': digests,
+            # 各报告期有数据的公司数量，排序后的前 count 个值有效
+            'counts': numpy.count_nonzero(~numpy.isnan(values), axis=0).tolist(),
+        }
+
+    panel.save_array(os.path.join(path, panel.COM_CODES_FILE), com_codes)
+    panel.save_array(os.path.join(path, panel.REPORT_DATES_FILE), report_dates)
+    panel.save_json(meta_path, {'metrics': metrics, 'built_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+    return rebuilt_columns
+
+
+def refresh_indexes(ratios_path=ratios.RATIOS_DIR, path=SCREENING_DIR):
+    """ 由已保存的财务比率更新筛选索引
+
+    参数
+    ----------
+    ratios_path: str
+        财务比率的保存目录
+    path: str
+        筛选索引的保存目录
+    """
+
+    started_at = time.perf_counter()
+    results, com_codes, report_dates = ratios.load_ratios(ratios_path)
+    rebuilt_columns = build_indexes(results, com_codes, report_dates, path)
+    print(f"筛选索引更新完毕，重建 { rebuilt_columns } 个报告期的索引，用时 {time.perf_counter() - started_at:.2f} 秒")
+
+
+class Screener:
+    """ 按财务指标筛选公司
+
+    每个筛选条件在对应指标、报告期的排序索引上二分查找，得到满足条件的公司位置，多个条件取交集
+
+    参数
+    ----------
+    path: str
+        筛选索引的保存目录
+    """
+
+    def __init__(self, path=SCREENING_DIR):
+        meta = _load_meta(path)
+        self.com_codes = numpy.load(os.path.join(path, panel.COM_CODES_FILE))
+        self.report_dates = numpy.load(os.path.join(path, panel.REPORT_DATES_FILE))
+        self.metrics = {}
+        for metric_name, metric in meta['metrics'].items():
+            self.metrics[metric_name] = [
+                numpy.load(os.path.join(path, metric['files']['values']), mmap_mode='r'),
+                numpy.load(os.path.join(path, metric['files']['order']), mmap_mode='r'),
+                metric['counts'],
+            ]
+        self._code_numbers = self.com_codes.astype(numpy.int64)
+
+    def match(self, metric_name, operator, value, report_date):
+        """ 返回满足单个筛选条件的公司位置（已排序）
+
+        参数
+        ----------
+        metric_name: str
+            指标名称
+        operator: str
+            比较方式：'>'、'>='、'<'、'<='、'==' 或 'between'（value 为 (下限, 上限)，包含两端）
+        value: float 或 tuple
+            比较的值
+        report_date: str 或 datetime.date
+            报告日期
+
+        返回值
+        -------
+        numpy.ndarray
+            满足条件的公司在公司代码轴中的位置
+        """
+
+        if operator not in OPERATORS:
+            raise ValueError("不支持的比较方式：" + operator)
+        sorted_values, order, counts = self.metrics[metric_name]
+        column = int(numpy.searchsorted(self.report_dates, numpy.datetime64(report_date, 'D')))
+        if column == len(self.report_dates) or self.report_dates[column] != numpy.datetime64(report_date, 'D'):
+            raise KeyError("无此报告期的数据：" + str(report_date))
+
+        # 只在有数据的部分查找，NaN 排在末尾
+        values = sorted_values[:counts[column], column]
+        if operator == '>':
+            start, end = numpy.searchsorted(values, value, 'right'), len(values)
+        elif operator == '>=':
+            start, end = numpy.searchsorted(values, value, 'left'), len(values)
+        elif operator == '<':
+            start, end = 0, numpy.searchsorted(values, value, 'left')
+        elif operator == '<=':
+            start, end = 0, numpy.searchsorted(values, value, 'right')
+        elif operator == '==':
+            start, end = numpy.searchsorted(values, value, 'left'), numpy.searchsorted(values, value, 'right')
+        else:
+            start, end = numpy.searchsorted(values, value[0], 'left'), numpy.searchsorted(values, value[1], 'right')
+
+        return numpy.sort(order[start:end, column])
+
+    def board_positions(self, board_code):
+        """ 返回属于 registry.BOARDS 中指定板块的公司位置（已排序） """
+
+        in_board = numpy.zeros(len(self.com_codes), dtype=bool)
+        for start, end in registry.BOARDS[board_code][1]:
+            in_board |= (self._code_numbers >= start) & (self._code_numbers <= end)
+
+        return numpy.flatnonzero(in_board)
+
+    def screen(self, conditions, report_date, board_code=None):
+        """ 按多个条件筛选公司
+
+        参数
+        ----------
+        conditions: list
+            筛选条件，列表格式为：[(指标名称, 比较方式, 值), ...]，如 [('毛利率', '>', 0.4), ('营业收入增长率', '>', 0.3)]
+        report_date: str 或 datetime.date
+            报告日期
+        board_code: str
+            registry.BOARDS 中的板块编号，为 None 时不限板块
+
+        返回值
+        -------
+        list
+            满足全部条件的公司代码
+        """
+
+        matches = [self.match(metric_name, operator, value, report_date) for metric_name, operator, value in conditions]
+        if board_code is not None:
+            matches.append(self.board_positions(board_code))
+        if not matches:
+            return self.com_codes.tolist()
+
+        # 从满足条件最少的结果开始取交集
+        matches.sort(key=len)
+        positions = matches[0]
+        for other in matches[1:]:
+            positions = numpy.intersect1d(positions, other, assume_unique=True)
+
+        return self.com_codes[positions].tolist()
+
+
+def screen(conditions, report_date, board_code=None, path=SCREENING_DIR):
+    """ 按多个条件筛选公司，参数及返回值与 Screener.screen() 相同 """
+
+    return Screener(path).screen(conditions, report_date, board_code)
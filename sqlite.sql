@@ -0,0 +1,108 @@
+-- SQLite 存储后端的数据库结构，与 mysql.sql 的表、字段及主键相同
+-- 金额字段（值、发行价格等）以分为单位的整数保存，避免 SQLite 以浮点数保存小数
+-- 报告日期等日期字段以 'YYYY-MM-DD' 文字保存，声明为 date 类型，读取时转为 datetime.date
+
+
+-- Create subject_dictionary table
+CREATE TABLE IF NOT EXISTS subject_dictionary(
+  项目编号  INTEGER  PRIMARY KEY,
+  报表类型  TEXT  NOT NULL,
+  项目名称  TEXT  NOT NULL,
+  UNIQUE (报表类型, 项目名称)
+);
+
+
+-- Create financial_data table
+-- WITHOUT ROWID：与 InnoDB 相同，按主键聚簇存放，单个公司的数据连续存放
+CREATE TABLE IF NOT EXISTS financial_data(
+  公司代码  TEXT  NOT NULL,
+  报告日期  date  NOT NULL,
+  项目编号  INTEGER  NOT NULL,
+  值  INTEGER  NOT NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报告日期, 项目编号)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS 项目_日期 ON financial_data(项目编号, 报告日期, 值);
+CREATE INDEX IF NOT EXISTS 更新时间 ON financial_data(更新时间);
+
+
+-- Create statement_fingerprints table
+CREATE TABLE IF NOT EXISTS statement_fingerprints(
+  公司代码  TEXT  NOT NULL,
+  报表类型  TEXT  NOT NULL,
+  报告日期  date  NOT NULL,
+  指纹  TEXT  NOT NULL,
+  项目数  INTEGER  NOT NULL,
+  更新时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型, 报告日期)
+) WITHOUT ROWID;
+
+
+-- Create restatement_log table
+CREATE TABLE IF NOT EXISTS restatement_log(
+  公司代码  TEXT  NOT NULL,
+  报表类型  TEXT  NOT NULL,
+  报告日期  date  NOT NULL,
+  新指纹  TEXT  NOT NULL,
+  原指纹  TEXT  NOT NULL,
+  变动项目数  INTEGER  NOT NULL,
+  记录时间  timestamp  NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (公司代码, 报表类型, 报告日期, 新指纹)
+);
+CREATE INDEX IF NOT EXISTS 记录时间 ON restatement_log(记录时间);
+
+
+-- Create corporation_information table
+CREATE TABLE IF NOT EXISTS corporation_information(
+  "公司代码"  TEXT  NOT NULL,
+  "公司名称"  TEXT  NOT NULL,
+  "公司英文名称"  TEXT  NOT NULL,
+  "上市市场"  TEXT  NOT NULL,
+  "上市日期"  date  NOT NULL,
+  "发行价格"  INTEGER  NOT NULL,
+  "主承销商"  TEXT  NOT NULL,
+  "成立日期"  date  NOT NULL,
+  "注册资本(万元)"  INTEGER  NOT NULL,
+  "机构类型"  TEXT  NOT NULL,
+  "组织形式"  TEXT  NOT NULL,
+  "董事会秘书"  TEXT  NOT NULL,
+  "公司电话"  TEXT  NOT NULL,
+  "董秘电话"  TEXT  NOT NULL,
+  "公司传真"  TEXT  NOT NULL,
+  "董秘传真"  TEXT  NOT NULL,
+  "公司电子邮箱"  TEXT  NOT NULL,
+  "董秘电子邮箱"  TEXT  NOT NULL,
+  "公司网址"  TEXT  NOT NULL,
+  "邮政编码"  TEXT  NOT NULL,
+  "信息披露网址"  TEXT  NOT NULL,
+  "证券简称更名历史"  TEXT  NOT NULL,
+  "注册地址"  TEXT  NOT NULL,
+  "办公地址"  TEXT  NOT NULL,
+  "公司简介"  TEXT  NOT NULL,
+  "经营范围"  TEXT  NOT NULL,
+  PRIMARY KEY ("公司代码")
+);
+
+
+-- Create issue_information table
+CREATE TABLE IF NOT EXISTS issue_information(
+  "公司代码"  TEXT  NOT NULL,
+  "上市地"  TEXT  NOT NULL,
+  "主承销商"  TEXT  NOT NULL,
+  "承销方式"  TEXT  NOT NULL,
+  "上市推荐人"  TEXT  NOT NULL,
+  "每股发行价(元)"  INTEGER  NOT NULL,
+  "发行方式"  TEXT  NOT NULL,
+  "发行市盈率(按发行后总股本)"  INTEGER  NOT NULL,
+  "首发前总股本(万股)"  INTEGER  NOT NULL,
+  "首发后总股本(万股)"  INTEGER  NOT NULL,
+  "实际发行量(万股)"  INTEGER  NOT NULL,
+  "预计募集资金(万元)"  INTEGER  NOT NULL,
+  "实际募集资金合计(万元)"  INTEGER  NOT NULL,
+  "发行费用总额(万元)"  INTEGER  NOT NULL,
+  "募集资金净额(万元)"  INTEGER  NOT NULL,
+  "承销费用(万元)"  INTEGER  NOT NULL,
+  "招股公告日"  date  NOT NULL,
+  "上市日期"  date  NOT NULL,
+  PRIMARY KEY ("公司代码")
+);
@@ -0,0 +1,244 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import pandas
+
+import database
+import metrics
+import storage
+import subjects
+
+
+# SQLite 数据库结构文件（与本模块位于同一目录）
+SQLITE_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sqlite.sql')
+# 连接缓存的预编译语句数量：同一写入语句只编译一次，executemany() 对每条记录重复执行
+CACHED_STATEMENTS = 256
+# 打开数据库时设置的 PRAGMA：
+# WAL 日志模式下读取不阻塞写入，synchronous=NORMAL 时只在检查点同步磁盘（WAL 模式下断电不会损坏数据库，只可能丢失最后提交的事务），
+# 临时表及排序使用内存，页缓存为 64 MB
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+# 等待其他进程释放写锁的时间（秒）
+BUSY_TIMEOUT = 30.0
+# 含 更新时间 字段的表，主键重复更新记录时同时更新 更新时间（SQLite 没有 ON UPDATE CURRENT_TIMESTAMP）
+UPDATE_TIME_TABLES = ('financial_data', 'statement_fingerprints')
+
+# 日期以 'YYYY-MM-DD' 文字保存，声明为 date 类型的字段读取时转为 datetime.date
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_converter('date', lambda value: datetime.date.fromisoformat(value.decode()))
+
+
+def _quote(name):
+    """ 返回加双引号的字段名或表名（字段名中含有括号等字符） """
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteStorage(storage.StorageBackend):
+    """ 嵌入式 SQLite 存储后端，无需数据库服务器，数据库结构与 MySQL 相同（见 sqlite.sql）
+
+    单个数据库文件只能同时有一个写入事务，全部操作在一个连接上加锁执行；
+    写入语句合并在同一事务中，每执行 commit_interval 条语句或距上次提交超过 commit_seconds 秒时提交一次，
+    close() 时提交全部未提交的数据。金额以分为单位的整数保存，读取时无需转换
+
+    参数
+    ----------
+    config: dict
+        数据库配置，'path' 为数据库文件路径，'db' 为数据库名称（用于指标的数据来源）
+    commit_interval: int
+        累计执行多少条写入语句后提交一次事务
+    commit_seconds: float
+        距上次提交超过多少秒后，下一次写入时提交事务
+    """
+
+    def __init__(self, config, commit_interval=database.DEFAULT_COMMIT_INTERVAL, commit_seconds=database.DEFAULT_COMMIT_SECONDS):
+        self.config = config
+        self.commit_interval = commit_interval
+        self.commit_seconds = commit_seconds
+        self.connection = sqlite3.connect(config['path'], timeout=BUSY_TIMEOUT, detect_types=sqlite3.PARSE_DECLTYPES,
+                                          check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        for pragma in SQLITE_PRAGMAS:
+            self.connection.execute(pragma)
+        with open(SQLITE_SCHEMA_FILE, encoding='utf-8') as schema_file:
+            self.connection.executescript(schema_file.read())
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        # 项目字典的缓存，格式为：{(报表类型, 项目名称): 项目编号}
+        self._subject_ids = {}
+        self.closed = False
+
+    def _commit(self):
+        """ 提交事务（调用时应已加锁） """
+        if self._pending:
+            self.connection.commit()
+            self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def write_batch(self, writes, deletes=()):
+        """ 在同一事务中删除、写入记录，参数与 storage.StorageBackend.write_batch() 相同
+
+        主键重复时以 INSERT ... ON CONFLICT DO UPDATE 更新其余字段，含 更新时间 字段的表同时更新 更新时间
+        """
+
+        if self.closed:
+            raise RuntimeError("数据库写入器已关闭")
+
+        statements = []
+        for table_name, key_fields, keys in deletes:
+            statements.append((f"DELETE FROM { _quote(table_name) } WHERE " + ' AND '.join(f"{ _quote(field) } = ?" for field in key_fields), keys))
+        for table_name, fields, rows, key_fields, cents_fields in writes:
+            sql = (f"INSERT INTO { _quote(table_name) }({ ', '.join(_quote(field) for field in fields) }) "
+                   f"VALUES ({ ', '.join(['?'] * len(fields)) })")
+            if key_fields is not None:
+                updates = [f"{ _quote(field) } = excluded.{ _quote(field) }" for field in fields if field not in key_fields]
+                if table_name in UPDATE_TIME_TABLES:
+                    updates.append("更新时间 = CURRENT_TIMESTAMP")
+                sql += f" ON CONFLICT({ ', '.join(_quote(field) for field in key_fields) }) DO UPDATE SET { ', '.join(updates) }"
+            statements.append((sql, rows))
+
+        with self._lock:
+            with metrics.stage('write', self.config['db'], rows=sum(len(rows) for _, rows in statements)):
+                for sql, rows in statements:
+                    self.connection.executemany(sql, rows)
+            self._pending += len(statements)
+            if self._pending >= self.commit_interval or time.monotonic() - self._last_commit >= self.commit_seconds:
+                self._commit()
+
+    def replace_subject_names(self, date_table, normalized=False):
+        """ 将财务数据记录中的项目名称替换为项目编号，参数及返回值与 subjects.replace_subject_names() 相同
+
+        项目字典中没有的项目在单独的事务中新增并即时提交（在本连接上先提交已写入的数据）
+        """
+
+        statement_type = subjects.normalize_statement_type(date_table[0])
+        names = [record[2] for record in date_table[1]]
+        if not normalized:
+            names = subjects.normalize_subject_names(names)
+        with self._lock:
+            missing = sorted(set(name for name in names if (statement_type, name) not in self._subject_ids))
+            if missing:
+                self.connection.executemany("INSERT OR IGNORE INTO subject_dictionary(报表类型, 项目名称) VALUES (?, ?)",
+                                            [(statement_type, name) for name in missing])
+                self._pending += 1
+                self._commit()
+                self._subject_ids = {(row[0], row[1]): row[2] for row in self.connection.execute(
+                    "SELECT 报表类型, 项目名称, 项目编号 FROM subject_dictionary")}
+
+        return [date_table[0], [[record[0], record[1], self._subject_ids[(statement_type, name)], record[3]]
+                                for record, name in zip(date_table[1], names)]]
+
+    def _query(self, sql, args):
+        """ 执行查询语句，返回全部结果 """
+
+        with self._lock:
+            with metrics.stage('read', self.config['db']) as event:
+                rows = self.connection.execute(sql, args).fetchall()
+                event['rows'] = len(rows)
+
+        return rows
+
+    def load_statements(self, com_code, start_date=None, end_date=None):
+        """ 读取单个公司的财务数据，参数及返回值与 database.DatabaseReader.load_statements() 相同 """
+
+        sql = ("SELECT f.报告日期, s.报表类型, f.项目编号, s.项目名称, f.值 FROM financial_data f "
+               "JOIN subject_dictionary s ON s.项目编号 = f.项目编号 WHERE f.公司代码 = ?")
+        args = [com_code]
+        if start_date is not None:
+            sql += " AND f.报告日期 >= ?"
+            args.append(str(start_date))
+        if end_date is not None:
+            sql += " AND f.报告日期 <= ?"
+            args.append(str(end_date))
+        rows = self._query(sql + " ORDER BY f.报告日期, f.项目编号", args)
+
+        return pandas.DataFrame(rows, columns=['报告日期', '报表类型', '项目编号', '项目名称', '值'])
+
+    def load_subject(self, subject, report_date):
+        """ 读取全部公司某一项目、某一报告期的数据，参数及返回值与 database.DatabaseReader.load_subject() 相同 """
+
+        if isinstance(subject, int):
+            subject_ids = [subject]
+        else:
+            if isinstance(subject, str):
+                condition, args = "项目名称 = ?", [subjects.normalize_subject_name(subject)]
+            else:
+                condition = "报表类型 = ? AND 项目名称 = ?"
+                args = [subjects.normalize_statement_type(subject[0]), subjects.normalize_subject_name(subject[1])]
+            subject_ids = [row[0] for row in self._query("SELECT 项目编号 FROM subject_dictionary WHERE " + condition, args)]
+        if not subject_ids:
+            return pandas.DataFrame([], columns=['公司代码', '项目编号', '值'])
+
+        rows = self._query(
+            f"SELECT 公司代码, 项目编号, 值 FROM financial_data WHERE 项目编号 IN ({ ', '.join(['?'] * len(subject_ids)) }) "
+            "AND 报告日期 = ? ORDER BY 公司代码", subject_ids + [str(report_date)])
+
+        return pandas.DataFrame(rows, columns=['公司代码', '项目编号', '值'])
+
+    def load_fingerprints(self, com_code, statement_type):
+        """ 读取单个公司某一报表各报告期的数据指纹，参数及返回值与 database.DatabaseReader.load_fingerprints() 相同 """
+
+        rows = self._query("SELECT 报告日期, 指纹 FROM statement_fingerprints WHERE 公司代码 = ? AND 报表类型 = ?", [com_code, statement_type])
+        return dict(rows)
+
+    def load_subject_dictionary(self):
+        """ 读取项目字典，返回值与 database.DatabaseReader.load_subject_dictionary() 相同 """
+
+        rows = self._query("SELECT 项目编号, 报表类型, 项目名称 FROM subject_dictionary", [])
+        return {subject_id: [statement_type, subject_name] for subject_id, statement_type, subject_name in rows}
+
+    def iter_financial_data(self, updated_since=None, chunk_size=100000):
+        """ 分批读取财务数据，参数及返回值与 database.DatabaseReader.iter_financial_data() 相同
+
+        更新时间为数据库的 CURRENT_TIMESTAMP（UTC），每批读取时加锁，两批之间其他线程可以使用连接
+        """
+
+        sql = "SELECT 公司代码, 报告日期, 项目编号, 值, 更新时间 FROM financial_data"
+        args = []
+        if updated_since is not None:
+            sql += " WHERE 更新时间 >= ?"
+            args.append(str(updated_since))
+        with self._lock:
+            cursor = self.connection.execute(sql, args)
+        try:
+            while True:
+                with self._lock:
+                    with metrics.stage('read', self.config['db']) as event:
+                        rows = cursor.fetchmany(chunk_size)
+                        event['rows'] = len(rows)
+                if not rows:
+                    break
+                yield [list(row) for row in rows]
+        finally:
+            cursor.close()
+
+    def load_watermarks(self):
+        """ 读取各公司各报表已保存的最新报告日期，返回值与 database.load_watermarks() 相同 """
+
+        # MAX() 的结果没有声明类型，不会自动转为 datetime.date
+        rows = self._query(
+            "SELECT f.公司代码, s.报表类型, MAX(f.报告日期) FROM financial_data f "
+            "JOIN subject_dictionary s ON f.项目编号 = s.项目编号 GROUP BY f.公司代码, s.报表类型", [])
+
+        return {(com_code, statement_type): datetime.date.fromisoformat(report_date) for com_code, statement_type, report_date in rows}
+
+    def flush(self):
+        """ 提交尚未提交的数据 """
+
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """ 提交尚未提交的数据，并关闭连接 """
+
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.connection.close()
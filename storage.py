@@ -0,0 +1,70 @@
+class StorageBackend:
+    """ 存储后端接口
+
+    views 中的保存函数及 database.get_writer()、database.get_reader() 只通过以下方法读写数据，
+    已有的实现为 database.DatabaseWriter（MySQL）及 sqlite_storage.SQLiteStorage（嵌入式 SQLite），
+    在 database.DATABASE_CONFIGS 中以 'backend' 选择，未指定时为 MySQL。
+    财务数据的值及公司资料、发行情况中的金额均以分为单位的定点数（int）传入、读出，由各后端决定保存方式
+    """
+
+    def write_records(self, table_name, fields, rows, key_fields=None, cents_fields=()):
+        """ 写入记录
+
+        参数
+        ----------
+        table_name: str
+            表名
+        fields: list
+            字段名，与每条记录的字段一一对应
+        rows: list
+            记录
+        key_fields: list
+            主键字段，不为 None 时与已有记录的主键重复时更新其余字段，为 None 时直接插入
+        cents_fields: list
+            以分为单位的定点数字段，值为 '--' 等文字时原样写入
+        """
+        self.write_batch([(table_name, fields, rows, key_fields, cents_fields)])
+
+    def write_batch(self, writes, deletes=()):
+        """ 在同一事务中先删除、再写入多个表的记录，事务提交时全部生效，不会只提交其中一部分
+
+        参数
+        ----------
+        writes: list
+            写入的记录，列表格式为：[(表名, 字段名, 记录, 主键字段, 以分为单位的字段), ...]，各项与 write_records() 的参数相同
+        deletes: list
+            删除的记录，列表格式为：[(表名, 主键字段, [主键值, ...]), ...]
+        """
+        raise NotImplementedError
+
+    def replace_subject_names(self, date_table, normalized=False):
+        """ 将财务数据记录中的项目名称替换为项目编号，参数及返回值与 subjects.replace_subject_names() 相同 """
+        raise NotImplementedError
+
+    def load_statements(self, com_code, start_date=None, end_date=None):
+        """ 读取单个公司的财务数据，参数及返回值与 database.DatabaseReader.load_statements() 相同 """
+        raise NotImplementedError
+
+    def load_subject(self, subject, report_date):
+        """ 读取全部公司某一项目、某一报告期的数据，参数及返回值与 database.DatabaseReader.load_subject() 相同 """
+        raise NotImplementedError
+
+    def load_fingerprints(self, com_code, statement_type):
+        """ 读取单个公司某一报表各报告期的数据指纹，参数及返回值与 database.DatabaseReader.load_fingerprints() 相同 """
+        raise NotImplementedError
+
+    def load_subject_dictionary(self):
+        """ 读取项目字典，返回值与 database.DatabaseReader.load_subject_dictionary() 相同 """
+        raise NotImplementedError
+
+    def iter_financial_data(self, updated_since=None, chunk_size=100000):
+        """ 分批读取财务数据，参数及返回值与 database.DatabaseReader.iter_financial_data() 相同 """
+        raise NotImplementedError
+
+    def flush(self):
+        """ 提交尚未提交的数据 """
+        raise NotImplementedError
+
+    def close(self):
+        """ 提交尚未提交的数据，并关闭连接 """
+        raise NotImplementedError
@@ -0,0 +1,158 @@
+import re
+
+
+# 进程内缓存的项目字典，格式为：{数据库名: {(报表类型, 项目名称): 项目编号}}
+_subject_ids = {}
+
+# 不同数据来源的报表类型的统一写法（163 的利润表为 PL，新浪财经的利润表为 PS）
+STATEMENT_TYPE_ALIASES = {
+    'PL': 'PS',
+}
+
+# 项目名称前的报表前缀（如 'BS-'）及序号（如 '一、'）
+# '加:'、'减:'、'其中:' 等修饰词予以保留：'其中:营业收入' 与 '营业收入' 等是不同的项目，去除后会对应同一项目编号
+_SUBJECT_PREFIX = re.compile(r'^((BS|PL|PS|CF)-)?([一二三四五六七八九十]+、)?')
+
+
+def normalize_statement_type(database_table_type):
+    """ 返回报表类型的统一写法
+
+    参数
+    ----------
+    database_table_type: str
+        数据库表类型的简写：BS、PL、PS、CF
+
+    返回值
+    -------
+    str
+        统一后的报表类型
+    """
+
+    return STATEMENT_TYPE_ALIASES.get(database_table_type, database_table_type)
+
+
+def normalize_subject_name(subject_name):
+    """ 返回项目名称的统一写法，使不同数据来源的同一项目对应相同的名称
+
+    去除空格、报表前缀及序号，并将全角括号、冒号转为半角；统一后的写法只取决于项目名称本身，各次运行结果相同
+
+    参数
+    ----------
+    subject_name: str
+        数据来源中的项目名称，如 '五、净利润'、'PL-净利润'、'减：所得税费用'
+
+    返回值
+    -------
+    str
+        统一后的项目名称，如 '净利润'、'减:所得税费用'
+    """
+
+    subject_name = re.sub(r'\s', '', str(subject_name))
+    subject_name = subject_name.replace('（', '(').replace('）', ')').replace('：', ':')
+
+    return _SUBJECT_PREFIX.sub('', subject_name)
+
+
+def normalize_subject_names(subject_names):
+    """ 返回各项目名称的统一写法，相同的项目名称只统一一次
+
+    参数
+    ----------
+    subject_names: list
+        数据来源中的项目名称（可重复）
+
+    返回值
+    -------
+    list
+        与 subject_names 一一对应的统一后的项目名称
+    """
+
+    normalized_names = {name: normalize_subject_name(name) for name in set(subject_names)}
+
+    return [normalized_names[name] for name in subject_names]
+
+
+def load_subject_dictionary(cursor):
+    """ 从 subject_dictionary 表读取项目字典，并更新进程内缓存
+
+    参数
+    ----------
+    cursor: pymysql.cursors.Cursor
+        数据库游标
+
+    返回值
+    -------
+    subject_ids: dict
+        项目字典，格式为：{(报表类型, 项目名称): 项目编号}
+    """
+
+    subject_ids = _subject_ids.setdefault(cursor.connection.db, {})
+    cursor.execute("SELECT 项目编号, 报表类型, 项目名称 FROM subject_dictionary")
+    for subject_id, statement_type, subject_name in cursor.fetchall():
+        subject_ids[(statement_type, subject_name)] = subject_id
+
+    return subject_ids
+
+
+def get_subject_ids(cursor, database_table_type, subject_names, normalized=False):
+    """ 返回项目名称对应的项目编号，字典中不存在的项目自动新增
+
+    项目编号由 subject_dictionary 表的自增字段生成，一经生成不再改变，因此各次运行、各数据来源取得的编号相同
+
+    参数
+    ----------
+    cursor: pymysql.cursors.Cursor
+        数据库游标
+    database_table_type: str
+        数据库表类型的简写：BS、PL、PS、CF
+    subject_names: list
+        项目名称，由 normalize_subject_names() 统一写法
+    normalized: bool
+        项目名称是否已为统一后的写法（不再重复统一）
+
+    返回值
+    -------
+    list
+        与 subject_names 一一对应的项目编号
+    """
+
+    statement_type = normalize_statement_type(database_table_type)
+    keys = [(statement_type, name) for name in (subject_names if normalized else normalize_subject_names(subject_names))]
+
+    subject_ids = _subject_ids.get(cursor.connection.db)
+    if subject_ids is None:
+        subject_ids = load_subject_dictionary(cursor)
+
+    ''' 新增字典中不存在的项目 '''
+    missing_keys = sorted(set(key for key in keys if key not in subject_ids))
+    if missing_keys:
+        # 其他进程可能已新增相同项目，因此忽略重复记录，并重新读取字典
+        cursor.executemany("INSERT IGNORE INTO subject_dictionary(报表类型, 项目名称) VALUES (%s, %s)", missing_keys)
+        cursor.connection.commit()
+        subject_ids = load_subject_dictionary(cursor)
+
+    return [subject_ids[key] for key in keys]
+
+
+def replace_subject_names(cursor, date_table, normalized=False):
+    """ 将财务数据记录中的项目名称替换为项目编号
+
+    参数
+    ----------
+    cursor: pymysql.cursors.Cursor
+        数据库游标
+    date_table: list
+        [数据库表类型, [[公司代码, 报告日期, 项目名称, 值], ...]]
+    normalized: bool
+        项目名称是否已为统一后的写法（不再重复统一）
+
+    返回值
+    -------
+    list
+        [数据库表类型, [[公司代码, 报告日期, 项目编号, 值], ...]]
+    """
+
+    database_table_type, records = date_table
+    subject_ids = get_subject_ids(cursor, database_table_type, [record[2] for record in records], normalized)
+
+    return [database_table_type, [[record[0], record[1], subject_id, record[3]] for record, subject_id in zip(records, subject_ids)]]
@@ -1,18 +1,51 @@
+import io
 import os
 import time, datetime
 import re 
 
 import pandas
-import requests
-import pymysql
-from bs4 import BeautifulSoup
 from lxml import etree
-from decimal import Decimal, getcontext
 
-# 设置货币的有效数字
-getcontext().prec = 22
+import cache
+import database
+import downloader
+import fingerprints
+import fixed_point
+import journal
+import lease_queue
+import metrics
+import panel
+import quarterly
+import ratios
+import registry
+import screening
 
-def get_financial_statement(statement_type_code, com_code):
+
+def get_163_url(statement_type_code, com_code):
+    """ 生成从163股票网站下载特定单位数据的 URL
+
+    参数
+    ----------
+    statement_type_code: str
+        可供下载的报表类：1 - 资产负债表； 2 - 利润表； 3 - 现金流量表； 4 - 公司资料
+    com_code: str
+        上市公司的在证券市场上的6位代码
+
+    返回值
+    -------
+    url: str
+        下载数据的 URL，报表类型不存在时返回 None
+    """
+
+    statement_types = {'1': 'zcfzb', '2': 'lrb', '3': 'xjllb'}
+    if statement_type_code in statement_types:
+        return 'http://quotes.money.163.com/service/' + statement_types[statement_type_code] + '_' + com_code + '.html'
+    elif statement_type_code == '4':
+        return 'http://quotes.money.163.com/f10/gszl_' + com_code + '.html#01f02'
+    return None
+
+
+def get_financial_statement(statement_type_code, com_code, page_content=None):
     """从163股票网站下载特定单位的财务报表,同时对下载的财务报表进行数据清洗，并转成一维数据
     参数
     ----------
@@ -20,6 +53,8 @@ def get_financial_statement(statement_type_code, com_code):
         可供下载的报表类：1 - 资产负债表； 2 - 利润表； 3 - 现金流量表； 4 - 公司资料
     com_code: str
         上市公司的在证券市场上的6位代码
+    page_content: bytes
+        已下载的报表原始内容，为 None 时从网站下载（或读取缓存）
         
     返回值
     -------
@@ -49,19 +84,22 @@ def get_financial_statement(statement_type_code, com_code):
         print("不支持的报表类型！")
 
     """ 下载数据 """
-    print("开始下载" + com_code + "的" + statement_name + "...")
     # 配置下载数据的URL
-    url = 'http://quotes.money.163.com/service/' + statement_type + '_' + com_code + '.html' 
-    # 下载数据
+    url = get_163_url(statement_type_code, com_code)
+    source = metrics.source_of(url)
+    # 下载数据：网络错误由 downloader 重试，重试后仍失败时抛出，由调用者记入问题清单
+    if page_content is None:
+        page_content = downloader.get_page(url)
     try:
-        page_data = pandas.read_csv(url, encoding='gbk', header=None)
-        print("数据下载完毕！")
-    except :
+        with metrics.stage('parse', source, com_code=com_code, statement_type_code=statement_type_code) as event:
+            page_data = pandas.read_csv(io.BytesIO(page_content), encoding='gbk', header=None)
+            event['rows'] = page_data.shape[0]
+    except Exception:
         print("该公司信息不存在，请检查输入的公司代码是否正确。")
         return
     
     """ 整理数据格式 """
-    print("开始处理数据...")
+    clean_started_at = time.perf_counter()
     formate_data = []
     for row in range(1, page_data.shape[0]):
         # 处理非空行数据
@@ -77,17 +115,15 @@ def get_financial_statement(statement_type_code, com_code):
                 subject_name = 'BS-向中央银行借款净增加额'
             # 按特定格式输出数据
             for column in range(1, page_data.shape[1]-1):
-                # 将“--”替换为0
+                # 丢弃值为“--”（即 0）的记录；不修改单元格，pandas 的字符串列不能写入整数
                 if page_data.iloc[row, column] == '--':
-                    page_data.iloc[row, column] = 0
-                # 丢弃值为0的记录
-                if page_data.iloc[row, column] == 0:
                     continue
                 # 删除单元格中的空格' '
                 report_date = page_data.iloc[0, column].replace(' ', '')
                 value = page_data.iloc[row, column].replace(' ', '')
                 formate_data.append([com_code, report_date, subject_name, value]) 
-    print("数据处理完毕！")
+    metrics.record('clean', source, time.perf_counter() - clean_started_at, rows=len(formate_data),
+                   com_code=com_code, statement_type_code=statement_type_code)
 
     return [[database_table_type, formate_data], ]
 
@@ -115,15 +151,12 @@ def get_company_information(statement_type_code, com_code):
     #获取包含公司资料的网页
     print("开始下载" + com_code + "的公司资料...")
     url = 'http://quotes.money.163.com/f10/' + statement_type + '_' + com_code + '.html#01f02'
-    try:
-        page = requests.get(url)
-    except:
-        print("该公司信息不存在，请检查输入的公司代码是否正确。")
+    page_content = downloader.get_page(url)
     print("数据下载完毕！")
 
     #解析网页，获取所有表格并清洗数据
     print("开始处理数据...")
-    soup = BeautifulSoup(page.text, 'html.parser')
+    soup = BeautifulSoup(page_content, 'html.parser')
     tables = soup.find_all('table')
     table_list =[]
     #获取表格数据
@@ -201,12 +234,14 @@ def get_company_information(statement_type_code, com_code):
             employees_data.append(row)
 """ 
 
-def write_data_to_database(date_tables):
-    """ 创建数据库连接，打开数据库，并调用函数将数据存入 MySQL 数据库
+def write_data_to_database(date_tables, writer=None):
+    """ 通过长连接的数据库写入器将数据存入 MySQL 数据库
     参数
     ----------
     date_tables: list
         欲存入数据库的数据
+    writer: database.DatabaseWriter
+        数据库写入器，为 None 时使用 163 数据库共用的写入器，数据按写入器的提交间隔合并提交
         
     返回值
     -------
@@ -215,7 +250,7 @@ def write_data_to_database(date_tables):
 
     """ 配置 SQL 插入语句 """
     # 配置 financial_data 表更新 SQL 语句      
-    # SQL_FD = f"INSERT INTO { table_name }({ fileds })financial_data(公司代码, 报告日期, 科目名称, 值) VALUES ({ field_values })('%s','%s','%s','%s')"
+    # SQL_FD = f"INSERT INTO { table_name }({ fileds })financial_data(公司代码, 报告日期, 项目编号, 值) VALUES ({ field_values })('%s','%s','%s','%s')"
     # 配置 company_information 表更新 SQL 语句 
     #SQL_CI = "INSERT INTO company_information(公司代码, 组织形式, 地域, 中文简称, 办公地址,\
     #                                          公司全称, 公司电话, 英文名称, 公司电子邮箱, 注册资本,\
@@ -241,74 +276,129 @@ def write_data_to_database(date_tables):
     # 配置 employees_data 表更新 SQL 语句 
     #SQL_ED = "INSERT INTO employees_data(公司代码, 报告日期, 分类维度, 分类名称, 员工人数, 员工占比) VALUES ('%s', '%s', '%s', '%s', '%s', '%s')"
 
-    """ 创建数据库连接及游标 """
-    FADB = pymysql.connect(
-        host='88.88.4.123', 
-        port=3306, 
-        user='root', 
-        passwd='330715', 
-        db='financial_analysis_for_listed_companies')
-    cursor = FADB.cursor()
+    """ 取得数据库写入器 """
+    if writer is None:
+        writer = database.get_writer('163')
     
     """ 将数据写入数据库 """
-    print("开始向数据库写入数据...")
     for table in date_tables:
-        # 根据表格类型确定待写入数据的表名、字段名及字段值数量
+        # 根据表格类型确定待写入数据的表名及字段名
         if table[0] == 'BS':
             table_name = 'financial_data'
-            fileds = '公司代码, 报告日期, 科目名称, 值'
-            field_values = r'%s, %s, %s, %s'
+            fields = database.FINANCIAL_DATA_FIELDS
             data_type = "资产负债表数据"
         elif table[0] == 'PL':
             table_name = 'financial_data'
-            fileds = '公司代码, 报告日期, 科目名称, 值'
-            field_values = r'%s, %s, %s, %s'
+            fields = database.FINANCIAL_DATA_FIELDS
             data_type = "利润表数据"
         elif table[0] == 'CF':
             table_name = 'financial_data'
-            fileds = '公司代码, 报告日期, 科目名称, 值'
-            field_values = r'%s, %s, %s, %s'
+            fields = database.FINANCIAL_DATA_FIELDS
             data_type = "现金流量表数据"
         elif table[0] == 'CI':
             table_name = 'company_information'
-            fileds = '公司代码, 组织形式, 地域, 中文简称, 办公地址, 公司全称, 公司电话, 英文名称, 公司电子邮箱,  注册资本, \
-                董事长, 员工人数, 董事会秘书, 法人代表, 董秘电话, 总经理, 董秘传真, 公司网址, 董秘邮箱, 信息披露网址, \
-                信息披露报纸名称, 主营业务, 经营范围, 公司沿革'
-            field_values = r'%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s'
+            fields = ['公司代码', '组织形式', '地域', '中文简称', '办公地址', '公司全称', '公司电话', '英文名称', '公司电子邮箱', '注册资本',
+                      '董事长', '员工人数', '董事会秘书', '法人代表', '董秘电话', '总经理', '董秘传真', '公司网址', '董秘邮箱', '信息披露网址',
+                      '信息披露报纸名称', '主营业务', '经营范围', '公司沿革']
             data_type = "公司信息数据"
         elif table[0] == 'II':
             table_name = 'IPO_information'
-            fileds = '公司代码, 成立日期, 上市日期, 发行方式, 面值, 发行数量, 发行价格, 募资资金总额, 发行费用, 发行中签率, \
-                发行市盈率, 发行后每股收益, 发行后每股净资产, 上市首日开盘价, 上市首日收盘价, 上市首日换手率, 主承销商, 上市保荐人, 会计师事务所'
-            field_values = r'%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s'
+            fields = ['公司代码', '成立日期', '上市日期', '发行方式', '面值', '发行数量', '发行价格', '募资资金总额', '发行费用', '发行中签率',
+                      '发行市盈率', '发行后每股收益', '发行后每股净资产', '上市首日开盘价', '上市首日收盘价', '上市首日换手率', '主承销商', '上市保荐人', '会计师事务所']
             data_type = "IPO信息数据"
         elif table[0] == 'BD':
             table_name = 'board_of_directors'
-            fileds = '公司代码, 更新日期, 姓名, 职务, 起止时间, 持股数_万股, 报酬_元'
-            field_values = r'%s, %s, %s, %s, %s, %s, %s'
+            fields = ['公司代码', '更新日期', '姓名', '职务', '起止时间', '持股数_万股', '报酬_元']
             data_type = "董事会成员信息数据"
         elif table[0] == 'RD':
             table_name = 'revenue_data'
-            fileds = '公司代码, 报告日期, 分类维度, 分类名称, 收入_万元, 成本_万元, 利润_万元, 毛利率, 利润占比'
-            field_values = r'%s, %s, %s, %s, %s, %s, %s, %s, %s'
+            fields = ['公司代码', '报告日期', '分类维度', '分类名称', '收入_万元', '成本_万元', '利润_万元', '毛利率', '利润占比']
             data_type = "收入数据"
         elif table[0] == 'ED':
             table_name = 'employees_data'
-            fileds = '公司代码, 报告日期, 分类维度, 分类名称, 员工人数, 员工占比'
-            field_values = r'%s, %s, %s, %s, %s, %s'
+            fields = ['公司代码', '报告日期', '分类维度', '分类名称', '员工人数', '员工占比']
             data_type = "职工数据"
         
+        # 将财务数据的科目名称替换为项目编号，已存在的记录按主键更新
+        key_fields = None
+        if table_name == 'financial_data':
+            with metrics.stage('clean', writer.config['db'], rows=len(table[1]), data_type=data_type):
+                table = writer.replace_subject_names(table)
+            key_fields = database.FINANCIAL_DATA_KEY
         # 向数据库写入数据
-        print("..." + data_type + "写入完毕")
-        cursor.executemany(f"INSERT INTO { table_name }({ fileds }) VALUES ({ field_values })", table[1])
+        writer.write_records(table_name, fields, table[1], key_fields)
+
+
+def _clean_cell_text(element):
+    """ 返回网页元素中的文字，并去除其中的空白字符（空格、'\r\n' 等） """
+
+    return re.sub(r'\s+', '', ''.join(element.itertext()))
+
+
+# 带千位分隔符的数字，如 '1,234.56'
+_THOUSANDS_NUMBER = re.compile(r'^-?\d{1,3}(,\d{3})+(\.\d+)?%?$')
+
+
+def _read_table(table):
+    """ 读取网页表格中全部单元格的文字
+
+    合并单元格（colspan、rowspan）按所跨的行、列重复填入，各行按最长的行补齐，空单元格以 '--' 表示，
+    数字中的千位分隔符被去除；<thead> 中的行以及表格开头全部由 <th> 组成的行作为表头
 
-    """ 向数据库提交操作并关闭数据库连接 """
-    FADB.commit()
-    FADB.close()
-    print("数据保存成功！")
+    参数
+    ----------
+    table: lxml.etree._Element
+        网页中的 <table> 元素
 
+    返回值
+    -------
+    list
+        [表头行列表, 数据行列表]，每行为单元格文字的列表
+    """
 
-def get_enterprise_information(statement_type_code, com_code):
+    header_rows = []
+    body_rows = []
+    # 跨行的单元格，格式为：{列号: [剩余行数, 文字]}
+    rowspans = {}
+    for tr in table.xpath('./tr|./thead/tr|./tbody/tr|./tfoot/tr'):
+        cells = tr.xpath('./td|./th')
+        if not cells:
+            continue
+        row = []
+
+        def fill_rowspans():
+            """ 填入上方跨行的单元格 """
+            while len(row) in rowspans:
+                rowspan = rowspans[len(row)]
+                row.append(rowspan[1])
+                rowspan[0] -= 1
+                if rowspan[0] == 0:
+                    del rowspans[len(row) - 1]
+
+        for cell in cells:
+            fill_rowspans()
+            text = _clean_cell_text(cell) or '--'
+            if _THOUSANDS_NUMBER.match(text):
+                text = text.replace(',', '')
+            rowspan = int(cell.get('rowspan') or 1)
+            for _ in range(int(cell.get('colspan') or 1)):
+                if rowspan > 1:
+                    rowspans[len(row)] = [rowspan - 1, text]
+                row.append(text)
+        fill_rowspans()
+
+        is_header = tr.getparent().tag == 'thead' or (not body_rows and all(cell.tag == 'th' for cell in cells))
+        (header_rows if is_header else body_rows).append(row)
+
+    # 按最长的行补齐各行
+    width = max([len(row) for row in header_rows + body_rows] + [0])
+    for row in header_rows + body_rows:
+        row += ['--'] * (width - len(row))
+
+    return [header_rows, body_rows]
+
+
+def get_enterprise_information(statement_type_code, com_code, page_content=None):
     """从163股票网站下载特定单位的企业信息，并对其进行清洗
     参数
     ----------
@@ -316,6 +406,8 @@ def get_enterprise_information(statement_type_code, com_code):
         可供下载的报表类：1 - 资产负债表； 2 - 利润表； 3 - 现金流量表； 4 - 公司资料
     com_code: str
         上市公司的在证券市场上的6位代码
+    page_content: bytes
+        已下载的网页原始内容，为 None 时从网站下载（或读取缓存）
         
     返回值
     -------
@@ -340,158 +432,82 @@ def get_enterprise_information(statement_type_code, com_code):
         print("不支持的报表类型！")
 
     """ 获取包含公司资料的网页 """
-    print("开始下载" + com_code + "的公司资料...")
     # 配置下载数据的URL 
-    url = 'http://quotes.money.163.com/f10/' + statement_type + '_' + com_code + '.html#01f02'
-    # 下载数据
-    try:
-        page = requests.get(url)
-        print("数据下载完毕！")
-    except:
-        print("该公司信息不存在，请检查输入的公司代码是否正确。")
-        return 
-    
-    print("开始处理数据...")
-
-    """ 初步处理数据 """
-    # 获取初始化页面，用于后续解析
-    page_elements = etree.HTML(page.text)
-    # 查找并取得包含公司信息、IPO信息的表格代码
+    url = get_163_url(statement_type_code, com_code)
+    # 下载数据：网络错误由 downloader 重试，重试后仍失败时抛出，由调用者记入问题清单
+    if page_content is None:
+        page_content = downloader.get_page(url)
+    parse_started_at = time.perf_counter()
+
+    """ 解析网页 """
+    # 网页只解析一次，表格及日期均从解析结果中直接读取
+    page_elements = etree.HTML(page_content, etree.HTMLParser(encoding='utf-8'))
+    # 查找并取得包含公司信息、IPO信息的表格，以及包含董事会成员、收入、人员数据的表格
     tables_one = page_elements.xpath('//table[@class="table_bg001 border_box limit_sale table_details"]')
     tables_two = page_elements.xpath('//table[@class="table_bg001 border_box limit_sale"]')
     
-    """ 获取并处理日期数据 """
-    soup = BeautifulSoup(page.text, 'html.parser')
-    # 获取最近更新日期
-    update_date_results = soup.find_all('h2', attrs={'class':'title_01'})
-    for item in  update_date_results:
-        update_date_results = item.find('li')
-        if update_date_results ==None:
-            continue
-        else:
-            last_update_date = update_date_results.string[-10:]
-    # 获取报告日期
-    report_date_results = soup.find('div', attrs={'class':'report_date'})
-    report_date_result = report_date_results.find('span')
-    report_date = report_date_result.string[-10:]
+    """ 获取日期数据 """
+    # 获取最近更新日期：取最后一个包含 li 的 h2.title_01 中的第一个 li
+    for update_date_element in page_elements.xpath('//h2[contains(concat(" ", @class, " "), " title_01 ")]'):
+        update_date_results = update_date_element.xpath('.//li')
+        if update_date_results:
+            last_update_date = _clean_cell_text(update_date_results[0])[-10:]
+    # 获取报告日期：取第一个 div.report_date 中的第一个 span
+    report_date_element = page_elements.xpath('//div[contains(concat(" ", @class, " "), " report_date ")]')[0]
+    report_date = _clean_cell_text(report_date_element.xpath('.//span')[0])[-10:]
 
     """ 处理公司信息数据 """
     company_information = [com_code]
-    # 以str类型（decode()）输出（tostring(））修正后的HTML代码
-    company_information_table = etree.tostring(tables_one[0], encoding='utf-8').decode()
-    # 获取公司信息表格中的数据
-    company_information_df = pandas.read_html(company_information_table, encoding='utf-8', header=None)[0]
-    # 将空值替换为 “--”
-    company_information_df.fillna('--', inplace=True)
-    # # 收集 dataframe 中需要的数据
-    for i in range(0, 10):
-        company_information.append(company_information_df.iloc[i, 1])
-        company_information.append(company_information_df.iloc[i, 3])
-    for i in range(10, company_information_df.shape[0]):
-        company_information.append(company_information_df.iloc[i, 1])
-    # 去除数据中的异常字符空格 ' ' 和换行符 '\r\n' 等
+    company_information_rows = _read_table(tables_one[0])[1]
+    # 收集表格中需要的数据：前 10 行各有 2 项数据，其余各行 1 项数据
+    for row in company_information_rows[:10]:
+        company_information += [row[1], row[3]]
+    for row in company_information_rows[10:]:
+        company_information.append(row[1])
+    # 将引号替换为空格
     for i in range(1, len(company_information)):
-        # 将值强制转换为str
-        company_information[i] = str(company_information[i])
-        company_information[i] = company_information[i].replace(' ', '')
-        company_information[i] = company_information[i].replace('\r\n', '')
-        company_information[i] = company_information[i].replace('"', ' ')
-        company_information[i] = company_information[i].replace("'", ' ')
+        company_information[i] = company_information[i].replace('"', ' ').replace("'", ' ')
     enterprise_information.append(['CI', [company_information,]])
-    print("...公司信息数据处理完毕")
 
     """ 处理IPO信息数据 """
-    IPO_information = [com_code]
-    # 以str类型（decode()）输出（tostring(））修正后的HTML代码
-    IPO_information_table = etree.tostring(tables_one[1], encoding='utf-8').decode()
-    # 获取 IPO 信息表格中的数据
-    IPO_information_df = pandas.read_html(IPO_information_table, encoding='utf-8', header=None)[0]
-    # 将空值替换为 “--”
-    IPO_information_df.fillna('--', inplace=True)
-    # 收集 dataframe 中需要的数据
-    for i in range(0, IPO_information_df.shape[0]):
-        IPO_information.append(IPO_information_df.iloc[i,1])
-    # 去除数据中的异常字符空格 ' ' 和换行符 '\r\n' 等
-    for i in range(1, len(IPO_information)):
-        # 将值强制转换为str
-        IPO_information[i] = str(IPO_information[i])
-        IPO_information[i] = IPO_information[i].replace(' ', '')
-        IPO_information[i] = IPO_information[i].replace('\r\n', '')
+    IPO_information = [com_code] + [row[1] for row in _read_table(tables_one[1])[1]]
     enterprise_information.append(['II', [IPO_information,]])
-    print("...IPO信息数据处理完毕")
     
     """ 处理董事会成员信息数据 """
-    board_of_directors = []
-    # 以str类型（decode()）输出（tostring(））修正后的HTML代码
-    board_of_directors_table = etree.tostring(tables_two[0], encoding='utf-8').decode()
-    # 获取董事会成员信息表格中的数据
-    board_of_directors_df = pandas.read_html(board_of_directors_table, encoding='utf-8', header=None)[0]
-    # 将空值替换为 “--”
-    board_of_directors_df.fillna('--', inplace=True)
-    # 收集 dataframe 中需要的数据
-    for i in range(0, board_of_directors_df.shape[0]):
-        board_of_directors.append([com_code, last_update_date] + list(board_of_directors_df.iloc[i]))
-    # 去除数据中的异常字符空格 ' ' 和换行符 '\r\n' 等 
-    for i in range(0, len(board_of_directors)):
-        for j in range(0, len(board_of_directors[i])):
-            # 将值强制转换为str
-            board_of_directors[i][j] = str(board_of_directors[i][j])
-            board_of_directors[i][j] = board_of_directors[i][j].replace(' ', '')
-            board_of_directors[i][j] = board_of_directors[i][j].replace('\r\n', '')
+    board_of_directors = [[com_code, last_update_date] + row for row in _read_table(tables_two[0])[1]]
     enterprise_information.append(['BD', board_of_directors])
-    print("...董事会成员信息数据处理完毕")
 
     """ 收入数据 """
     revenue_data = []
-    for i in range(1, 4):
-        # 以str类型（decode()）输出（tostring(））修正后的HTML代码
-        revenue_data_table = etree.tostring(tables_two[i], encoding='utf-8').decode()
-        # 获取收入数据表格中的数据
-        revenue_data_df = pandas.read_html(revenue_data_table, encoding='utf-8', header=None)[0]
-        # 将空值替换为 “--”
-        revenue_data_df.fillna('--', inplace=True)
-        # 收集 dataframe 中需要的数据
-        table_type = revenue_data_df.columns[0]
-        for i in range(0, revenue_data_df.shape[0]):
-            revenue_data.append([com_code, report_date, table_type] + list(revenue_data_df.iloc[i]))
-    # 去除数据中的异常字符空格 ' ' 和换行符 '\r\n' 等  
-    for i in range(0, len(revenue_data)):
-        for j in range(0, len(revenue_data[i])):
-            # 将值强制转换为str
-            revenue_data[i][j] = str(revenue_data[i][j])
-            revenue_data[i][j] = revenue_data[i][j].replace(' ', '')
-            revenue_data[i][j] = revenue_data[i][j].replace('\r\n', '')
+    for table in tables_two[1:4]:
+        header_rows, body_rows = _read_table(table)
+        # 表头的第 1 格为分类维度
+        table_type = header_rows[0][0] if header_rows else '0'
+        revenue_data += [[com_code, report_date, table_type] + row for row in body_rows]
     enterprise_information.append(['RD', revenue_data])
-    print("...收入数据处理完毕")
 
     """ 处理人员数据 """
     employees_data = []
-    for i in range(4, len(tables_two)):
-        # 以str类型（decode()）输出（tostring(））修正后的HTML代码
-        employees_data_table = etree.tostring(tables_two[i], encoding='utf-8').decode()
-        # 获取收入数据表格中的数据
-        employees_data_df = pandas.read_html(employees_data_table, encoding='utf-8', header=None)[0]
-        # 将空值替换为 “--”
-        employees_data_df.fillna('--', inplace=True)
-        # 收集 dataframe 中需要的数据
-        table_type = employees_data_df.columns[0]
-        for i in range(0, employees_data_df.shape[0]):
-            employees_data.append([com_code, report_date, table_type] +  list(employees_data_df.iloc[i]))
-    # 去除数据中的异常字符空格 ' ' 和换行符 '\r\n' 等   
-    for i in range(0, len(employees_data)):
-        for j in range(0, len(employees_data[i])):
-            employees_data[i][j] = str(employees_data[i][j])
-            employees_data[i][j] = employees_data[i][j].replace(' ', '')
-            employees_data[i][j] = employees_data[i][j].replace('\r\n', '')
+    for table in tables_two[4:]:
+        header_rows, body_rows = _read_table(table)
+        # 表头的第 1 格为分类维度
+        table_type = header_rows[0][0] if header_rows else '0'
+        employees_data += [[com_code, report_date, table_type] + row for row in body_rows]
     enterprise_information.append(['ED', employees_data])
-    print("...人员数据处理完毕")
 
-    print("公司资料数据处理完毕...")
+    metrics.record('parse', metrics.source_of(url), time.perf_counter() - parse_started_at,
+                   rows=metrics.count_records(enterprise_information), com_code=com_code, statement_type_code=statement_type_code)
 
     return enterprise_information
 
 
-def download_data(download_list):
+def clear_screen():
+    """ 清除屏幕信息（Windows 使用 cls，其他系统使用 clear） """
+
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+
+def download_data(download_list, offline=False):
     """ 调用函数从股票网站下载数据
 
     根据提供的 download_list 参数，选择不同的爬虫函数从股票网站下载数据，并将清理格式后的数据存入数据库，
@@ -501,6 +517,8 @@ def download_data(download_list):
     -------
     download_list: list
         可公司资料的数据列表，列表格式为：[["公司代码", "报表类型"],[记录2],[...]]
+    offline: bool
+        是否离线重放：只使用缓存的原始内容重新解析、保存数据，不访问网站
         
     返回值
     -------
@@ -509,20 +527,27 @@ def download_data(download_list):
     """
 
     problem_list = []
+    # 各阶段的耗时、记录数等指标写入事件日志
+    metrics.start_run()
     
     if download_list:
         for item in download_list:
             try:
+                # 离线重放时读取缓存的原始内容（不检查有效期）
+                page_content = None
+                if offline:
+                    page_content = cache.get(get_163_url(item[1], item[0]), ttl=None)
+                    if page_content is None:
+                        raise LookupError("无缓存")
                 if item[1] == '4':
-                    write_data_to_database(get_enterprise_information(item[1], item[0]))
+                    write_data_to_database(get_enterprise_information(item[1], item[0], page_content))
                 else:
-                    write_data_to_database(get_financial_statement(item[1], item[0]))
-            except:
+                    write_data_to_database(get_financial_statement(item[1], item[0], page_content))
+            except Exception:
                 problem_list.append(item[0] + " " + item[1]) 
-            # 等待 5 秒
-            time.sleep(5) 
-            # 清除屏幕信息
-            os.system('cls')
+            # 等待 5 秒，离线重放时不访问网站，无需等待
+            if not offline:
+                time.sleep(5) 
     else:
         continue_or_not = True
         while continue_or_not:
@@ -538,74 +563,203 @@ def download_data(download_list):
             if is_continue == 'n' or is_continue == 'N':
                 continue_or_not = False
 
-            os.system('cls')
+            clear_screen()
     
+    # 提交尚未提交的数据
+    database.close_writers()
+    # 输出 Prometheus 指标文件，并打印各阶段的耗时汇总
+    metrics.finish_run()
+
     with open("problem_list.txt", "w") as filetxt:
         for item in problem_list:
             filetxt.write(item + "\n")
 
 
-def get_financial_data_from_SINA(com_code, statement_type_code):
+def get_SINA_url(com_code, statement_type_code):
+    """ 生成从新浪财经下载特定单位数据的 URL
+
+    参数
+    ----------
+    com_code: str
+        上市公司的在证券市场上的6位代码
+    statement_type_code: str
+        可供下载的数据类型：1 - 资产负债表； 2 - 利润表； 3 - 现金流量表； 4 - 公司资料； 5 - 发行情况
+
+    返回值
+    -------
+    url: str
+        下载数据的 URL，数据类型不存在时返回 None
     """
+
+    if statement_type_code in SINA_STATEMENT_TYPES:
+        return 'http://money.finance.sina.com.cn/corp/go.php/vDOWN_' + SINA_STATEMENT_TYPES[statement_type_code] + '/displaytype/4/stockid/' + com_code + '/ctrl/all.phtml'
+    elif statement_type_code == '4':
+        return 'https://vip.stock.finance.sina.com.cn/corp/go.php/vCI_CorpInfo/stockid/' + com_code + '.phtml'
+    elif statement_type_code == '5':
+        return 'https://vip.stock.finance.sina.com.cn/corp/go.php/vISSUE_NewStock/stockid/' + com_code + '.phtml'
+    return None
+
+
+# 新浪财经财务报表的报表编号与报表类型的对应关系
+SINA_STATEMENT_TYPES = {
+    '1': 'BalanceSheet',
+    '2': 'ProfitStatement',
+    '3': 'CashFlow',
+}
+
+
+def get_financial_data_from_SINA(com_code, statement_type_code, page_content=None):
+    """ 从新浪财经下载特定单位的财务报表，并转成一维数据
+
+    参数
+    ----------
+    com_code: str
+        上市公司的在证券市场上的6位代码
+    statement_type_code: str
+        可供下载的报表类：1 - 资产负债表； 2 - 利润表； 3 - 现金流量表
+    page_content: bytes
+        已下载的报表原始内容，为 None 时从网站下载
+
+    返回值
+    -------
+    list
+        [数据库表类型, [[公司代码, 报告日期, 项目名称, 值], ...]]，值为以分为单位的定点数（int），项目名称在存入数据库时转为 subject_dictionary 中的项目编号
     """
 
-    ''' 根据报表编号确定报表类型、名称、数据库表类型以及科目前缀 '''
+    ''' 根据报表编号确定报表类型、名称及数据库表类型 '''
     if statement_type_code == '1':
         statement_type = 'BalanceSheet'
         statement_name = '资产负债表'
         database_table_type = 'BS'
-        front_name = 'BS-'
     elif statement_type_code == '2':
         statement_type = 'ProfitStatement'
         statement_name = '利润表'
         database_table_type = 'PS'
-        front_name = 'PS-'
     elif statement_type_code == '3':
         statement_type = 'CashFlow'
         statement_name = '现金流量表'
         database_table_type = 'CF'
-        front_name = 'CF-'
     else:
         print("报表类型选择错误，请重新选择！")
         return
 
     ''' 下载数据 '''
-    print("开始下载" + com_code + "的" + statement_name + "...")
-    # 配置下载数据的URL
-    url = 'http://money.finance.sina.com.cn/corp/go.php/vDOWN_' + statement_type + '/displaytype/4/stockid/' + com_code + '/ctrl/all.phtml'
-    # 下载数据，并保存为 pandas 的数据框架
+    # 下载数据（或读取缓存），已提供原始内容时直接解析原始内容
+    if page_content is None:
+        page_content = downloader.get_page(get_SINA_url(com_code, statement_type_code))
+    # 将数据保存为 pandas 的数据框架
     # 尽管下载的过来的数据为 .xls 格式的文档，但实际为 csv 格式的文档，所以用 read_csv() 函数，同时按 ‘\t’ 进行数据切分
-    page_data = pandas.read_csv(url, encoding='gbk', header=None, sep='\t')
-    print("数据下载完毕")
-    
-    print("开始处理数据...")
+    page_data = pandas.read_csv(io.BytesIO(page_content), encoding='gbk', header=None, sep='\t')
 
     ''' 将二维数据表转为一维数据表，并转换数据类型 '''
-    origin_data = []
     # --.shape[0] 返回 dataframe 的行数
     # --.shape[1] 返回 dataframe 的列数
-    for column in range(1, page_data.shape[1]-2):
-        for row in range(2, page_data.shape[0]):
-            # 去除值为 ’0‘ 或 nan 的行 
-            if pandas.isnull(page_data.iloc[row, column]) or page_data.iloc[row, column] == '0':
-                continue
-            # 转换获取的数据的数据类型
-            subject_number = front_name + str(row)
-            report_date = datetime.datetime.strptime(str(page_data.iloc[0, column]), r'%Y%m%d').date()
-            value = Decimal(page_data.iloc[row, column]).quantize(Decimal('0.00'))
-            # 向一维数据表（list）添加数据
-            origin_data.append([com_code, report_date, subject_number, value]) 
+    # 取出数值区域（第 3 行起，第 2 列至倒数第 3 列）并转置，使展开后的数据按“先报告日期、后项目”排列
+    values = page_data.iloc[2:, 1:page_data.shape[1]-2].to_numpy(dtype=object).T
+    # 每个报告日期只解析一次
+    report_dates = [datetime.datetime.strptime(str(date), r'%Y%m%d').date() for date in page_data.iloc[0, 1:page_data.shape[1]-2]]
+    # 第 1 列为项目名称
+    subject_names = page_data.iloc[2:, 0].tolist()
+    # 去除值为 ’0‘ 或 nan 的单元格，nonzero() 返回保留的单元格的位置
+    keep_mask = ~(pandas.isnull(values) | (values == '0'))
+    date_index, subject_index = keep_mask.nonzero()
+    # 值一次性转为以分为单位的定点数（int64），再生成一维数据表（list）
+    cents = fixed_point.parse_cents(values[date_index, subject_index])
+    origin_data = [
+        [com_code, report_dates[i], subject_names[j], value]
+        for i, j, value in zip(date_index.tolist(), subject_index.tolist(), cents.tolist())]
 
     # 将数据由 list 转为 dataframe 
-    #standard_data_df = pandas.DataFrame(origin_data, columns=["公司代码", "报表日期", "项目编号","值"])
-
-    print("数据处理完毕！")
+    #standard_data_df = pandas.DataFrame(origin_data, columns=["公司代码", "报表日期", "项目名称","值"])
     
     return [database_table_type, origin_data]
 
 
-def get_corporation_information_from_SINA(com_code, statement_type_code='4'):
+# 新浪财经公司资料、发行情况网页中保存数据的表格
+_SINA_INFO_TABLE = etree.XPath('//table[@id="comInfo1"]')
+# 未找到上述表格时，改为查找包含指定标签、且不再嵌套表格的表格
+_SINA_TABLE_WITH_LABEL = etree.XPath('//table[not(.//table)][.//td[starts-with(normalize-space(), $label)]]')
+# 表格中的标签以全角或半角冒号结尾
+_SINA_LABEL_SUFFIX = re.compile(r'[:：]$')
+
+# 新浪财经公司资料网页中需要读取的标签（注册资本在处理时改名为“注册资本(万元)”）
+SINA_CORPORATION_LABELS = [
+    '公司名称', '公司英文名称', '上市市场', '上市日期', '发行价格', '主承销商', '成立日期', '注册资本', '机构类型', '组织形式',
+    '董事会秘书', '公司电话', '董秘电话', '公司传真', '董秘传真', '公司电子邮箱', '董秘电子邮箱', '公司网址', '邮政编码', '信息披露网址',
+    '证券简称更名历史', '注册地址', '办公地址', '公司简介', '经营范围']
+# corporation_information 表的字段顺序
+SINA_CORPORATION_FIELDS = ['公司代码'] + SINA_CORPORATION_LABELS[:7] + ['注册资本(万元)'] + SINA_CORPORATION_LABELS[8:]
+# 新浪财经发行情况网页中需要读取的标签
+SINA_ISSUE_LABELS = [
+    '上市地', '主承销商', '承销方式', '上市推荐人', '每股发行价(元)', '发行方式', '发行市盈率(按发行后总股本)', '首发前总股本(万股)',
+    '首发后总股本(万股)', '实际发行量(万股)', '预计募集资金(万元)', '实际募集资金合计(万元)', '发行费用总额(万元)', '募集资金净额(万元)',
+    '承销费用(万元)', '招股公告日', '上市日期']
+# 发行情况中的数值数据，以分为单位的定点数保存
+SINA_ISSUE_CENTS_LABELS = SINA_ISSUE_LABELS[4:5] + SINA_ISSUE_LABELS[6:15]
+# issue_information 表的字段顺序
+SINA_ISSUE_FIELDS = ['公司代码'] + SINA_ISSUE_LABELS
+# 公司资料、发行情况记录中以分为单位保存的字段，由存储后端决定保存方式（MySQL 为 decimal，SQLite 为整数）
+CENTS_FIELDS = {
+    'CI': ['发行价格', '注册资本(万元)'],
+    'II': SINA_ISSUE_CENTS_LABELS,
+}
+
+
+def _read_SINA_label_values(page_content, labels):
+    """ 从新浪财经公司资料、发行情况网页的数据表格中，按标签读取对应的值
+
+    表格的每一行由若干“标签：值”单元格对组成，标签后的单元格即为该标签的值，不依赖数据所在的行、列位置
+
+    参数
+    ----------
+    page_content: bytes
+        网页的原始内容
+    labels: list
+        需要读取的标签（不含冒号）
+
+    返回值
+    -------
+    label_values: dict
+        格式为：{标签: 值}，值中的空白字符已去除，空值以 '--' 表示；缺少任一标签时抛出 ValueError
     """
+
+    page_elements = etree.HTML(page_content, etree.HTMLParser(encoding='gbk'))
+    tables = _SINA_INFO_TABLE(page_elements) or _SINA_TABLE_WITH_LABEL(page_elements, label=labels[0])
+    if not tables:
+        raise ValueError("未找到数据表格")
+
+    wanted_labels = set(labels)
+    label_values = {}
+    for tr in tables[0].iter('tr'):
+        cells = tr.xpath('./td|./th')
+        for i in range(len(cells) - 1):
+            label = _SINA_LABEL_SUFFIX.sub('', _clean_cell_text(cells[i]))
+            if label in wanted_labels and label not in label_values:
+                label_values[label] = _clean_cell_text(cells[i + 1]) or '--'
+
+    missing_labels = [label for label in labels if label not in label_values]
+    if missing_labels:
+        raise ValueError("数据表格中缺少数据项：" + '、'.join(missing_labels))
+
+    return label_values
+
+
+def get_corporation_information_from_SINA(com_code, statement_type_code='4', page_content=None):
+    """ 从新浪财经下载特定单位的公司资料，并转换数据类型
+
+    参数
+    ----------
+    com_code: str
+        上市公司的在证券市场上的6位代码
+    statement_type_code: str
+        数据类型，固定为 4 - 公司资料
+    page_content: bytes
+        已下载的网页原始内容，为 None 时从网站下载
+
+    返回值
+    -------
+    list
+        [数据库表类型, [[公司代码, 公司名称, ...]]]
     """
     
     ''' 根据报表编号确定报表类型、名称、数据库表类型以及科目前缀 '''
@@ -616,47 +770,25 @@ def get_corporation_information_from_SINA(com_code, statement_type_code='4'):
         return
     
     ''' 获取包含公司资料的网页，并下载数据 '''
-    print("开始下载" + com_code + "的公司资料...")
-    # 配置下载数据的 URL 
-    url = 'https://vip.stock.finance.sina.com.cn/corp/go.php/vCI_CorpInfo/stockid/' + com_code + '.phtml'
-    # 下载数据，所需的数据在 pandas 读取的页面的表格中的第 4 个中
-    page_data = pandas.read_html(url)[3]
-    print("数据下载完毕")
+    # 下载数据（或读取缓存），已提供原始内容时直接解析原始内容
+    if page_content is None:
+        page_content = downloader.get_page(get_SINA_url(com_code, statement_type_code))
         
-    ''' 将 dataframe 中的数据整理成字典，并转换数据类型 '''
+    ''' 按标签读取表格中的数据，整理成字典，并转换数据类型 '''
+    label_values = _read_SINA_label_values(page_content, SINA_CORPORATION_LABELS)
     origin_data = {}
     origin_data['公司代码'] = com_code
-    origin_data['公司名称'] = page_data.iloc[0, 1]
-    origin_data['公司英文名称'] = page_data.iloc[1, 1]
-    origin_data['上市市场'] = page_data.iloc[2, 1]
-    origin_data['上市日期'] = datetime.datetime.strptime(str(page_data.iloc[2, 3]), r'%Y-%m-%d').date()
-    origin_data['发行价格'] = Decimal(page_data.iloc[3, 1]).quantize(Decimal('0.00'))
-    origin_data['主承销商'] = page_data.iloc[3, 3]
-    origin_data['成立日期'] = datetime.datetime.strptime(str(page_data.iloc[4, 1]), r'%Y-%m-%d').date()
-    origin_data['注册资本(万元)'] = Decimal(re.findall('\d+',page_data.iloc[4, 3])[0]).quantize(Decimal('0.00'))
-    origin_data['机构类型'] = page_data.iloc[5, 1]
-    origin_data['组织形式'] = page_data.iloc[5, 3]
-    origin_data['董事会秘书'] = page_data.iloc[6, 1]
-    origin_data['公司电话'] = page_data.iloc[6, 3]
-    origin_data['董秘电话'] = page_data.iloc[8, 1]
-    origin_data['公司传真'] = page_data.iloc[8, 3]
-    origin_data['董秘传真'] = page_data.iloc[10, 1]
-    origin_data['公司电子邮箱'] = page_data.iloc[10, 3]
-    origin_data['董秘电子邮箱'] = page_data.iloc[12, 1]
-    origin_data['公司网址'] = page_data.iloc[12, 3]
-    origin_data['邮政编码'] = page_data.iloc[14, 1]
-    origin_data['信息披露网址'] = page_data.iloc[14, 3]
-    origin_data['证券简称更名历史'] = page_data.iloc[16, 1]
-    origin_data['注册地址'] = page_data.iloc[17, 1]
-    origin_data['办公地址'] = page_data.iloc[18, 1]
-    origin_data['公司简介'] = page_data.iloc[19, 1]
-    origin_data['经营范围'] = page_data.iloc[20, 1]
+    for label in SINA_CORPORATION_LABELS:
+        origin_data[label] = label_values[label]
+    origin_data['上市日期'] = datetime.datetime.strptime(origin_data['上市日期'], r'%Y-%m-%d').date()
+    origin_data['发行价格'] = fixed_point.to_cents(origin_data['发行价格'])
+    origin_data['成立日期'] = datetime.datetime.strptime(origin_data['成立日期'], r'%Y-%m-%d').date()
+    origin_data['注册资本(万元)'] = fixed_point.to_cents(re.findall(r'\d+', origin_data.pop('注册资本'))[0])
+    # 按数据库表的字段顺序排列
+    origin_data = {key: origin_data[key] for key in SINA_CORPORATION_FIELDS}
     
     ''' 清洗字典中的异常值 '''
     for key in origin_data:
-        # 将空值替换为 ‘--’
-        if pandas.isna(origin_data[key]):
-            origin_data[key] = '--'
         # 将 '\r\n'、' '、'"'、"'"去除
         if isinstance(origin_data[key], str):
             origin_data[key] = origin_data[key].replace('\r\n', '')
@@ -664,13 +796,25 @@ def get_corporation_information_from_SINA(com_code, statement_type_code='4'):
             origin_data[key] = origin_data[key].replace('"', '')
             origin_data[key] = origin_data[key].replace("'", '')
 
-    print("数据处理完毕")
-
     return [database_table_type, [list(origin_data.values())]]
 
 
-def get_issue_information_from_SINA(com_code, statement_type_code='5'):
-    """
+def get_issue_information_from_SINA(com_code, statement_type_code='5', page_content=None):
+    """ 从新浪财经下载特定单位的发行情况，并转换数据类型
+
+    参数
+    ----------
+    com_code: str
+        上市公司的在证券市场上的6位代码
+    statement_type_code: str
+        数据类型，固定为 5 - 发行情况
+    page_content: bytes
+        已下载的网页原始内容，为 None 时从网站下载
+
+    返回值
+    -------
+    list
+        [数据库表类型, [[公司代码, 上市地, ...]]]
     """
     
     ''' 根据报表编号确定报表类型、名称、数据库表类型以及科目前缀 '''
@@ -681,41 +825,24 @@ def get_issue_information_from_SINA(com_code, statement_type_code='5'):
         return
     
     ''' 获取包含发行情况的网页，并下载数据 '''
-    print("开始下载" + com_code + "的发行情况...")
-    # 配置下载数据的 URL 
-    url = 'https://vip.stock.finance.sina.com.cn/corp/go.php/vISSUE_NewStock/stockid/' + com_code + '.phtml'
-    # 下载数据，所需的数据在 pandas 读取的页面的表格中的第 13 个中
-    page_data = pandas.read_html(url)[12]
-    print("数据下载完毕")
+    # 下载数据（或读取缓存），已提供原始内容时直接解析原始内容
+    if page_content is None:
+        page_content = downloader.get_page(get_SINA_url(com_code, statement_type_code))
 
 
-    ''' 将 dataframe 中的数据整理成字典，并转换数据类型 '''
-    print("开始处理数据...")
+    ''' 按标签读取表格中的数据，整理成字典，并转换数据类型 '''
+    label_values = _read_SINA_label_values(page_content, SINA_ISSUE_LABELS)
     origin_data = {}
     origin_data['公司代码'] = com_code
-    origin_data['上市地'] = page_data.iloc[0, 1]
-    origin_data['主承销商'] = page_data.iloc[1, 1]
-    origin_data['承销方式'] = page_data.iloc[2, 1]
-    origin_data['上市推荐人'] = page_data.iloc[3, 1]
-    origin_data['每股发行价(元)'] = Decimal(page_data.iloc[4, 1]).quantize(Decimal('0.00'))
-    origin_data['发行方式'] = page_data.iloc[5, 1]
-    origin_data['发行市盈率(按发行后总股本)'] = Decimal(page_data.iloc[6, 1]).quantize(Decimal('0.00'))
-    origin_data['首发前总股本(万股)'] = Decimal(page_data.iloc[7, 1]).quantize(Decimal('0.00')) 
-    origin_data['首发后总股本(万股)'] = Decimal(page_data.iloc[8, 1]).quantize(Decimal('0.00')) 
-    origin_data['实际发行量(万股)'] = Decimal(page_data.iloc[9, 1]).quantize(Decimal('0.00'))
-    origin_data['预计募集资金(万元)'] = Decimal(page_data.iloc[10, 1]).quantize(Decimal('0.00'))
-    origin_data['实际募集资金合计(万元)'] = Decimal(page_data.iloc[11, 1]).quantize(Decimal('0.00'))
-    origin_data['发行费用总额(万元)'] = Decimal(page_data.iloc[12, 1]).quantize(Decimal('0.00'))
-    origin_data['募集资金净额(万元)'] = Decimal(page_data.iloc[13, 1]).quantize(Decimal('0.00'))
-    origin_data['承销费用(万元)'] = Decimal(page_data.iloc[14, 1]).quantize(Decimal('0.00'))
-    origin_data['招股公告日'] = datetime.datetime.strptime(str(page_data.iloc[15, 1]), r'%Y-%m-%d').date()
-    origin_data['上市日期'] = datetime.datetime.strptime(str(page_data.iloc[16, 1]), r'%Y-%m-%d').date()
+    for label in SINA_ISSUE_LABELS:
+        origin_data[label] = label_values[label]
+    for label in SINA_ISSUE_CENTS_LABELS:
+        origin_data[label] = fixed_point.to_cents(origin_data[label])
+    origin_data['招股公告日'] = datetime.datetime.strptime(origin_data['招股公告日'], r'%Y-%m-%d').date()
+    origin_data['上市日期'] = datetime.datetime.strptime(origin_data['上市日期'], r'%Y-%m-%d').date()
     
-    ''' 清理字典中的异常值 (nan) '''
+    ''' 清理字典中的异常值 '''
     for key in origin_data:  
-        # 将空值替换为 ‘--’
-        if pandas.isna(origin_data[key]):
-            origin_data[key] = '--'
         # 将 '\r\n'、' '、'"'、"'"去除
         if isinstance(origin_data[key], str):
             origin_data[key] = origin_data[key].replace('\r\n', '')
@@ -723,186 +850,376 @@ def get_issue_information_from_SINA(com_code, statement_type_code='5'):
             origin_data[key] = origin_data[key].replace('"', '')
             origin_data[key] = origin_data[key].replace("'", '')
 
-    print("数据处理完毕")
-
     return [database_table_type, [list(origin_data.values())]]
 
 
-def sava_data_to_database(date_table):
+def sava_data_to_database(date_table, writer=None):
     """ 保存数据至数据库
 
-    创建数据库连接，打开数据库，并调用函数将数据存入 MySQL 数据库
+    通过存储后端（MySQL 或 SQLite，见 storage.StorageBackend）的长连接写入器保存数据，数据按写入器的提交间隔合并提交，
+    写入器关闭（或程序退出）时提交全部未提交的数据
 
     参数
     ----------
     date_table: list
         欲存入数据库的数据
+    writer: storage.StorageBackend
+        数据库写入器，为 None 时使用 database.DEFAULT_DATABASE 数据库共用的写入器
         
     返回值
     -------
     无
     """
 
-    ''' 创建数据库连接及游标 '''
-    DB = pymysql.connect(
-        host='127.0.0.1', 
-        port=3306, 
-        user='root', 
-        passwd='330715', 
-        db='FALC_pro')
-    cursor = DB.cursor()
+    ''' 取得数据库写入器 '''
+    if writer is None:
+        writer = database.get_writer(database.DEFAULT_DATABASE)
     
     ''' 将数据写入数据库 '''
-    print("开始向数据库写入数据...")
-    # 根据表格类型确定待写入数据的表名、字段名及字段值数量
+    # 根据表格类型确定待写入数据的表名、字段名及以分为单位的字段
     if date_table[0] == 'BS':
         table_name = 'financial_data'
-        fileds = '公司代码, 报告日期, 项目编号, 值'
-        field_values = r'%s, %s, %s, %s'
+        fields = database.FINANCIAL_DATA_FIELDS
         data_type = "资产负债表"
     elif date_table[0] == 'PS':
         table_name = 'financial_data'
-        fileds = '公司代码, 报告日期, 项目编号, 值'
-        field_values = r'%s, %s, %s, %s'
+        fields = database.FINANCIAL_DATA_FIELDS
         data_type = "利润表"
     elif date_table[0] == 'CF':
         table_name = 'financial_data'
-        fileds = '公司代码, 报告日期, 项目编号, 值'
-        field_values = r'%s, %s, %s, %s'
+        fields = database.FINANCIAL_DATA_FIELDS
         data_type = "现金流量表"
     elif date_table[0] == 'CI':
         table_name = 'corporation_information'
-        fileds = '公司代码, 公司名称, 公司英文名称, 上市市场, 上市日期, 发行价格, 主承销商, 成立日期, 注册资本(万元),  机构类型, \
-            组织形式, 董事会秘书, 公司电话, 董秘电话, 公司传真, 董秘传真, 公司电子邮箱, 董秘电子邮箱, 公司网址, 邮政编码, \
-            信息披露网址, 证券简称更名历史, 注册地址, 办公地址, 公司简介, 经营范围'
-        field_values = r'%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s'
+        fields = SINA_CORPORATION_FIELDS
         data_type = "公司信息"
     elif date_table[0] == 'II':
-            table_name = 'issue_information'
-            fileds = '公司代码, 上市地, 主承销商, 承销方式, 上市推荐人, 每股发行价(元), 发行方式, 发行市盈率(按发行后总股本), 首发前总股本(万股), 首发后总股本(万股), \
-                实际发行量(万股), 预计募集资金(万元), 实际募集资金合计(万元), 发行费用总额(万元), 募集资金净额(万元), 承销费用(万元), 招股公告日, 上市日期'
-            field_values = r'%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s'
-            data_type = "发行信息"
+        table_name = 'issue_information'
+        fields = SINA_ISSUE_FIELDS
+        data_type = "发行信息"
         
-    # 向数据库写入数据
-    print("..." + data_type + "数据写入完毕")
-    cursor.executemany(f"INSERT INTO { table_name }({ fileds }) VALUES ({ field_values })", date_table[1])
+    # 财务数据按报告期与已保存的数据指纹比较，只在同一事务中替换新增或数据发生变化（追溯调整）的报告期
+    if table_name == 'financial_data':
+        with metrics.stage('clean', writer.config['db'], rows=len(date_table[1]), data_type=data_type) as event:
+            changed_blocks = fingerprints.find_changed_blocks(writer, date_table)
+            event['changed_blocks'] = len(changed_blocks)
+        fingerprints.write_changed_blocks(writer, date_table[0], changed_blocks)
+        return
+    # 向数据库写入数据，以分为单位的定点数由存储后端按原值精确保存；公司代码重复（再次下载）时更新其余字段
+    writer.write_records(table_name, fields, date_table[1], ['公司代码'], CENTS_FIELDS.get(date_table[0], []))
 
-    """ 向数据库提交操作并关闭数据库连接 """
-    DB.commit()
-    DB.close()
+    return
 
-    print("数据保存成功！")
 
-    return
+# 新浪财经各数据类型对应的解析函数
+SINA_PARSERS = {
+    '1': get_financial_data_from_SINA,
+    '2': get_financial_data_from_SINA,
+    '3': get_financial_data_from_SINA,
+    '4': get_corporation_information_from_SINA,
+    '5': get_issue_information_from_SINA,
+}
+
+
+def build_SINA_download_tasks(download_list):
+    """ 生成并发下载引擎使用的任务列表
+
+    参数
+    ----------
+    download_list: list
+        待下载数据的列表，列表格式为：[["公司代码", "报表类型"], [...]]
+
+    返回值
+    -------
+    task_list: list
+        任务列表，列表格式为：[[公司代码, 报表类型, URL, 解析函数], [...]]，不支持的报表类型将被忽略
+    """
+
+    task_list = []
+    for com_code, statement_type_code in download_list:
+        if statement_type_code not in SINA_PARSERS:
+            print("不支持的报表类型：" + com_code + ' ' + statement_type_code)
+            continue
+        task_list.append([com_code, statement_type_code, get_SINA_url(com_code, statement_type_code), SINA_PARSERS[statement_type_code]])
+
+    return task_list
+
+
+def seed_crawl_tasks(download_list, database_name=None):
+    """ 将待下载数据的列表写入数据库中的任务表（lease_queue.TASK_TABLE），供多个工作节点共同下载
+
+    参数
+    ----------
+    download_list: list
+        待下载数据的列表，列表格式为：[["公司代码", "报表类型"], [...]]
+    database_name: str
+        任务表所在的数据库，为 database.DATABASE_CONFIGS 中的数据库名称，为 None 时使用 database.DEFAULT_DATABASE
+
+    返回值
+    -------
+    int
+        新增的任务数量，已有的任务不变
+    """
+
+    task_queue = lease_queue.LeaseQueue(database.DATABASE_CONFIGS[database_name or database.DEFAULT_DATABASE])
+    try:
+        return task_queue.seed(download_list)
+    finally:
+        task_queue.close()
+
+
+def run_crawl_worker(database_name=None, concurrency=downloader.DEFAULT_CONCURRENCY,
+                     parse_workers=downloader.DEFAULT_PARSE_WORKERS, claim_size=lease_queue.DEFAULT_CLAIM_SIZE):
+    """ 作为工作节点下载任务表中的任务，可在多个主机上同时运行多个进程
+
+    每次领取 claim_size 个任务，通过 downloader 的流水线下载、解析并保存至同一数据库，
+    每个任务的数据提交后再将其记为完成，工作节点中断时未完成的任务在租约过期后由其他工作节点重新领取；
+    全部任务完成（或失败次数达到上限）后退出，其他工作节点的任务尚未完成时等待，以便接手其中断的任务
+
+    参数
+    ----------
+    database_name: str
+        任务表及数据所在的数据库，为 database.DATABASE_CONFIGS 中的数据库名称，为 None 时使用 database.DEFAULT_DATABASE
+    concurrency: int
+        同时进行的下载任务数量上限
+    parse_workers: int
+        解析进程数量，为 0 时在下载线程中解析
+    claim_size: int
+        每次领取的任务数量
+
+    返回值
+    -------
+    problem_list: list
+        全部工作节点失败的任务，列表格式为：["公司代码 报表类型", ...]
+    """
+
+    database_name = database_name or database.DEFAULT_DATABASE
+    task_queue = lease_queue.LeaseQueue(database.DATABASE_CONFIGS[database_name])
+    writer = database.get_writer(database_name)
+    task_queue.start_heartbeat()
+    try:
+        while True:
+            claimed = task_queue.claim(claim_size)
+            if not claimed:
+                if not task_queue.has_unfinished():
+                    break
+                time.sleep(lease_queue.IDLE_SECONDS)
+                continue
+
+            def handle_result(com_code, statement_type_code, result):
+                """ 保存数据，提交后再记为完成（每个任务单独提交，SQLite 数据库的写锁不会长时间占用） """
+                sava_data_to_database(result, writer)
+                writer.flush()
+                task_queue.complete(com_code, statement_type_code)
+
+            def handle_error(com_code, statement_type_code, error):
+                """ 记录失败原因，尝试次数未达上限的任务由工作节点重新领取 """
+                task_queue.complete(com_code, statement_type_code, lease_queue.FAILED, repr(error))
+
+            for com_code, statement_type_code in claimed:
+                if statement_type_code not in SINA_PARSERS:
+                    task_queue.complete(com_code, statement_type_code, lease_queue.SKIPPED, "不支持的报表类型")
+            downloader.run_download(build_SINA_download_tasks(claimed), handle_result, concurrency, handle_error, parse_workers)
+    finally:
+        # 正常退出或出错时，未完成的任务立即交还，不必等待租约过期
+        task_queue.release()
+        problem_list = [item[0] for item in task_queue.failed_tasks()]
+        task_queue.close()
+
+    return problem_list
+
 
+# 清单下载时读取的待下载数据清单文件
+DOWNLOAD_LIST_FILE = 'download_list.txt'
 
-def download_listed_companies_data():
+
+def read_download_list(path=DOWNLOAD_LIST_FILE):
+    """ 读取待下载数据的清单文件，每行为“公司代码 报表类型”，以 # 开头的行为注释
+
+    参数
+    ----------
+    path: str
+        清单文件路径
+
+    返回值
+    -------
+    download_list: list
+        待下载数据的列表，列表格式为：[["公司代码", "报表类型"], [...]]
+    """
+
+    download_list = []
+    with open(path, "r") as filetxt:
+        for line in filetxt.readlines():
+            if line[0] == '#' or not line.strip():
+                continue
+            # 去除字符串末尾的 ‘\n’，并按 ‘ ’ 将字符串切分成 list， 然后追加至 download_list 列表中
+            download_list.append(line.strip('\n').split(' '))
+
+    return download_list
+
+
+def download_listed_companies_data(concurrency=downloader.DEFAULT_CONCURRENCY, bulk_load=False, offline=False, incremental=False, resume=False, update_panel=False,
+                                   parse_workers=downloader.DEFAULT_PARSE_WORKERS, distributed=False, download_type=None, download_range=None, download_list=None):
     """ 调用函数从股票网站下载上市公司数据
 
     根据提供的 download_list 参数，选择不同的爬虫函数从股票网站下载上市公司数据，并将清理格式后的数据存入数据库，
     同时将下载失败或保存失败的数据存入 problem_list.txt 文档中
 
+    全局下载及清单下载通过 downloader 模块的流水线并发下载、解析及保存，对各站点的请求速率由 downloader.HOST_RATE_LIMITS 控制，
+    解析结果在单个写入线程中保存，各任务的结果即时记入下载进度日志（journal.JOURNAL_FILE），程序中断后可续传
+
     参数
     -------
-    无
+    concurrency: int
+        全局下载及清单下载时同时进行的下载任务数量上限
+    bulk_load: bool
+        是否用 database.BulkLoader 批量导入财务报表数据，适用于首次导入全部历史数据
+    offline: bool
+        是否离线重放：全局下载及清单下载只使用缓存的原始内容重新解析数据，不访问网站
+    incremental: bool
+        是否增量下载：财务报表只保存不早于数据库中已保存的最新报告日期的记录
+    resume: bool
+        是否续传：跳过下载进度日志中已完成的任务，重试失败次数未达 journal.MAX_ATTEMPTS 的任务
+    update_panel: bool
+        是否在数据保存完毕后，将新增或更新的财务数据写入本地的财务数据立方体（panel.PANEL_DIR），计算单季、TTM、同比、环比数据，并重新计算财务比率、更新筛选索引
+    parse_workers: int
+        全局下载及清单下载时的解析进程数量，为 0 时在下载线程中解析
+    distributed: bool
+        是否分布式下载：全局下载及清单下载的任务写入数据库中的任务表，本机作为工作节点之一下载（其他主机运行 run_crawl_worker()），
+        失败的任务从任务表中汇总全部工作节点的结果；不支持离线重放、批量导入、增量下载及续传
+    download_type: str
+        下载方式：'1' - 全局下载，'2' - 清单下载，'3' - 手工下载；为 None 时提示用户选择
+    download_range: str
+        全局下载的范围，为 registry.BOARDS 中的板块代码；为 None 时提示用户选择
+    download_list: list
+        清单下载的待下载数据列表，列表格式为：[["公司代码", "报表类型"], [...]]；为 None 时读取 DOWNLOAD_LIST_FILE
+
+    返回值
     -------
-    无
+    problem_list: list
+        下载或保存失败的任务，列表格式为：["公司代码 报表类型", ...]；下载范围不受支持时为 None
 
     """
 
+    # 共用的长连接写入器（database.DEFAULT_DATABASE 数据库）
+    writer = database.get_writer(database.DEFAULT_DATABASE)
+    # 批量导入财务报表数据的导入器
+    bulk_loader = database.BulkLoader() if bulk_load else None
+    # 增量下载时各公司各报表已保存的最新报告日期
+    watermarks = database.load_watermarks(database.DATABASE_CONFIGS[database.DEFAULT_DATABASE]) if incremental else None
+
+    # 下载进度日志，续传时读取已有的进度
+    task_states = journal.load_journal() if resume else {}
+    progress_journal = journal.Journal(resume=resume)
+    # 各阶段的耗时、记录数等指标写入事件日志
+    metrics.start_run()
+
+    # 数据已暂存至批量导入器、尚未导入的任务，导入后才记为完成
+    bulk_tasks = []
+    # 批量导入失败的任务（不含导入时正在处理的任务，该任务由流水线记为失败）
+    bulk_problems = []
+
+    def finish_bulk_tasks(status, reason=''):
+        """ 记录数据已暂存至批量导入器的任务的结果 """
+        for com_code, statement_type_code in bulk_tasks:
+            progress_journal.record(com_code, statement_type_code, status, reason)
+            if status == journal.FAILED:
+                bulk_problems.append(com_code + ' ' + statement_type_code)
+        bulk_tasks.clear()
+
+    def handle_result(com_code, statement_type_code, result):
+        """ 处理解析完毕的数据，数据提交后记录任务完成（在流水线的写入线程中调用）
+
+        每个任务的数据写入后即提交，与 run_crawl_worker() 相同：单个写入线程内的提交不阻塞下载及解析，
+        任务的结果与已提交的数据一致；写入或提交失败时抛出异常，由流水线调用 handle_error() 记为失败
+        """
+        # 增量下载时只保留新增报告期的记录，与其他数据一样按主键更新写入（批量导入时由导入器导入）
+        if watermarks is not None and result[0] in database.FINANCIAL_TABLE_TYPES:
+            with metrics.stage('clean', 'watermark', com_code=com_code, statement_type_code=statement_type_code) as event:
+                result = database.filter_new_records(result, watermarks)
+                event['rows'] = len(result[1])
+        if bulk_loader is not None and result[0] in database.FINANCIAL_TABLE_TYPES:
+            try:
+                bulk_loader.add(result)
+            except Exception as error:
+                # 导入失败时，丢弃已暂存的数据，暂存了数据的任务均记为失败
+                bulk_loader.rows = []
+                finish_bulk_tasks(journal.FAILED, repr(error))
+                raise
+            bulk_tasks.append((com_code, statement_type_code))
+            # 暂存的记录达到 batch_size 条时，导入器导入全部暂存的数据（含本任务的数据）
+            if not bulk_loader.rows:
+                finish_bulk_tasks(journal.DONE)
+            return
+        sava_data_to_database(result, writer)
+        writer.flush()
+        progress_journal.record(com_code, statement_type_code, journal.DONE)
+
+    def handle_error(com_code, statement_type_code, error):
+        """ 记录任务失败及原因 """
+        progress_journal.record(com_code, statement_type_code, journal.FAILED, repr(error))
+
+    def run_tasks(download_list):
+        """ 下载（或离线重放）并处理 download_list 中的任务，返回失败的任务 """
+        if distributed:
+            seed_crawl_tasks(download_list)
+            return run_crawl_worker(concurrency=concurrency, parse_workers=parse_workers)
+        exhausted_list = []
+        if resume:
+            download_list, exhausted_list = journal.filter_resume_tasks(download_list, task_states)
+        for com_code, statement_type_code in download_list:
+            if statement_type_code not in SINA_PARSERS:
+                progress_journal.record(com_code, statement_type_code, journal.SKIPPED, "不支持的报表类型")
+        task_list = build_SINA_download_tasks(download_list)
+        if offline:
+            return exhausted_list + downloader.replay_tasks(task_list, handle_result, handle_error, parse_workers)
+        return exhausted_list + downloader.run_download(task_list, handle_result, concurrency, handle_error, parse_workers)
+
     ''' 启动下载时，用户选择下载方式 '''
-    download_type = input("下载方式：\n 1 - 全局下载\n 2 - 清单下载\n 3 - 手工下载\n 请输入下载数据的方式：")
+    if download_type is None:
+        download_type = input("下载方式：\n 1 - 全局下载\n 2 - 清单下载\n 3 - 手工下载\n 请输入下载数据的方式：")
 
-    # 用于保存待下载数据的公司的公司代码的 list
-    download_list = []
     # 用于保存数据下载失败的公司的公司代码和报表类型的 list
     problem_list = []
 
-    ''' 获取不存在的公司代码清单 '''
-    not_exist_list = []
-    with open("not_exist_list.txt", "r") as filetxt:
-        for line in filetxt.readlines():
-            # 去除字符串末尾的 ‘\n’，并追加至 not_exist_list 列表中
-            not_exist_list.append(line.strip('\n'))
+    ''' 读取公司代码登记簿，用于跳过不存在的公司代码 '''
+    company_registry = registry.load_registry()
 
 
     ''' 根据选择的下载方式下载数据 '''
     # 全局下载
     if download_type == '1':
-        download_range = input("下载范围：\n 1 - 创业板\n 2 - 科创板\n 请输入下载数据的范围：")
+        if download_range is None:
+            download_range = input("下载范围：\n" + ''.join(' ' + board_code + ' - ' + board[0] + '\n' for board_code, board in registry.BOARDS.items()) + " 请输入下载数据的范围：")
 
-        # 生成待下载的公司代码清单
-        if download_range == '1':
-            for com_code in range(300001, 300999):
-                if str(com_code) in not_exist_list:
-                    continue
-                download_list.append(str(com_code))
-        elif download_range == '2':
-            for com_code in range(688001, 688999):
-                if str(com_code) in not_exist_list:
-                    continue
-                download_list.append(str(com_code))
-        else:
+        # 生成待下载的公司代码清单：检查未登记或状态已过期的公司代码，只下载存在的公司
+        if download_range not in registry.BOARDS:
             print("暂不支持的数据范围！")
             return
+        board_codes = registry.get_board_codes(download_range)
+        registry.refresh_registry(company_registry, board_codes, concurrency)
+        download_list = registry.get_listed_codes(company_registry, board_codes)
         
         # 生成待下载的报表类型清单
         statement_type = ['1','2','3','4','5']
         
-        # 下载并保存数据
-        for com_code in download_list:
-            for statement_type_code in statement_type:
-                # 根据待下载的数据类型调用函数
-                try:
-                    if statement_type_code == '4':
-                        #sava_data_to_database(get_corporation_information_from_SINA(com_code, statement_type_code))
-                        print(get_corporation_information_from_SINA(com_code, statement_type_code))
-                    elif statement_type_code == '5':
-                        #sava_data_to_database(get_issue_information_from_SINA(com_code, statement_type_code))
-                        print(get_issue_information_from_SINA(com_code, statement_type_code))
-                    else:
-                        #sava_data_to_database(get_financial_data_from_SINA(com_code, statement_type_code))
-                        print(get_financial_data_from_SINA(com_code, statement_type_code))
-                except:
-                    problem_list.append(com_code + ' ' + statement_type_code) 
-                # 等待 2 秒
-                time.sleep(2) 
-                # 清除屏幕信息
-                os.system('cls')
+        # 并发下载并保存数据
+        problem_list += run_tasks(
+            [[com_code, statement_type_code] for com_code in download_list for statement_type_code in statement_type])
 
     # 清单下载
     elif download_type == '2':
         # 获取待下载数据的公司代码清单
-        with open("download_list.txt", "r") as filetxt:
-            for line in filetxt.readlines():
-                if line[0] == '#':
-                    continue
-                # 去除字符串末尾的 ‘\n’，并按 ‘ ’ 将字符串切分成 list， 然后追加至 download_list 列表中
-                download_list.append(line.strip('\n').split(' '))
+        if download_list is None:
+            download_list = read_download_list()
         
-        # 下载并保存数据
+        # 检查待下载数据的公司是否存在，如该公司代码在登记簿中确认不存在，则跳过
         for item in download_list:
-            # 检查待下载数据的公司是否存在，如该公司代码在 not_exist_list 中，则跳过
-            if item[0] in not_exist_list:
-                continue
-            # 根据待下载的数据类型调用函数
-            try:
-                if item[1] == '4':
-                    #sava_data_to_database(get_corporation_information_from_SINA(item[0], item[1]))
-                    print(get_corporation_information_from_SINA(item[0], item[1]))
-                elif item[1] == '5':
-                    #sava_data_to_database(get_issue_information_from_SINA(item[0], item[1]))
-                    print(get_issue_information_from_SINA(item[0], item[1]))
-                else:
-                    #sava_data_to_database(get_financial_data_from_SINA(item[0], item[1]))
-                    print(get_financial_data_from_SINA(item[0], item[1]))
-            except:
-                problem_list.append(item[0] + ' ' + item[1]) 
-            # 等待 2 秒
-            time.sleep(10) 
-            # 清除屏幕信息
-            os.system('cls')
+            if registry.is_missing(company_registry, item[0]):
+                progress_journal.record(item[0], item[1], journal.SKIPPED, "公司代码不存在")
+        download_list = [item for item in download_list if not registry.is_missing(company_registry, item[0])]
+        # 并发下载并保存数据
+        problem_list += run_tasks(download_list)
     
     # 手工下载
     elif download_type == '3':
@@ -925,9 +1242,32 @@ def download_listed_companies_data():
             if is_continue == 'n' or is_continue == 'N':
                 continue_or_not = False
 
-            os.system('cls')
+            clear_screen()
     
+    # 提交尚未提交的数据，批量导入器导入剩余数据后，记录暂存了数据的任务的结果
+    if bulk_loader is not None:
+        try:
+            bulk_loader.close()
+        except Exception as error:
+            finish_bulk_tasks(journal.FAILED, repr(error))
+        else:
+            finish_bulk_tasks(journal.DONE)
+        problem_list += bulk_problems
+    database.close_writers()
+    progress_journal.close()
+    # 输出 Prometheus 指标文件，并打印各阶段的耗时汇总
+    metrics.finish_run()
+
+    # 更新财务数据立方体、派生数据、财务比率及筛选索引
+    if update_panel:
+        panel.refresh_panel()
+        quarterly.refresh_quarterly()
+        ratios.refresh_ratios()
+        screening.refresh_indexes()
+
     ''' 保存数据下载失败的公司的公司代码和报表类型 '''
     with open("problem_list.txt", 'w') as filetxt:
         for item in problem_list:
-            filetxt.write(item + '\n')
\ No newline at end of file
+            filetxt.write(item + '\n')
+
+    return problem_list